@@ -1,15 +1,29 @@
-from .embedders import EmbedderManager
-from .generators import ImageGenerator
-from .query import QueryManager
+"""Process-wide service singletons, each created the first time it is used.
 
-embedder_manager: EmbedderManager = EmbedderManager.instance()
-query_manager: QueryManager = QueryManager.instance()
+Indexing worker processes import ``core`` for the embedders alone. Building
+every manager on import would have them load the generators and the query
+store, and run the database migrations, for nothing.
+"""
 
-image_generator: ImageGenerator = ImageGenerator.instance()
+from importlib import import_module
 
-# Imported after the others so it can lazily reference them.
-from .setup import SetupManager
+_SINGLETONS = {
+    "embedder_manager": (".embedders", "EmbedderManager"),
+    "query_manager": (".query", "QueryManager"),
+    "thread_budget": (".threads", "ThreadBudget"),
+    "image_generator": (".generators", "ImageGenerator"),
+    "setup_manager": (".setup", "SetupManager"),
+}
 
-setup_manager: SetupManager = SetupManager.instance()
 
-__all__ = ["embedder_manager", "query_manager", "image_generator", "setup_manager"]
+def __getattr__(name):
+    try:
+        module, cls = _SINGLETONS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    instance = getattr(import_module(module, __name__), cls).instance()
+    globals()[name] = instance
+    return instance
+
+
+__all__ = list(_SINGLETONS)
@@ -14,3 +14,40 @@ class ImageGeneratorConnector:
         response = requests.post(f"{self.base_url}/generate", json=generation_config)
         response.raise_for_status()
         return response.json()
+
+
+class EmbeddingWorkerConnector:
+    """Client for a Needle Embedder service (see ``embedder-service/``).
+
+    Tensors travel as ``.npy`` bytes in both directions: a preprocessed
+    float32 ``[N, 3, H, W]`` batch goes out, a float32 ``[N, D]`` matrix
+    comes back.
+    """
+
+    NPY_MEDIA_TYPE = "application/x-npy"
+
+    def __init__(self, base_url, timeout=300):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def capabilities(self):
+        response = requests.get(f"{self.base_url}/capabilities", timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    def embed(self, model_name, batch):
+        import io
+
+        import numpy as np
+
+        buf = io.BytesIO()
+        np.save(buf, np.ascontiguousarray(batch, dtype=np.float32), allow_pickle=False)
+        response = requests.post(
+            f"{self.base_url}/embed",
+            params={"model": model_name},
+            data=buf.getvalue(),
+            headers={"Content-Type": self.NPY_MEDIA_TYPE},
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        return np.load(io.BytesIO(response.content), allow_pickle=False)
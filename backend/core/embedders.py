@@ -3,6 +3,7 @@ import platform
 import torch
 import torch.nn as nn
 from core.singleton import Singleton
+from core.inference import PRIORITY_QUERY, InferenceServer
 from monitoring import logger
 from settings import settings
 from timm import create_model, data
@@ -29,6 +30,8 @@ class ImageEmbedder:
         # Use the unwrapped model for configuration
         self.preprocess = self.get_preprocess()
         self._embedding_dim = self._determine_embedding_dim()
+        # Every forward pass after this goes through the server's loop.
+        self.server = InferenceServer(self)
 
     def get_preprocess(self):
         # Unwrap the model if wrapped in DataParallel
@@ -39,11 +42,17 @@ class ImageEmbedder:
     def embed(self, img_binary):
         # Preprocess the image and add batch dimension.
         img_tensor = self.preprocess(img_binary)
-        img_tensor = img_tensor.unsqueeze(0).to(self.device)
-        with torch.no_grad():
-            # DataParallel will split the batch across GPUs.
-            embedding = self.model(img_tensor).squeeze(0).cpu().numpy()
-        return embedding
+        img_tensor = img_tensor.unsqueeze(0)
+        # Only called for queries, which go ahead of indexing work.
+        return self.server.run(img_tensor, priority=PRIORITY_QUERY)[0]
+
+    def embed_batch(self, images):
+        """Embed several query images with one request to the inference server."""
+        batch = torch.stack([self.preprocess(img) for img in images])
+        return self.server.run(batch, priority=PRIORITY_QUERY)
+
+    def close(self):
+        self.server.close()
 
     def _determine_embedding_dim(self):
         # Unwrap the model to get the proper configuration.
@@ -59,6 +68,14 @@ class ImageEmbedder:
             embedding = self.model(dummy_input).squeeze(0).cpu().numpy()
         return embedding.shape[0]
 
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def model_name(self):
+        return self._model_name
+
     @property
     def embedding_dim(self):
         return self._embedding_dim
@@ -111,14 +128,18 @@ class EmbedderManager:
                 weight=cfg.weight if cfg.weight is not None else 1 / total,
                 device=device,
             )
-        self._image_embedders = embedders
+        previous, self._image_embedders = self._image_embedders, embedders
         self._loaded = True
+        for embedder in previous.values():
+            embedder.close()
         logger.info(f"Loaded {total} embedder(s) on {device}")
         return self._image_embedders
 
     def unload(self):
-        self._image_embedders = {}
+        previous, self._image_embedders = self._image_embedders, {}
         self._loaded = False
+        for embedder in previous.values():
+            embedder.close()
 
     def get_image_embedders(self):
         return self._image_embedders
@@ -2,7 +2,7 @@
 
 import base64
 from io import BytesIO
-from typing import Dict, List
+from typing import Dict, Iterator, List
 
 import requests
 from PIL import Image
@@ -40,13 +40,17 @@ class OpenAIEngine(GenerationEngine):
     def generate(
         self, prompt: str, num_images: int, image_size, params: Dict
     ) -> List[Image.Image]:
+        return list(self.generate_iter(prompt, num_images, image_size, params))
+
+    def generate_iter(
+        self, prompt: str, num_images: int, image_size, params: Dict
+    ) -> Iterator[Image.Image]:
         api_key = self._api_key(params)
         if not api_key:
             raise RuntimeError("OpenAI API key not provided")
         model = params.get("model", "dall-e-3")
         size = params.get("size", "1024x1024")
 
-        images: List[Image.Image] = []
         headers = {"Authorization": f"Bearer {api_key}"}
         for _ in range(max(1, int(num_images))):
             payload = {"model": model, "prompt": prompt, "n": 1, "size": size}
@@ -57,10 +61,9 @@ class OpenAIEngine(GenerationEngine):
             resp.raise_for_status()
             item = resp.json()["data"][0]
             if item.get("b64_json"):
-                images.append(_decode_b64(item["b64_json"]))
+                yield _decode_b64(item["b64_json"])
             elif item.get("url"):
-                images.append(_download(item["url"]))
-        return images
+                yield _download(item["url"])
 
 
 class StabilityEngine(GenerationEngine):
@@ -80,12 +83,16 @@ class StabilityEngine(GenerationEngine):
     def generate(
         self, prompt: str, num_images: int, image_size, params: Dict
     ) -> List[Image.Image]:
+        return list(self.generate_iter(prompt, num_images, image_size, params))
+
+    def generate_iter(
+        self, prompt: str, num_images: int, image_size, params: Dict
+    ) -> Iterator[Image.Image]:
         api_key = self._api_key(params)
         if not api_key:
             raise RuntimeError("Stability API key not provided")
         headers = {"authorization": f"Bearer {api_key}", "accept": "image/*"}
 
-        images: List[Image.Image] = []
         for _ in range(max(1, int(num_images))):
             resp = requests.post(
                 self._ENDPOINT,
@@ -95,5 +102,4 @@ class StabilityEngine(GenerationEngine):
                 timeout=180,
             )
             resp.raise_for_status()
-            images.append(Image.open(BytesIO(resp.content)).convert("RGB"))
-        return images
+            yield Image.open(BytesIO(resp.content)).convert("RGB")
@@ -1,7 +1,7 @@
 """Base types for text-to-image generation engines."""
 
 from abc import ABC, abstractmethod
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple
 
 from PIL import Image
 
@@ -45,6 +45,34 @@ class GenerationEngine(ABC):
     ) -> List[Image.Image]:
         """Generate ``num_images`` images for ``prompt`` and return PIL images."""
 
+    def generate_iter(
+        self,
+        prompt: str,
+        num_images: int,
+        image_size,
+        params: Dict,
+    ) -> Iterator[Image.Image]:
+        """Like ``generate``, but yield each image as soon as it exists.
+
+        Engines that produce images one request or one batch at a time override
+        this so callers can start on the first image while the rest render.
+        """
+        yield from self.generate(prompt, num_images, image_size, params)
+
+    def generate_many(
+        self,
+        prompts: List[str],
+        num_images: int,
+        image_size,
+        params: Dict,
+    ) -> Iterator[List[Image.Image]]:
+        """Yield ``num_images`` images for each of ``prompts``, in order.
+
+        Engines that can take several prompts in one call override this.
+        """
+        for prompt in prompts:
+            yield self.generate(prompt, num_images, image_size, params)
+
     def info(self, credentials_set: bool) -> Dict:
         return {
             "name": self.name,
@@ -0,0 +1,313 @@
+"""On-disk cache of generated query images and their query embeddings.
+
+Generation is most of the cost of a search, and every new query started from
+nothing, even for a prompt searched five minutes (or one restart) earlier.
+Searches now keep what they generate here and use it again:
+
+* images, stored by a hash of their pixels as lossless PNG, so an image read
+  back hashes the same as when it was made;
+* for each generation request (normalized prompt, engine, size and the
+  model, steps and seed params), the hashes of the images it produced, in
+  order;
+* each image's query embedding per embedder model.
+
+A repeated prompt gets its images and embeddings from disk and skips both
+diffusion and the embedders. A request for more images than are stored gets
+the stored ones plus newly generated ones, except with a seed: a seed fixes
+the whole set, so that set is generated again.
+
+The cache is capped at ``generator.cache_size_mb``. Once over the cap, the
+least recently used images are dropped together with their embeddings, and
+so is every request whose first image went with them; a hit refreshes the
+files' modification times, which is what LRU goes by. Stored queries
+hard-link the images they keep (see ``core.query``), so eviction only drops
+the cache's own name for them.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from core.singleton import Singleton
+from monitoring import logger
+from settings import settings
+
+# Engine params that change what gets generated; credentials and the like
+# are left out of the key.
+_KEY_PARAMS = ("model", "steps", "seed", "width", "height", "size")
+# Eviction goes down to this share of the cap, so it does not run per write.
+_EVICT_TO = 0.9
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(str(prompt).lower().split())
+
+
+def image_digest(image: Image.Image) -> str:
+    """Hash of an image's pixels (not of any encoding of them)."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{image.mode}:{image.width}x{image.height}:".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def _short_hash(value: str) -> str:
+    return hashlib.blake2b(value.encode(), digest_size=6).hexdigest()
+
+
+@Singleton
+class GenerationCache:
+    def __init__(self):
+        self._root = Path(settings.storage.data_dir, "generation_cache")
+        self._lock = threading.Lock()
+        # Serializes read-modify-write of entry files.
+        self._entries_lock = threading.Lock()
+        # Bytes of images, embeddings and entries on disk, counted on first use.
+        self._bytes: Optional[int] = None
+        self._hits = 0
+        self._misses = 0
+        self._embedding_hits = 0
+        self._embedding_misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.generators.cache_size_mb > 0
+
+    @property
+    def _cap(self) -> int:
+        return settings.generators.cache_size_mb * 1024 * 1024
+
+    # -- keys and paths ---------------------------------------------------
+    @staticmethod
+    def key(prompt: str, engine: str, image_size, params: Dict) -> str:
+        material = {
+            "prompt": normalize_prompt(prompt),
+            "engine": engine,
+            "image_size": image_size,
+            "params": {p: params.get(p) for p in _KEY_PARAMS if params.get(p) not in (None, "")},
+        }
+        encoded = json.dumps(material, sort_keys=True, default=str).encode()
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+    @staticmethod
+    def seeded(params: Dict) -> bool:
+        return params.get("seed") not in (None, "", -1)
+
+    def _entry_path(self, key: str) -> Path:
+        return self._root / "entries" / key[:2] / f"{key}.json"
+
+    def _image_path(self, digest: str) -> Path:
+        return self._root / "images" / digest[:2] / f"{digest}.png"
+
+    def _embedding_path(self, digest: str, model_name: str) -> Path:
+        return self._root / "embeddings" / digest[:2] / f"{digest}_{_short_hash(model_name)}.npy"
+
+    # -- images -----------------------------------------------------------
+    def images(self, key: str, count: int) -> List[Image.Image]:
+        """Up to ``count`` stored images for ``key``, in generation order.
+
+        Stops at the first image that has been evicted.
+        """
+        try:
+            digests = json.loads(self._entry_path(key).read_text())["digests"]
+        except (OSError, ValueError, KeyError):
+            self._count(hit=False)
+            return []
+        images = []
+        for digest in digests[:count]:
+            image = self.image(digest)
+            if image is None:
+                break
+            images.append(image)
+        self._count(hit=bool(images))
+        return images
+
+    def image(self, digest: str) -> Optional[Image.Image]:
+        """The stored image with ``digest``, or None if it is not (or no longer) here."""
+        path = self._image_path(digest)
+        try:
+            with Image.open(path) as stored:
+                image = stored.convert("RGB")
+            os.utime(path)
+        except OSError:
+            return None
+        return image
+
+    def link(self, image: Image.Image, target: Path) -> bool:
+        """Hard-link the stored copy of ``image`` to ``target``.
+
+        The link costs no space and keeps the file alive after the cache
+        evicts its own name. Returns False when the image is not stored here
+        or the filesystem cannot link; the caller then writes its own copy.
+        """
+        if not self.enabled:
+            return False
+        try:
+            os.link(self._image_path(image_digest(image)), target)
+        except OSError:
+            return False
+        return True
+
+    def _store(self, image: Image.Image) -> str:
+        digest = image_digest(image)
+        path = self._image_path(digest)
+        if path.is_file():
+            os.utime(path)
+        else:
+            self._write(path, lambda f: image.save(f, "PNG", compress_level=1))
+        return digest
+
+    def put_image(self, key: str, position: int, image: Image.Image):
+        """Store ``image`` as image ``position`` of ``key``; failures are logged."""
+        try:
+            digest = self._store(image)
+            with self._entries_lock:
+                entry = self._entry_path(key)
+                try:
+                    digests = json.loads(entry.read_text())["digests"]
+                except (OSError, ValueError, KeyError):
+                    digests = []
+                digests[position:position + 1] = [digest]
+                self._write(entry, lambda f: f.write(json.dumps({"digests": digests}).encode()))
+            self._evict()
+        except Exception as exc:
+            logger.warning(f"Could not cache generated image: {exc}")
+
+    # -- embeddings -------------------------------------------------------
+    def embedding(self, digest: str, model_name: str) -> Optional[np.ndarray]:
+        path = self._embedding_path(digest, model_name)
+        try:
+            vector = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self._embedding_misses += 1
+            return None
+        with self._lock:
+            self._embedding_hits += 1
+        return vector
+
+    def put_embedding(self, digest: str, model_name: str, vector):
+        try:
+            self._write(self._embedding_path(digest, model_name),
+                        lambda f: np.save(f, np.asarray(vector, dtype=np.float32)))
+            self._evict()
+        except Exception as exc:
+            logger.warning(f"Could not cache query embedding: {exc}")
+
+    # -- housekeeping -----------------------------------------------------
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def _write(self, target: Path, write):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed, so a reader never sees a partial file.
+        fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            previous = target.stat().st_size if target.exists() else 0
+            os.replace(tmp, target)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += target.stat().st_size - previous
+
+    def _files(self) -> Dict[str, List[Tuple[Path, os.stat_result]]]:
+        """Image and embedding files grouped by image digest."""
+        groups: Dict[str, List[Tuple[Path, os.stat_result]]] = {}
+        for kind in ("images", "embeddings"):
+            for path in (self._root / kind).glob("*/*"):
+                if path.suffix == ".tmp":
+                    continue
+                try:
+                    groups.setdefault(path.stem.split("_")[0], []).append((path, path.stat()))
+                except OSError:
+                    continue
+        return groups
+
+    def _entry_bytes(self) -> int:
+        total = 0
+        for path in (self._root / "entries").glob("*/*.json"):
+            try:
+                total += path.stat().st_size
+            except OSError:
+                continue
+        return total
+
+    def _evict(self):
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = (sum(st.st_size for files in self._files().values() for _, st in files)
+                               + self._entry_bytes())
+            if self._bytes <= self._cap:
+                return
+            groups = self._files()
+            # Oldest last use first; a group's last use is its newest file.
+            order = sorted(groups, key=lambda d: max(st.st_mtime for _, st in groups[d]))
+            target = self._cap * _EVICT_TO
+            evicted = set()
+            for digest in order:
+                if self._bytes <= target:
+                    break
+                evicted.add(digest)
+                for path, st in groups[digest]:
+                    try:
+                        path.unlink()
+                        self._bytes -= st.st_size
+                    except OSError:
+                        pass
+        # Outside ``_lock``: ``put_image`` takes the two locks the other way round.
+        self._drop_entries(evicted)
+        logger.info(f"Generation cache trimmed to {self._bytes // (1024 * 1024)} MB")
+
+    def _drop_entries(self, evicted: set):
+        """Remove the entries whose first image was evicted; a lookup stops at
+        the first missing image, so they could never be hits again."""
+        freed = 0
+        with self._entries_lock:
+            for path in (self._root / "entries").glob("*/*.json"):
+                try:
+                    digests = json.loads(path.read_text()).get("digests") or []
+                    if digests and digests[0] not in evicted and self._image_path(digests[0]).is_file():
+                        continue
+                    size = path.stat().st_size
+                    path.unlink()
+                    freed += size
+                except (OSError, ValueError, AttributeError):
+                    continue
+        with self._lock:
+            self._bytes -= freed
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            embedding_lookups = self._embedding_hits + self._embedding_misses
+            return {
+                "enabled": self.enabled,
+                "bytes": self._bytes,
+                "cap_bytes": self._cap,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+                "embedding_hits": self._embedding_hits,
+                "embedding_misses": self._embedding_misses,
+                "embedding_hit_rate": (round(self._embedding_hits / embedding_lookups, 4)
+                                       if embedding_lookups else None),
+            }
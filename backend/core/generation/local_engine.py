@@ -13,13 +13,15 @@ Face hub with byte-level progress so the UI can show a real progress bar.
 import io
 import threading
 import time
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple, Union
 
 from PIL import Image
 
 from core.download_progress import format_eta, track_downloads
 from core.generation.base import GenerationEngine, resolve_size
+from core.threads import GENERATION, ThreadBudget
 from monitoring import logger
+from settings import settings
 
 # Only distilled, few-step models are listed: they render an image in 1-4
 # denoising steps instead of the usual 25-50, which is what makes local
@@ -352,8 +354,56 @@ class LocalDiffusionEngine(GenerationEngine):
         images, _ = self.generate_detailed(prompt, num_images, image_size, params)
         return images
 
+    def generate_iter(
+        self,
+        prompt: str,
+        num_images: int,
+        image_size,
+        params: Dict,
+    ) -> Iterator[Image.Image]:
+        chunk = int(settings.generators.local_chunk_size)
+        if chunk <= 0:
+            chunk = max(1, int(num_images))
+        for images, _ in self._generate_chunks(prompt, num_images, image_size, params, chunk):
+            yield from images
+
     def generate_detailed(self, prompt: str, num_images: int, image_size, params: Dict):
         """Same as ``generate`` but also returns timing/seed metadata."""
+        num_images = max(1, int(num_images))
+        return next(self._generate_chunks(prompt, num_images, image_size, params, num_images))
+
+    def _generate_chunks(
+        self, prompt: str, num_images: int, image_size, params: Dict, chunk_size: int
+    ) -> Iterator[Tuple[List[Image.Image], Dict]]:
+        """Run the pipeline ``chunk_size`` images at a time, yielding each chunk
+        with its metadata. One chunk of everything is the fastest way to get
+        all the images; smaller chunks get the first ones out sooner."""
+        num_images = max(1, int(num_images))
+        counts = [min(chunk_size, num_images - done) for done in range(0, num_images, chunk_size)]
+        return self._run([(prompt, count) for count in counts], image_size, params)
+
+    def generate_many(
+        self, prompts: List[str], num_images: int, image_size, params: Dict
+    ) -> Iterator[List[Image.Image]]:
+        """Pass several prompts to each pipeline call, up to
+        ``generator.local_batch_images`` images per call.
+
+        With a seed, the prompts of a call share one generator, so a prompt's
+        images depend on its place in the batch."""
+        num_images = max(1, int(num_images))
+        per_call = max(1, int(settings.generators.local_batch_images) // num_images)
+        calls = [(prompts[i:i + per_call], num_images) for i in range(0, len(prompts), per_call)]
+        for images, _ in self._run(calls, image_size, params):
+            # The pipeline returns the images of each prompt together, in
+            # prompt order.
+            for i in range(0, len(images), num_images):
+                yield images[i:i + num_images]
+
+    def _run(
+        self, calls: List[Tuple[Union[str, List[str]], int]], image_size, params: Dict
+    ) -> Iterator[Tuple[List[Image.Image], Dict]]:
+        """One pipeline call per ``(prompt or prompts, images per prompt)``,
+        yielding each call's images with its metadata."""
         torch = _torch()
         params = params or {}
         model_id = params.get("model") if params.get("model") in MODELS else DEFAULT_MODEL
@@ -364,7 +414,6 @@ class LocalDiffusionEngine(GenerationEngine):
         height = int(params.get("height") or height)
         steps = int(params.get("steps") or spec["default_steps"])
         steps = max(1, min(steps, spec["max_steps"]))
-        num_images = max(1, int(num_images))
 
         pipe = self.ensure_loaded(model_id)
 
@@ -372,43 +421,47 @@ class LocalDiffusionEngine(GenerationEngine):
         generator = None
         if seed not in (None, "", -1):
             # Seeded generation stays on the CPU: the MPS generator does not
-            # support manual seeding consistently across torch versions.
+            # support manual seeding consistently across torch versions. The
+            # one generator carries on across calls, so a seed still gives
+            # the same images for the same chunking.
             seed = int(seed)
             generator = torch.Generator("cpu").manual_seed(seed)
         else:
             seed = None
 
-        self._set_state("generating", "Generating…", model=model_id)
-        started = time.perf_counter()
-        result = pipe(
-            prompt=prompt,
-            num_inference_steps=steps,
-            guidance_scale=spec.get("guidance", 0.0),
-            width=width,
-            height=height,
-            num_images_per_prompt=num_images,
-            generator=generator,
-        )
-        elapsed_ms = int((time.perf_counter() - started) * 1000)
-        self._last_used = time.time()
-        self._set_state("ready", f"{spec['label']} ready", model=model_id)
-
-        images = [im.convert("RGB") for im in result.images]
-        meta = {
-            "model": model_id,
-            "steps": steps,
-            "width": width,
-            "height": height,
-            "seed": seed,
-            "device": self.device(),
-            "elapsed_ms": elapsed_ms,
-            "ms_per_image": int(elapsed_ms / max(1, len(images))),
-        }
-        logger.info(
-            f"[generate] {len(images)} image(s) {width}x{height} "
-            f"{model_id}/{steps} steps in {elapsed_ms}ms on {meta['device']}"
-        )
-        return images, meta
+        for prompt, count in calls:
+            self._set_state("generating", "Generating…", model=model_id)
+            started = time.perf_counter()
+            with ThreadBudget.instance().lease(GENERATION):
+                result = pipe(
+                    prompt=prompt,
+                    num_inference_steps=steps,
+                    guidance_scale=spec.get("guidance", 0.0),
+                    width=width,
+                    height=height,
+                    num_images_per_prompt=count,
+                    generator=generator,
+                )
+            elapsed_ms = int((time.perf_counter() - started) * 1000)
+            self._last_used = time.time()
+            self._set_state("ready", f"{spec['label']} ready", model=model_id)
+
+            images = [im.convert("RGB") for im in result.images]
+            meta = {
+                "model": model_id,
+                "steps": steps,
+                "width": width,
+                "height": height,
+                "seed": seed,
+                "device": self.device(),
+                "elapsed_ms": elapsed_ms,
+                "ms_per_image": int(elapsed_ms / max(1, len(images))),
+            }
+            logger.info(
+                f"[generate] {len(images)} image(s) {width}x{height} "
+                f"{model_id}/{steps} steps in {elapsed_ms}ms on {meta['device']}"
+            )
+            yield images, meta
 
     # -- catalog ----------------------------------------------------------
     def capabilities(self, params: Dict = None) -> Dict:
@@ -4,14 +4,19 @@ Maintains a registry of generation engines and routes generation requests. The
 local on-device engine is the default; API engines are used when the requested
 engine is selected and credentials are available. On failure, falls back to the
 first available engine (typically local) when ``use_fallback`` is set.
+
+``generate_iter`` yields each image as its engine produces it, so a search can
+embed the first image while the rest are still rendering. With ``cached`` it
+serves repeated requests from the on-disk generation cache.
 """
 
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple
 
 from PIL import Image
 
 from core.generation.api_engines import OpenAIEngine, StabilityEngine
 from core.generation.base import GenerationEngine
+from core.generation.cache import GenerationCache
 from core.generation.credentials import credentials_set, set_credentials
 from core.generation.local_engine import LocalDiffusionEngine
 from core.generation import preferences
@@ -104,9 +109,10 @@ class ImageGenerator:
                 return engine
         raise RuntimeError("No image generation engine is available")
 
-    def generate(self, generation_config: Dict) -> List[Tuple[Image.Image, str]]:
+    def _candidates(self, generation_config: Dict) -> Tuple[List[Tuple[GenerationEngine, Dict]], int, object]:
+        """The engines to try in order, with their configs; plus image count and size."""
         engines_cfg = generation_config.get("engines") or []
-        num_images = generation_config.get("num_images", 1)
+        num_images = max(1, int(generation_config.get("num_images", 1)))
         image_size = generation_config.get("image_size", "MEDIUM")
         fallback_prompt = generation_config.get("prompt", "")
 
@@ -135,20 +141,120 @@ class ImageGenerator:
         # Without fallback, only the first (top-priority) engine is eligible.
         if not use_fallback:
             candidates = candidates[:1]
+        return candidates, num_images, image_size
+
+    def generate(self, generation_config: Dict) -> List[Tuple[Image.Image, str]]:
+        return list(self.generate_iter(generation_config))
+
+    def generate_iter(self, generation_config: Dict, cached: bool = False
+                      ) -> Iterator[Tuple[Image.Image, str]]:
+        """Yield ``(image, engine name)`` pairs as the engines produce them.
+
+        An engine that fails part way keeps the images it already yielded; the
+        next candidate, if fallback allows one, is asked for the rest. With
+        ``cached``, images stored for the same request are used first and new
+        ones are stored.
+        """
+        candidates, num_images, image_size = self._candidates(generation_config)
+        fallback_prompt = generation_config.get("prompt", "")
 
+        produced = 0
         last_error = None
         for engine, ec in candidates:
             prompt = ec.get("prompt") or fallback_prompt
             params = ec.get("params") or {}
+            if cached and GenerationCache.instance().enabled:
+                images = self._generate_cached(engine, prompt, num_images - produced, image_size, params)
+            else:
+                images = engine.generate_iter(prompt, num_images - produced, image_size, params)
             try:
-                images = engine.generate(prompt, num_images, image_size, params)
-                return [(img, engine.name) for img in images]
+                for img in images:
+                    produced += 1
+                    yield img, engine.name
+                return
             except Exception as exc:
                 last_error = exc
                 logger.error(f"Engine '{engine.name}' failed to generate: {exc}", exc_info=True)
                 continue
 
+        if produced:
+            # The images already handed out stand; a partial set beats none.
+            logger.warning(f"Generated {produced} of {num_images} images: {last_error}")
+            return
         raise RuntimeError(
             f"Image generation failed: {last_error}" if last_error
             else "Image generation produced no images"
         )
+
+    def seeded(self, generation_config: Dict) -> bool:
+        """Whether any engine ``generation_config`` could use has a seed."""
+        candidates, _, _ = self._candidates(generation_config)
+        return any(GenerationCache.seeded(ec.get("params") or {}) for _, ec in candidates)
+
+    def generate_many(self, generation_config: Dict, prompts: List[str], cached: bool = False
+                      ) -> Iterator[Tuple[int, List[Tuple[Image.Image, str]]]]:
+        """Generate for several prompts at once, yielding ``(prompt index,
+        images)`` as each prompt's images are ready (not in prompt order).
+
+        Engines get all the prompts still missing at once, so the local engine
+        can batch them. A failing engine keeps what it yielded and the next
+        candidate gets the rest. Prompts no engine could serve raise
+        RuntimeError once everything else has been yielded.
+
+        Seeded output is read from the cache but not written to it: in a
+        batch, a prompt's images also depend on the prompts batched with it,
+        so they are not what the seed gives that prompt on its own.
+        """
+        candidates, num_images, image_size = self._candidates(generation_config)
+        cache = GenerationCache.instance()
+        cached = cached and cache.enabled
+        remaining = list(range(len(prompts)))
+        last_error = None
+        for engine, ec in candidates:
+            if not remaining:
+                break
+            params = ec.get("params") or {}
+            keys = {i: cache.key(prompts[i], engine.name, image_size, params) for i in remaining} if cached else {}
+            store = cached and not cache.seeded(params)
+            if cached:
+                for i in list(remaining):
+                    stored = cache.images(keys[i], num_images)
+                    if len(stored) == num_images:
+                        remaining.remove(i)
+                        yield i, [(img, engine.name) for img in stored]
+            pending = list(remaining)
+            try:
+                for i, images in zip(pending, engine.generate_many(
+                        [prompts[i] for i in pending], num_images, image_size, params)):
+                    if store:
+                        for position, img in enumerate(images):
+                            cache.put_image(keys[i], position, img)
+                    remaining.remove(i)
+                    yield i, [(img, engine.name) for img in images]
+            except Exception as exc:
+                last_error = exc
+                logger.error(f"Engine '{engine.name}' failed to generate: {exc}", exc_info=True)
+                continue
+
+        if remaining:
+            raise RuntimeError(
+                f"Image generation failed for {len(remaining)} prompt(s): {last_error}" if last_error
+                else "Image generation produced no images"
+            )
+
+    @staticmethod
+    def _generate_cached(engine: GenerationEngine, prompt: str, num_images: int, image_size,
+                         params: Dict) -> Iterator[Image.Image]:
+        cache = GenerationCache.instance()
+        key = cache.key(prompt, engine.name, image_size, params)
+        stored = cache.images(key, num_images)
+        if len(stored) < num_images and cache.seeded(params):
+            # A seed fixes the whole set: topping it up would repeat the
+            # first images, so the set is generated again.
+            stored = []
+        yield from stored
+        position = len(stored)
+        for img in engine.generate_iter(prompt, num_images - position, image_size, params):
+            cache.put_image(key, position, img)
+            position += 1
+            yield img
@@ -0,0 +1,78 @@
+"""Short-lived store for generated images handed out by reference.
+
+Endpoints that return generated images used to inline each one as a base64
+PNG data URL, which makes a response a third larger than the image bytes.
+The client also cannot start showing anything until the whole JSON body has
+arrived. With ``by_reference`` the encoded bytes are kept here instead, and
+the response carries a ``/images/{token}`` URL the client fetches like any
+other image.
+
+Entries expire after ``TTL_SECONDS``. The least recently stored ones are also
+dropped once the cache holds ``MAX_BYTES``, so a burst of generation cannot
+grow it without bound.
+"""
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from core.singleton import Singleton
+
+TTL_SECONDS = 600
+MAX_BYTES = 256 * 1024 * 1024
+
+
+@Singleton
+class ImageCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # token -> (bytes, media type, expiry)
+        self._entries: "OrderedDict[str, Tuple[bytes, str, float]]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def put(self, data: bytes, media_type: str) -> str:
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._entries[token] = (data, media_type, now + TTL_SECONDS)
+            self._bytes += len(data)
+            while self._bytes > MAX_BYTES and len(self._entries) > 1:
+                self._drop(next(iter(self._entries)))
+        return token
+
+    def get(self, token: str) -> Optional[Tuple[bytes, str]]:
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.get(token)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            return entry[0], entry[1]
+
+    def _expire(self, now: float):
+        # Insertion order is expiry order, since every entry gets the same TTL.
+        while self._entries:
+            token, (_, _, expires) = next(iter(self._entries.items()))
+            if expires > now:
+                break
+            self._drop(token)
+
+    def _drop(self, token: str):
+        data, _, _ = self._entries.pop(token)
+        self._bytes -= len(data)
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "ttl_seconds": TTL_SECONDS,
+            }
@@ -0,0 +1,204 @@
+"""One inference loop per embedder, shared by queries and indexing.
+
+Indexing batches and ``/search`` query embeddings used to call the same
+``embedder.model`` from different threads at once, with no coordination. Now
+every forward pass for an embedder goes through its ``InferenceServer``. The
+server owns the model and a single loop thread, which merges waiting requests
+into micro-batches.
+
+Requests carry a priority. Queries always go ahead of indexing work. Indexing
+batches are split into micro-batch-sized pieces, so a query waits for at most
+one piece already on the model, never for a whole page of indexing. After
+taking the most urgent request, the loop waits up to ``inference_window_ms``
+for others of the same priority and input shape to fill the batch.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import numpy as np
+import torch
+
+from core.threads import INDEXING, QUERY, ThreadBudget
+from settings import settings
+
+# Lower runs first.
+PRIORITY_QUERY = 0
+PRIORITY_INDEXING = 1
+_PRIORITY_NAMES = {PRIORITY_QUERY: "query", PRIORITY_INDEXING: "indexing"}
+
+# Latency samples kept per priority for the percentiles in ``metrics()``.
+_SAMPLES = 1000
+
+
+class _Request:
+    __slots__ = ("tensor", "future", "priority", "enqueued")
+
+    def __init__(self, tensor: torch.Tensor, priority: int):
+        self.tensor = tensor
+        self.future: Future = Future()
+        self.priority = priority
+        self.enqueued = time.monotonic()
+
+
+class _Stats:
+    def __init__(self):
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.batch_rows = 0
+        self.queue_wait = 0.0
+        self.latencies = deque(maxlen=_SAMPLES)
+
+
+class InferenceServer:
+    """Micro-batching front for one embedder's model."""
+
+    def __init__(self, embedder):
+        self._embedder = embedder
+        self._cond = threading.Condition()
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._closed = False
+        self._stats: Dict[int, _Stats] = {p: _Stats() for p in _PRIORITY_NAMES}
+        self._thread = threading.Thread(
+            target=self._run, name=f"inference-{embedder.name}", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def max_batch(self) -> int:
+        return max(1, settings.compute.inference_max_batch)
+
+    # -- callers --------------------------------------------------------------
+    def submit(self, batch: torch.Tensor, priority: int = PRIORITY_INDEXING) -> List[Future]:
+        """Queue a preprocessed ``[N, 3, H, W]`` batch; one future per piece."""
+        pieces = torch.split(batch, self.max_batch) if batch.shape[0] > self.max_batch else (batch,)
+        requests = [_Request(piece, priority) for piece in pieces]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"Inference server for {self._embedder.name} is closed")
+            for request in requests:
+                heapq.heappush(self._heap, (priority, next(self._seq), request))
+            self._cond.notify()
+        return [request.future for request in requests]
+
+    def run(self, batch: torch.Tensor, priority: int = PRIORITY_INDEXING) -> np.ndarray:
+        """Embed ``batch`` and block until done; returns ``[N, D]``."""
+        outputs = [future.result() for future in self.submit(batch, priority)]
+        return outputs[0] if len(outputs) == 1 else np.concatenate(outputs, axis=0)
+
+    def close(self):
+        """Stop the loop once the queue drains (the embedder is being replaced)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    # -- loop -----------------------------------------------------------------
+    def _collect(self) -> Optional[List[_Request]]:
+        with self._cond:
+            while not self._heap:
+                if self._closed:
+                    return None
+                self._cond.wait()
+            _, _, head = heapq.heappop(self._heap)
+            batch = [head]
+            rows = head.tensor.shape[0]
+            shape = tuple(head.tensor.shape[1:])
+            deadline = time.monotonic() + settings.compute.inference_window_ms / 1000.0
+            while rows < self.max_batch:
+                # Take compatible requests already queued...
+                taken = False
+                while self._heap and rows < self.max_batch:
+                    priority, _, candidate = self._heap[0]
+                    if priority != head.priority or tuple(candidate.tensor.shape[1:]) != shape:
+                        break
+                    if rows + candidate.tensor.shape[0] > self.max_batch:
+                        break
+                    heapq.heappop(self._heap)
+                    batch.append(candidate)
+                    rows += candidate.tensor.shape[0]
+                    taken = True
+                if taken:
+                    continue
+                # ...then wait a little for more, unless something incompatible
+                # (e.g. a query behind indexing work) is already waiting.
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._heap:
+                    break
+                self._cond.wait(timeout=remaining)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            started = time.monotonic()
+            try:
+                output = self._forward(torch.cat([r.tensor for r in batch], dim=0), batch[0].priority)
+            except Exception as exc:
+                for request in batch:
+                    request.future.set_exception(exc)
+                continue
+            finished = time.monotonic()
+
+            offset = 0
+            stats = self._stats[batch[0].priority]
+            for request in batch:
+                n = request.tensor.shape[0]
+                request.future.set_result(output[offset:offset + n])
+                offset += n
+                stats.requests += 1
+                stats.rows += n
+                stats.queue_wait += started - request.enqueued
+                stats.latencies.append(finished - request.enqueued)
+            stats.batches += 1
+            stats.batch_rows += offset
+
+    def _forward(self, batch: torch.Tensor, priority: int) -> np.ndarray:
+        embedder = self._embedder
+        workload = QUERY if priority == PRIORITY_QUERY else INDEXING
+        with ThreadBudget.instance().lease(workload), torch.inference_mode():
+            # DataParallel splits the batch among GPUs if applicable.
+            output = embedder.model(batch.to(embedder.device))
+            embeddings = output.detach().float().cpu().numpy()
+        # Release activations/inputs promptly so peak memory stays bounded
+        # when several large models run over the same batch.
+        del batch, output
+        if embedder.device.type == "cuda":
+            torch.cuda.empty_cache()
+        return embeddings
+
+    # -- reporting ------------------------------------------------------------
+    def metrics(self) -> Dict:
+        with self._cond:
+            depth = {name: 0 for name in _PRIORITY_NAMES.values()}
+            for priority, _, _ in self._heap:
+                depth[_PRIORITY_NAMES[priority]] += 1
+        out = {"queue_depth": depth, "max_batch": self.max_batch}
+        for priority, name in _PRIORITY_NAMES.items():
+            s = self._stats[priority]
+            latencies = sorted(s.latencies)
+            out[name] = {
+                "requests": s.requests,
+                "rows": s.rows,
+                "batches": s.batches,
+                "mean_queue_wait_ms": round(1000 * s.queue_wait / s.requests, 2) if s.requests else None,
+                # How full the micro-batches were, relative to max_batch.
+                "mean_batch_fill": round(s.batch_rows / (s.batches * self.max_batch), 3) if s.batches else None,
+                "latency_p50_ms": _percentile_ms(latencies, 0.5),
+                "latency_p95_ms": _percentile_ms(latencies, 0.95),
+            }
+        return out
+
+
+def _percentile_ms(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(1000 * ordered[min(len(ordered) - 1, int(q * len(ordered)))], 2)
@@ -1,22 +1,55 @@
-from typing import Optional
-
+"""Search queries, kept in SQLite with the most recently used ones in memory.
+
+Queries used to live in a dict that only ever grew. Every entry held its
+generated PIL images, so a long-running backend slowly filled RAM, and the
+whole history (and every qid a client held) was gone after a restart.
+
+A query is now a ``StoredQuery`` row with its results as JSON. Its generated
+images go to ``<data_dir>/queries/<id>/`` when a search saves it, as hard
+links to the generation cache's copies where it has them
+(``core.generation.cache``). A link takes no extra space, and unlike a
+reference into the cache it keeps the image for as long as the query exists,
+whatever the cache evicts.
+``QueryManager`` keeps the ``query.hot_queries`` most recently used ``Query``
+objects loaded. Any other query is read back on demand, with its images
+loaded only when something asks for them. Ids come from SQLite, so they
+survive restarts and stay unique across worker processes.
+
+Queries unused for ``query.retention_days`` are deleted with their images, as
+are the least recently used ones beyond ``query.max_stored_queries``.
+"""
+
+import json
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+from core.generation.cache import GenerationCache
 from core.singleton import Singleton
+from models.models import SessionLocal, StoredQuery
+from monitoring import logger
+from settings import settings
 
+# Retention runs at most this often, when queries are added.
+PRUNE_INTERVAL = 600
 
-class Query:
-    _id_counter = 0
 
-    def __init__(self, q):
+class Query:
+    def __init__(self, q, qid: Optional[int] = None):
         self._q = q
         self._embedders_results = {}
         self._generated_images = []
-        self._id = Query._generate_id()
+        self._id = qid
         self._final_results = []
-
-    @classmethod
-    def _generate_id(cls):
-        cls._id_counter += 1
-        return cls._id_counter
+        # Generated images on disk and not loaded yet, as (path, engine).
+        self._stored_images: List[Tuple[Path, str]] = []
+        # How many of the generated images are on disk.
+        self._saved_images = 0
 
     @property
     def id(self):
@@ -28,6 +61,18 @@ class Query:
 
     @property
     def generated_images(self):
+        if self._stored_images:
+            loaded = []
+            for path, engine_name in self._stored_images:
+                try:
+                    with Image.open(path) as stored:
+                        loaded.append((stored.convert("RGB"), engine_name))
+                except OSError as exc:
+                    logger.warning(f"Generated image of query {self._id} is unreadable: {exc}")
+                    break
+            self._stored_images = []
+            self._saved_images = len(loaded)
+            self._generated_images[:0] = loaded
         return self._generated_images
 
     @property
@@ -52,15 +97,109 @@ class Query:
 @Singleton
 class QueryManager:
     def __init__(self):
-        self._queries = {}
+        self._lock = threading.Lock()
+        self._hot: "OrderedDict[int, Query]" = OrderedDict()
+        self._root = Path(settings.storage.data_dir, "queries")
+        self._last_prune = 0.0
+
+    def _images_dir(self, qid: int) -> Path:
+        return self._root / str(qid)
 
     def add_query(self, q: Query):
-        self._queries[q.id] = q
+        now = time.time()
+        with SessionLocal() as session:
+            row = StoredQuery(text=q.query, created_at=now, last_used=now)
+            session.add(row)
+            session.commit()
+            q._id = row.id
+        self._remember(q)
+        if now - self._last_prune >= PRUNE_INTERVAL:
+            self._last_prune = now
+            self.prune()
         return q.id
 
     def get_query(self, id: int) -> Optional[Query]:
-        return self._queries.get(id, None)
-    
+        with self._lock:
+            q = self._hot.get(id)
+            if q is not None:
+                self._hot.move_to_end(id)
+                return q
+        with SessionLocal() as session:
+            row = session.get(StoredQuery, id)
+            if row is None:
+                return None
+            row.last_used = time.time()
+            session.commit()
+            q = self._restore(row)
+        return self._remember(q)
+
+    def _restore(self, row: StoredQuery) -> Query:
+        q = Query(row.text, row.id)
+        q.final_results = json.loads(row.results) if row.results else []
+        for name, results in (json.loads(row.embedder_results) if row.embedder_results else {}).items():
+            q.add_embedder_results(name, results)
+        engines = json.loads(row.engines) if row.engines else []
+        directory = self._images_dir(row.id)
+        q._stored_images = [(directory / f"{i}.png", engine_name) for i, engine_name in enumerate(engines)]
+        return q
+
+    def _remember(self, q: Query) -> Query:
+        """Make ``q`` hot; if a concurrent load got there first, that copy wins."""
+        with self._lock:
+            q = self._hot.setdefault(q.id, q)
+            self._hot.move_to_end(q.id)
+            while len(self._hot) > max(1, settings.query.hot_queries):
+                self._hot.popitem(last=False)
+            return q
+
+    def save(self, q: Query):
+        """Store ``q``'s results, writing generated images not on disk yet."""
+        images = q.generated_images
+        if q._saved_images < len(images):
+            directory = self._images_dir(q.id)
+            directory.mkdir(parents=True, exist_ok=True)
+            cache = GenerationCache.instance()
+            for i in range(q._saved_images, len(images)):
+                target = directory / f"{i}.png"
+                if not cache.link(images[i][0], target):
+                    images[i][0].save(target, "PNG", compress_level=1)
+            q._saved_images = len(images)
+        with SessionLocal() as session:
+            row = session.get(StoredQuery, q.id)
+            if row is None:
+                # Deleted by retention while it was being searched.
+                return
+            row.results = json.dumps(list(q.final_results or []))
+            row.embedder_results = json.dumps(q.embedder_results)
+            row.engines = json.dumps([engine_name for _, engine_name in images])
+            row.last_used = time.time()
+            session.commit()
+
+    def prune(self) -> int:
+        """Apply the retention policy; returns the number of queries deleted."""
+        cutoff = time.time() - settings.query.retention_days * 86400
+        with SessionLocal() as session:
+            expired = {qid for (qid,) in session.query(StoredQuery.id)
+                       .filter(StoredQuery.last_used < cutoff)}
+            keep = max(0, settings.query.max_stored_queries)
+            expired.update(qid for (qid,) in session.query(StoredQuery.id)
+                           .order_by(StoredQuery.last_used.desc()).offset(keep))
+            expired = sorted(expired)
+            for start in range(0, len(expired), 500):
+                chunk = expired[start:start + 500]
+                session.query(StoredQuery).filter(StoredQuery.id.in_(chunk)).delete(synchronize_session=False)
+            session.commit()
+        with self._lock:
+            for qid in expired:
+                self._hot.pop(qid, None)
+        for qid in expired:
+            shutil.rmtree(self._images_dir(qid), ignore_errors=True)
+        if expired:
+            logger.info(f"Deleted {len(expired)} queries past retention")
+        return len(expired)
+
     def list_queries(self):
         """Return a list of (query_id, query_string) tuples."""
-        return [(qid, query.query) for qid, query in self._queries.items()]
\ No newline at end of file
+        with SessionLocal() as session:
+            return [(qid, text) for qid, text in
+                    session.query(StoredQuery.id, StoredQuery.text).order_by(StoredQuery.id)]
@@ -0,0 +1,137 @@
+"""Fused results of recent searches, reused while the index is unchanged.
+
+People run the same few searches over and over, and the UI re-runs a search
+when it pages or re-renders. Each run used to generate, embed and retrieve
+from scratch. ``SearchResultCache`` keeps the outcome of recent searches in an
+LRU bounded by entries (``query.result_cache_size``) and by the size of the
+guide images they hold (``query.result_cache_mb``), which is most of an
+entry.
+
+A key covers everything the outcome depends on: the query text, the
+generation config, ``k``, the directories searched, the embedders with their
+weights, and the version of each embedder's vector table. Every write to a
+table bumps its version (see ``VectorStore.version``), so an index change
+makes the old keys unreachable. Nothing has to be invalidated by hand, and
+nothing unaffected is dropped. Unreachable entries age out of the LRU.
+
+A search for a new query reuses the guide images of a cached search with the
+same text. A repeated search for an existing query is keyed by that query's
+own images, which a cached search for another query may not share.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from core.singleton import Singleton
+from settings import settings
+
+
+class CachedSearch:
+    def __init__(self, generated_images: List[Tuple[Any, str]], results: List[str],
+                 embedder_results: Dict[str, List[str]], verbose: Dict):
+        self.generated_images = generated_images
+        self.results = results
+        self.embedder_results = embedder_results
+        self.verbose = verbose
+        # Decoded size of the guide images.
+        self.bytes = sum(image.width * image.height * len(image.getbands())
+                         for image, _ in generated_images)
+
+
+def search_key(query: str, generation_config: Dict, k: int, directory_ids: Sequence[int],
+               embedders: Dict[str, float], versions: Dict[str, int],
+               qid: Optional[int] = None) -> str:
+    """Cache key for a search; ``qid`` pins it to that query's guide images.
+
+    The key is a digest, so credentials in the generation config are not kept.
+    """
+    material = {
+        "query": query,
+        "generation": generation_config,
+        "k": k,
+        "directories": sorted(directory_ids),
+        "embedders": embedders,
+        "versions": versions,
+        "qid": qid,
+    }
+    encoded = json.dumps(material, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+
+@Singleton
+class SearchResultCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CachedSearch]" = OrderedDict()
+        # An entry can sit under several keys; its bytes count once.
+        self._refs: Dict[int, int] = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def capacity(self) -> int:
+        return max(0, settings.query.result_cache_size)
+
+    @property
+    def capacity_bytes(self) -> int:
+        return max(0, settings.query.result_cache_mb) * 1024 * 1024
+
+    def get(self, key: str) -> Optional[CachedSearch]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key: str, entry: CachedSearch):
+        capacity, capacity_bytes = self.capacity, self.capacity_bytes
+        if not capacity or not capacity_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._release(previous)
+            self._entries[key] = entry
+            self._hold(entry)
+            while self._entries and (len(self._entries) > capacity or self._bytes > capacity_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._release(evicted)
+
+    def _hold(self, entry: CachedSearch):
+        refs = self._refs.get(id(entry), 0)
+        if not refs:
+            self._bytes += entry.bytes
+        self._refs[id(entry)] = refs + 1
+
+    def _release(self, entry: CachedSearch):
+        refs = self._refs.pop(id(entry)) - 1
+        if refs:
+            self._refs[id(entry)] = refs
+        else:
+            self._bytes -= entry.bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._refs.clear()
+            self._bytes = 0
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "capacity": self.capacity,
+                "bytes": self._bytes,
+                "capacity_bytes": self.capacity_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else None,
+            }
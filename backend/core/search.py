@@ -0,0 +1,524 @@
+"""The search pipeline, and search jobs that report on it as it runs.
+
+A search generates guide images for the query, embeds each of them with
+every embedder, retrieves neighbours per embedding and fuses the rankings.
+``POST /search`` runs all of that inside one request. The client sees
+nothing for the several seconds it takes, and cannot tell a slow search from
+a hung one.
+
+``execute`` runs the pipeline and reports each step through an ``emit``
+callback: generation started, each guide image as it is ready, the fused
+results after each image has been matched, and each embedder's results.
+A ``SearchJob`` records those events. ``SearchJobManager`` runs jobs on a
+small pool of threads and keeps finished ones around for a while, so a
+client that reconnects can replay the events.
+
+The steps overlap. Generation runs on its own thread and hands over images as
+the engine produces them, one per API request or one chunk of the local
+pipeline at a time. Each image is embedded and searched while the next is
+still rendering, and the fused ranking is updated as each one's hits arrive.
+A search then takes about as long as generation plus the matching of the last
+image, where it used to take generation plus the matching of every image.
+
+``execute_batch`` serves ``POST /search/batch``, for scripts with many
+prompts. It hands every prompt to the generator at once and embeds and
+searches whatever images are ready as one batch per embedder.
+
+Cancelling a job takes effect at the next step boundary. An image that is
+already rendering is finished first, then generation stops.
+"""
+
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from core.generation.cache import GenerationCache, image_digest
+from core.result_cache import CachedSearch, SearchResultCache, search_key
+from core.singleton import Singleton
+from monitoring import logger
+from utils import RankFusion, Timer
+
+# Searches running at once; more are queued.
+MAX_CONCURRENT_JOBS = 4
+# Finished jobs stay available for replay this long, up to MAX_RETAINED_JOBS.
+RETAIN_SECONDS = 600
+MAX_RETAINED_JOBS = 200
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+Emit = Callable[[str, Dict[str, Any]], None]
+
+_END = object()
+
+
+class SearchCancelled(Exception):
+    pass
+
+
+class SearchOutcome:
+    def __init__(self, generated_images: List[Tuple[Any, str]], results: List[str],
+                 verbose: Dict, timings: Dict, cached: bool = False):
+        self.generated_images = generated_images
+        self.results = results
+        self.verbose = verbose
+        self.timings = timings
+        self.cached = cached
+
+
+class _Ahead:
+    """Runs an iterator on its own thread, so it produces items while the
+    caller works on earlier ones. Closing it stops the iterator after the
+    item in progress."""
+
+    def __init__(self, make_items: Callable[[], Iterator], timings: Dict):
+        self._ready = queue.Queue()
+        self._stop = threading.Event()
+        self._done = False
+        self._error: Optional[Exception] = None
+        threading.Thread(target=self._produce, args=(make_items, timings),
+                         name="search-generation", daemon=True).start()
+
+    def _produce(self, make_items: Callable[[], Iterator], timings: Dict):
+        started = time.perf_counter()
+        items = None
+        try:
+            items = make_items()
+            for item in items:
+                self._ready.put(item)
+                if self._stop.is_set():
+                    break
+        except Exception as exc:
+            self._ready.put(exc)
+        finally:
+            if items is not None:
+                items.close()
+            timings["image_generation"] = time.perf_counter() - started
+            self._ready.put(_END)
+
+    def drain(self) -> List:
+        """Wait for the next item, then take every other one already there.
+
+        Returns an empty list once the iterator is exhausted, and raises what
+        it raised after handing out the items produced before that.
+        """
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        if self._done:
+            return []
+        items = []
+        item = self._ready.get()
+        while True:
+            if item is _END:
+                self._done = True
+                break
+            if isinstance(item, Exception):
+                self._done = True
+                if not items:
+                    raise item
+                self._error = item
+                break
+            items.append(item)
+            try:
+                item = self._ready.get_nowait()
+            except queue.Empty:
+                break
+        return items
+
+    def __iter__(self):
+        while True:
+            items = self.drain()
+            if not items:
+                return
+            yield from items
+
+    def close(self):
+        self._stop.set()
+
+
+def execute(query_object, generation_config: Dict, k: int, emit: Optional[Emit] = None,
+            is_cancelled: Optional[Callable[[], bool]] = None) -> SearchOutcome:
+    """Run one search for ``query_object`` and record its results on it.
+
+    Events passed to ``emit``: ``generation_started``, ``image_ready``
+    (``index``, ``engine``, ``image`` as a PIL image), ``results_updated``
+    (``index``, fused ``results`` of every image up to it) and, once all
+    images are matched, ``embedder_done`` (``embedder``, its fused
+    ``results``). A search answered from the result cache emits the same
+    events, without generation_started.
+    """
+    from core import embedder_manager, image_generator
+    from indexing.repositories.repositories import VectorRepository
+    from models.models import Directory, SessionLocal
+
+    emit = emit or (lambda event, data: None)
+
+    def checkpoint():
+        if is_cancelled is not None and is_cancelled():
+            raise SearchCancelled()
+
+    timings = {}
+    total_timer_start = time.perf_counter()
+    query = query_object.query
+
+    checkpoint()
+    with SessionLocal() as session:
+        directory_ids = [d[0] for d in session.query(Directory.id).filter(
+            Directory.is_indexed == True, Directory.is_enabled == True).all()]
+
+    embedders = embedder_manager.get_image_embedders() if directory_ids else {}
+    vector_repo = VectorRepository()
+
+    fresh = not query_object.generated_images
+    cache = SearchResultCache.instance()
+    cache_keys = []
+    if embedders:
+        # Versions are read before searching: a write that lands meanwhile
+        # bumps them, so a result that may predate it is not found again.
+        weights = {name: embedder.weight for name, embedder in embedders.items()}
+        versions = {name: vector_repo.version(name) for name in embedders}
+        cache_keys = [search_key(query, generation_config, k, directory_ids, weights, versions, qid)
+                      for qid in ((None, query_object.id) if fresh else (query_object.id,))]
+        cached = cache.get(cache_keys[0])
+        if cached is not None:
+            # This query now has the cached guide images; its own key follows.
+            for key in cache_keys[1:]:
+                cache.put(key, cached)
+            return _replay(query_object, cached, fresh, emit, timings, total_timer_start)
+
+    if fresh:
+        generation_request = dict(generation_config)
+        generation_request["prompt"] = query
+        # Engines are optional: when the client omits them the orchestrator
+        # applies the saved preferences, which is the shared path.
+        for engine in generation_request.get("engines") or []:
+            engine["prompt"] = query
+
+        emit("generation_started", {"prompt": query})
+        incoming = _Ahead(lambda: image_generator.generate_iter(generation_request, cached=True), timings)
+    else:
+        incoming = iter(list(query_object.generated_images))
+
+    generation_cache = GenerationCache.instance()
+    verbose = {name: defaultdict(list) for name in embedders}
+    per_embedder = {name: RankFusion() for name in embedders}
+    combined = RankFusion()
+    generated_images = []
+
+    try:
+        for i, (image, engine_name) in enumerate(incoming):
+            if i == 0:
+                timings["first_image"] = time.perf_counter() - total_timer_start
+            generated_images.append((image, engine_name))
+            if fresh:
+                query_object.generated_images.append((image, engine_name))
+            emit("image_ready", {"index": i, "engine": engine_name, "image": image})
+
+            digest = image_digest(image) if embedders and generation_cache.enabled else None
+            for embedder_name, embedder in embedders.items():
+                checkpoint()
+                with Timer(f"embedding_{embedder_name}", timings, aggregate=True):
+                    query_embedding = generation_cache.embedding(digest, embedder.model_name) if digest else None
+                    if query_embedding is None:
+                        query_embedding = embedder.embed(image)
+                        if digest:
+                            generation_cache.put_embedding(digest, embedder.model_name, query_embedding)
+
+                with Timer(f"retrieval_{embedder_name}", timings, aggregate=True):
+                    hit_paths = vector_repo.search(
+                        embedder_name,
+                        query_embedding,
+                        limit=k,
+                        directory_ids=directory_ids,
+                    )
+
+                verbose[embedder_name][engine_name].append(hit_paths)
+                per_embedder[embedder_name].add(hit_paths)
+                combined.add(hit_paths, embedder.weight)
+
+            if embedders:
+                emit("results_updated", {"index": i, "results": combined.top(k)})
+            checkpoint()
+    finally:
+        # Stops a generation thread the loop has left behind.
+        close = getattr(incoming, "close", None)
+        if close is not None:
+            close()
+
+    if not embedders:
+        return SearchOutcome(generated_images, [], {}, timings)
+
+    embedder_results = {}
+    for embedder_name, fusion in per_embedder.items():
+        embedder_top_results = embedder_results[embedder_name] = fusion.top(k)
+        query_object.add_embedder_results(embedder_name=embedder_name, results=embedder_top_results)
+        emit("embedder_done", {"embedder": embedder_name, "results": embedder_top_results})
+
+    with Timer("ranking_aggregation", timings):
+        top_images = combined.top(k)
+
+    query_object.final_results = top_images
+    entry = CachedSearch(generated_images, top_images, embedder_results,
+                         {name: dict(by_engine) for name, by_engine in verbose.items()})
+    for key in cache_keys:
+        cache.put(key, entry)
+
+    # Add total time and calculate the overhead
+    timings["total_request_time"] = time.perf_counter() - total_timer_start
+    return SearchOutcome(generated_images, top_images, verbose, timings)
+
+
+def _replay(query_object, cached: CachedSearch, fresh: bool, emit: Emit, timings: Dict,
+            started: float) -> SearchOutcome:
+    """Answer a search from the result cache, with the events it would emit."""
+    if fresh:
+        query_object.generated_images.extend(cached.generated_images)
+    for i, (image, engine_name) in enumerate(cached.generated_images):
+        emit("image_ready", {"index": i, "engine": engine_name, "image": image})
+    if cached.generated_images:
+        emit("results_updated", {"index": len(cached.generated_images) - 1, "results": cached.results})
+    for embedder_name, results in cached.embedder_results.items():
+        query_object.add_embedder_results(embedder_name=embedder_name, results=results)
+        emit("embedder_done", {"embedder": embedder_name, "results": results})
+    query_object.final_results = cached.results
+    timings["total_request_time"] = time.perf_counter() - started
+    return SearchOutcome(cached.generated_images, cached.results, cached.verbose, timings, cached=True)
+
+
+def execute_batch(query_objects: List, generation_config: Dict, k: int
+                  ) -> Iterator[Tuple[int, Union[SearchOutcome, Exception]]]:
+    """Search for several new queries together, yielding ``(index, outcome)``
+    as each one finishes, in no particular order.
+
+    Generation gets every prompt in one request, so the local engine renders
+    several per pipeline call. Whatever images are ready when the previous
+    ones are done are embedded as one batch per embedder, and searched with
+    one multi-vector query per embedder. A query whose images could not be
+    generated yields the exception instead of an outcome.
+    """
+    from core import embedder_manager, image_generator
+    from indexing.repositories.repositories import VectorRepository
+    from models.models import Directory, SessionLocal
+
+    started = time.perf_counter()
+    with SessionLocal() as session:
+        directory_ids = [d[0] for d in session.query(Directory.id).filter(
+            Directory.is_indexed == True, Directory.is_enabled == True).all()]
+    embedders = embedder_manager.get_image_embedders() if directory_ids else {}
+    if not embedders:
+        # Nothing is indexed, so there is nothing to generate for.
+        for i in range(len(query_objects)):
+            yield i, SearchOutcome([], [], {}, {})
+        return
+
+    vector_repo = VectorRepository()
+    cache = SearchResultCache.instance()
+    generation_cache = GenerationCache.instance()
+    weights = {name: embedder.weight for name, embedder in embedders.items()}
+    versions = {name: vector_repo.version(name) for name in embedders}
+
+    def key_for(query_object, qid=None):
+        return search_key(query_object.query, generation_config, k, directory_ids, weights, versions, qid)
+
+    # Seeded batch images differ from what a single search with the seed
+    # makes (see ImageGenerator.generate_many), so their results are not
+    # stored under the keys single searches look up.
+    store = not image_generator.seeded(generation_config)
+
+    pending = []
+    for i, query_object in enumerate(query_objects):
+        cached = cache.get(key_for(query_object))
+        if cached is None:
+            pending.append(i)
+            continue
+        cache.put(key_for(query_object, query_object.id), cached)
+        yield i, _replay(query_object, cached, True, lambda event, data: None, {}, started)
+    if not pending:
+        return
+
+    timings = {}
+    prompts = [query_objects[i].query for i in pending]
+    incoming = _Ahead(lambda: image_generator.generate_many(dict(generation_config), prompts, cached=True),
+                      timings)
+    unfinished = set(pending)
+    try:
+        while True:
+            try:
+                ready = incoming.drain()
+            except Exception as exc:
+                for i in sorted(unfinished):
+                    yield i, exc
+                return
+            if not ready:
+                return
+
+            # Every image that is ready, as (query index, image, engine name).
+            images = [(pending[j], image, engine_name) for j, generated in ready
+                      for image, engine_name in generated]
+            batch_timings = dict(timings)
+            digests = ([image_digest(image) for _, image, _ in images]
+                       if generation_cache.enabled else [None] * len(images))
+            hits_by_embedder = {}
+            for embedder_name, embedder in embedders.items():
+                with Timer(f"embedding_{embedder_name}", batch_timings):
+                    vectors = [generation_cache.embedding(d, embedder.model_name) if d else None
+                               for d in digests]
+                    missing = [n for n, v in enumerate(vectors) if v is None]
+                    if missing:
+                        embedded = embedder.embed_batch([images[n][1] for n in missing])
+                        for n, vector in zip(missing, embedded):
+                            vectors[n] = vector
+                            if digests[n]:
+                                generation_cache.put_embedding(digests[n], embedder.model_name, vector)
+                with Timer(f"retrieval_{embedder_name}", batch_timings):
+                    hits_by_embedder[embedder_name] = (
+                        vector_repo.search_many(embedder_name, vectors, k, directory_ids) if vectors else [])
+
+            for j, generated in ready:
+                i = pending[j]
+                query_object = query_objects[i]
+                verbose = {name: defaultdict(list) for name in embedders}
+                combined = RankFusion()
+                embedder_results = {}
+                for embedder_name, embedder in embedders.items():
+                    fusion = RankFusion()
+                    for n, (owner, _, engine_name) in enumerate(images):
+                        if owner != i:
+                            continue
+                        hit_paths = hits_by_embedder[embedder_name][n]
+                        verbose[embedder_name][engine_name].append(hit_paths)
+                        fusion.add(hit_paths)
+                        combined.add(hit_paths, embedder.weight)
+                    embedder_results[embedder_name] = fusion.top(k)
+                    query_object.add_embedder_results(embedder_name=embedder_name,
+                                                      results=embedder_results[embedder_name])
+                top_images = combined.top(k)
+                query_object.generated_images.extend(generated)
+                query_object.final_results = top_images
+
+                entry = CachedSearch(list(generated), top_images, embedder_results,
+                                     {name: dict(by_engine) for name, by_engine in verbose.items()})
+                if store:
+                    cache.put(key_for(query_object), entry)
+                    cache.put(key_for(query_object, query_object.id), entry)
+                unfinished.discard(i)
+                outcome_timings = dict(batch_timings, total_request_time=time.perf_counter() - started)
+                yield i, SearchOutcome(list(generated), top_images, verbose, outcome_timings)
+    finally:
+        incoming.close()
+
+
+class SearchJob:
+    def __init__(self, qid: int):
+        self.id = secrets.token_hex(8)
+        self.qid = qid
+        self.state = QUEUED
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created = time.time()
+        self.finished_at: Optional[float] = None
+        self._events: List[Tuple[int, str, Dict]] = []
+        self._cond = threading.Condition()
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def emit(self, event: str, data: Dict):
+        with self._cond:
+            self._events.append((len(self._events) + 1, event, data))
+            self._cond.notify_all()
+
+    def events_after(self, seq: int) -> List[Tuple[int, str, Dict]]:
+        """Events with a sequence number above ``seq`` (numbering starts at 1)."""
+        with self._cond:
+            return self._events[seq:]
+
+    def _finish(self, state: str, event: str, data: Dict):
+        with self._cond:
+            self.state = state
+            self.finished_at = time.time()
+            self._events.append((len(self._events) + 1, event, data))
+            self._cond.notify_all()
+
+    def summary(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "qid": self.qid,
+            "state": self.state,
+            "result": self.result,
+            "error": self.error,
+            "events": len(self._events),
+        }
+
+
+@Singleton
+class SearchJobManager:
+    def __init__(self):
+        self._pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="search")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, SearchJob]" = OrderedDict()
+
+    def submit(self, qid: int, run: Callable[[SearchJob], Dict]) -> SearchJob:
+        """Start ``run(job)`` in the background; its return value is the result."""
+        job = SearchJob(qid)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job, run)
+        return job
+
+    def get(self, job_id: str) -> Optional[SearchJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @staticmethod
+    def _run(job: SearchJob, run: Callable[[SearchJob], Dict]):
+        if job.cancelled:
+            job._finish(CANCELLED, "cancelled", {})
+            return
+        job.state = RUNNING
+        job.emit("started", {"qid": job.qid})
+        try:
+            result = run(job)
+        except SearchCancelled:
+            job._finish(CANCELLED, "cancelled", {})
+        except Exception as exc:
+            # HTTPException carries its message in ``detail``.
+            job.error = str(getattr(exc, "detail", None) or exc)
+            logger.error(f"Search job {job.id} failed: {job.error}", exc_info=True)
+            job._finish(FAILED, "failed", {"detail": job.error})
+        else:
+            job.result = result
+            job._finish(DONE, "done", result)
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if not job.finished:
+                continue
+            if len(self._jobs) > MAX_RETAINED_JOBS or now - job.finished_at >= RETAIN_SECONDS:
+                del self._jobs[job_id]
+
+    def metrics(self) -> Dict:
+        with self._lock:
+            states = defaultdict(int)
+            for job in self._jobs.values():
+                states[job.state] += 1
+            return {"jobs": len(self._jobs), "states": dict(states), "max_concurrent": MAX_CONCURRENT_JOBS}
@@ -199,9 +199,15 @@ class SetupManager:
             for name, embedder in embedder_manager.get_image_embedders().items():
                 vector_store.create_table(name, embedder.embedding_dim)
 
+            # Drops tables of embedders the profile no longer has and flags
+            # images that a newly added one still has to embed.
+            flagged = image_indexing_service.sync_embedders()
+
             if not self._indexing_started:
                 image_indexing_service.start()
                 self._indexing_started = True
+            elif flagged:
+                image_indexing_service.requeue_all()
 
             self._set_state("ready", "Ready", total, total)
         except Exception as exc:
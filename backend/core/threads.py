@@ -0,0 +1,138 @@
+"""CPU thread budgets for the torch workloads sharing this process.
+
+Indexing workers, ``/search`` query embedding and on-device generation all run
+torch ops, and each used to assume it had every core to itself. With several
+of them active the intra-op pools oversubscribed the CPU, which thrashes caches
+and inflates tail latency for everyone.
+
+Work now runs under a lease for its workload class. A class is entitled to its
+configured share of the cores while other classes are busy, and may borrow
+the shares of idle classes. That entitlement is split evenly across the class's
+concurrent leases. The grant is applied with ``torch.set_num_threads`` on the
+calling thread. Torch's OpenMP backend keeps the thread count per calling
+thread, so one lease does not resize another. A grant is fixed for the length
+of its lease; callers lease per forward pass so budgets follow load.
+
+Worker processes (``DIRECTORY__INDEXING_PROCESSES``) each get a fixed share of
+the cores; they ``pin`` their own budget to that share, so leases inside a
+worker never grant more than it.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from core.singleton import Singleton
+from settings import settings
+
+INDEXING = "indexing"
+QUERY = "query"
+GENERATION = "generation"
+WORKLOADS = (INDEXING, QUERY, GENERATION)
+
+
+class _WorkloadStats:
+    def __init__(self):
+        self.active = 0
+        self.granted = 0
+        self.leases = 0
+        self.busy_seconds = 0.0
+        self.thread_seconds = 0.0
+
+
+@Singleton
+class ThreadBudget:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _WorkloadStats] = {w: _WorkloadStats() for w in WORKLOADS}
+        self._started = time.monotonic()
+        # Set in worker processes, which own only part of the cores.
+        self._pinned: Optional[int] = None
+
+    @property
+    def total(self) -> int:
+        if self._pinned is not None:
+            return self._pinned
+        return settings.compute.threads or os.cpu_count() or 1
+
+    def pin(self, threads: int):
+        """Fix this process's budget at ``threads``, whatever the settings say."""
+        self._pinned = max(1, int(threads))
+
+    def _shares(self) -> Dict[str, float]:
+        compute = settings.compute
+        return {
+            INDEXING: max(0.0, compute.indexing_share),
+            QUERY: max(0.0, compute.query_share),
+            GENERATION: max(0.0, compute.generation_share),
+        }
+
+    def _entitlement(self, workload: str) -> int:
+        """Threads for one more lease of ``workload``; caller holds the lock."""
+        shares = self._shares()
+        # Classes with work in flight (counting the new lease) split the cores
+        # by share; idle classes' shares are lent out.
+        busy = {w for w, s in self._stats.items() if s.active} | {workload}
+        weight = sum(shares[w] for w in busy)
+        fraction = shares[workload] / weight if weight else 1.0 / len(busy)
+        class_threads = self.total * fraction
+        return max(1, int(class_threads // (self._stats[workload].active + 1)))
+
+    @contextmanager
+    def lease(self, workload: str):
+        """Run the block with this thread limited to ``workload``'s budget.
+
+        Yields the number of threads granted.
+        """
+        import torch
+
+        with self._lock:
+            granted = self._entitlement(workload)
+            stats = self._stats[workload]
+            stats.active += 1
+            stats.granted += granted
+            stats.leases += 1
+
+        previous = torch.get_num_threads()
+        torch.set_num_threads(granted)
+        started = time.monotonic()
+        try:
+            yield granted
+        finally:
+            torch.set_num_threads(previous)
+            elapsed = time.monotonic() - started
+            with self._lock:
+                stats.active -= 1
+                stats.granted -= granted
+                stats.busy_seconds += elapsed
+                stats.thread_seconds += elapsed * granted
+
+    def metrics(self) -> Dict:
+        """Current grants and cumulative utilization per workload class."""
+        with self._lock:
+            uptime = max(1e-9, time.monotonic() - self._started)
+            total = self.total
+            shares = self._shares()
+            workloads = {
+                name: {
+                    "share": shares[name],
+                    "active_leases": s.active,
+                    "threads_granted": s.granted,
+                    "leases_total": s.leases,
+                    "busy_seconds": round(s.busy_seconds, 3),
+                    "thread_seconds": round(s.thread_seconds, 3),
+                    # Fraction of the whole budget this class has used since start.
+                    "utilization": round(s.thread_seconds / (uptime * total), 4),
+                }
+                for name, s in self._stats.items()
+            }
+            granted = sum(s.granted for s in self._stats.values())
+        return {
+            "total_threads": total,
+            "threads_granted": granted,
+            "uptime_seconds": round(uptime, 3),
+            "workloads": workloads,
+        }
+
@@ -0,0 +1,181 @@
+"""Downscaled copies of indexed images, for galleries and result lists.
+
+``/file`` sends the original, so a page of sixteen results from a camera
+library could mean 150 MB of JPEGs for a grid of small tiles. Thumbnails are
+made while indexing, from the image the embedders decode anyway, so producing
+them costs a resize and an encode but no second read of the file. Only the
+small ``thumbnail_sizes`` are made that way; ``thumbnail_on_demand_sizes`` are
+made from the file the first time one is asked for, since most images are
+never viewed large.
+
+Thumbnails are stored by content: the key is a hash of the file's bytes,
+recorded on the image row as ``content_hash``. Identical files share one set of
+thumbnails, and a moved or renamed file keeps them. Because a key never changes
+meaning, ``/thumbnail`` can serve them with a strong ETag, and with a
+long-lived ``Cache-Control`` when the URL carries the key.
+
+Thumbnails whose hash no image row has any more (the file was deleted or its
+content changed) are removed by the consistency checker, through ``prune``.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urlencode
+
+from PIL import Image as PImage
+
+from core.singleton import Singleton
+from monitoring import logger
+from settings import settings
+
+# Thumbnails younger than this are never pruned: indexing writes them before
+# it records the hash, and on-demand ones are made for files not indexed yet.
+PRUNE_GRACE_SECONDS = 3600
+
+_FORMAT = "JPEG"
+_EXTENSION = ".jpg"
+MEDIA_TYPE = "image/jpeg"
+
+# EXIF orientation -> the transpose that displays the image upright.
+_ORIENTATION = {
+    2: PImage.Transpose.FLIP_LEFT_RIGHT,
+    3: PImage.Transpose.ROTATE_180,
+    4: PImage.Transpose.FLIP_TOP_BOTTOM,
+    5: PImage.Transpose.TRANSPOSE,
+    6: PImage.Transpose.ROTATE_270,
+    7: PImage.Transpose.TRANSVERSE,
+    8: PImage.Transpose.ROTATE_90,
+}
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def read_image(path: str) -> Tuple[PImage.Image, str, Optional[int]]:
+    """Read ``path`` once and decode it.
+
+    Returns the RGB image, the content hash of the file and its EXIF
+    orientation (applied to thumbnails only; embedders see pixels as stored).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    raw = PImage.open(io.BytesIO(data))
+    orientation = raw.getexif().get(0x0112)
+    return raw.convert("RGB"), content_hash(data), orientation
+
+
+@Singleton
+class ThumbnailStore:
+    def __init__(self):
+        self._root = Path(settings.storage.data_dir, "thumbnails")
+
+    @property
+    def sizes(self) -> List[int]:
+        """Every configured edge length, largest first."""
+        cfg = settings.directory
+        return _sizes(list(cfg.thumbnail_sizes) + list(cfg.thumbnail_on_demand_sizes))
+
+    @property
+    def eager_sizes(self) -> List[int]:
+        """Edge lengths made while indexing, largest first."""
+        return _sizes(settings.directory.thumbnail_sizes)
+
+    def fit(self, size: Optional[int]) -> int:
+        """The smallest configured size at least ``size`` (the largest if none is)."""
+        sizes = self.sizes
+        if size is None:
+            return sizes[-1]
+        return min((s for s in sizes if s >= size), default=sizes[0])
+
+    def path(self, digest: str, size: int) -> Path:
+        return self._root / digest[:2] / f"{digest}_{size}{_EXTENSION}"
+
+    def has(self, digest: str, size: int) -> bool:
+        return self.path(digest, size).is_file()
+
+    def put(self, digest: str, image: PImage.Image, orientation: Optional[int] = None,
+            size: Optional[int] = None):
+        """Write the eager sizes of ``image``, and ``size`` if given, where not
+        stored yet."""
+        sizes = _sizes(self.eager_sizes + ([size] if size is not None else []))
+        missing = [s for s in sizes if not self.has(digest, s)]
+        if not missing:
+            return
+        transpose = _ORIENTATION.get(orientation)
+        thumb = image.transpose(transpose) if transpose is not None else image.copy()
+        # Largest first, each one scaled down from the previous: resizing the
+        # full-resolution image once is most of the cost.
+        for size in missing:
+            thumb.thumbnail((size, size), PImage.Resampling.LANCZOS)
+            self._write(self.path(digest, size), thumb)
+
+    def put_file(self, path: str, size: Optional[int] = None) -> str:
+        """Make thumbnails for a file, as ``put`` does; returns its hash."""
+        image, digest, orientation = read_image(path)
+        self.put(digest, image, orientation, size)
+        return digest
+
+    @staticmethod
+    def _write(target: Path, image: PImage.Image):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed, so a reader never sees a partial file.
+        fd, tmp = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                image.save(f, _FORMAT, quality=settings.directory.thumbnail_quality, optimize=True)
+            os.replace(tmp, target)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def prune(self, prefix: str, referenced: Set[str]) -> Tuple[int, int]:
+        """Delete thumbnails whose hash starts with ``prefix`` and is not in
+        ``referenced``, unless they are recent.
+
+        Returns ``(files looked at, files deleted)``.
+        """
+        cutoff = time.time() - PRUNE_GRACE_SECONDS
+        seen = deleted = 0
+        for shard in self._root.glob(f"{prefix}*"):
+            for path in shard.glob(f"*{_EXTENSION}"):
+                seen += 1
+                if path.name.split("_")[0] in referenced:
+                    continue
+                try:
+                    if path.stat().st_mtime < cutoff:
+                        path.unlink()
+                        deleted += 1
+                except OSError:
+                    continue
+        return seen, deleted
+
+    def save_batch(self, images: Dict[str, Tuple[PImage.Image, Optional[int]]]):
+        """``put`` for a batch keyed by digest; failures are logged, not raised."""
+        for digest, (image, orientation) in images.items():
+            try:
+                self.put(digest, image, orientation)
+            except Exception as exc:
+                logger.warning(f"Could not write thumbnails for {digest}: {exc}")
+
+
+def _sizes(sizes) -> List[int]:
+    return sorted({max(16, int(s)) for s in sizes}, reverse=True)
+
+
+def thumbnail_query(path: str, digest: Optional[str], size: Optional[int] = None) -> str:
+    """Query string for ``/thumbnail``; carrying the digest makes it cacheable for good."""
+    params = {"file_path": path}
+    if size is not None:
+        params["size"] = size
+    if digest:
+        params["v"] = digest
+    return urlencode(params)
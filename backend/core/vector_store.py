@@ -7,10 +7,18 @@ the shape::
 
     {"image_path": str (unique), "directory_id": int, "embedding": float32[dim]}
 
+Rows are written with upsert semantics keyed by ``image_path``, so writing the
+same image twice never produces a duplicate row.
+
 Similarity search uses cosine distance, matching the previous Milvus behaviour.
+
+Every table also has a version number, bumped after each write that can
+change search results. It lives in memory and restarts from zero with the
+process, which is enough for caches that live in memory too.
 """
 
-from typing import Dict, List, Optional, Sequence
+import threading
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 import lancedb
 import pyarrow as pa
@@ -33,6 +41,8 @@ class VectorStore:
         self._path = settings.storage.lancedb_path
         self._db = lancedb.connect(self._path)
         self._dims: Dict[str, int] = {}
+        self._versions: Dict[str, int] = {}
+        self._versions_lock = threading.Lock()
         logger.info(f"Connected to LanceDB at {self._path}")
 
     # -- schema -----------------------------------------------------------
@@ -48,28 +58,72 @@ class VectorStore:
             ]
         )
         self._db.create_table(name, schema=schema)
+        self._bump(name)
         logger.info(f"Created LanceDB table '{name}' (dim={dim})")
 
+    def table_names(self) -> List[str]:
+        return list(self._db.table_names())
+
+    def drop_table(self, name: str) -> None:
+        self._dims.pop(name, None)
+        if name in self._db.table_names():
+            self._db.drop_table(name)
+            self._bump(name)
+            logger.info(f"Dropped LanceDB table '{name}'")
+
     def _table(self, name: str):
         return self._db.open_table(name)
 
+    def version(self, name: str) -> int:
+        """Counter bumped by every write to table ``name``.
+
+        Bumped once the write is done, so a result computed from the table
+        under version ``v`` may include the write but never misses one made
+        before ``v`` was read.
+        """
+        return self._versions.get(name, 0)
+
+    def _bump(self, name: str) -> None:
+        with self._versions_lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+
     # -- writes -----------------------------------------------------------
-    def insert(self, name: str, entries: List[Dict]) -> None:
+    def upsert(self, name: str, entries: List[Dict]) -> None:
+        """Write vectors keyed by ``image_path``, replacing any existing row.
+
+        A plain append is not idempotent: re-running a batch after a crash (or
+        re-embedding a modified file) would leave two rows for the same path,
+        which double-counts that image in rank fusion. ``merge_insert`` makes a
+        retried write converge on exactly one row per path.
+        """
         if not entries:
             return
-        rows = [
-            {
+        # merge_insert rejects a source with duplicate keys; keep the last one.
+        by_path = {}
+        for e in entries:
+            by_path[e["image_path"]] = {
                 "image_path": e["image_path"],
                 "directory_id": int(e["directory_id"]),
                 "embedding": [float(x) for x in e["embedding"]],
             }
-            for e in entries
-        ]
-        self._table(name).add(rows)
-        logger.debug(f"Inserted {len(rows)} rows into LanceDB table '{name}'")
+        table = self._table(name)
+        data = pa.Table.from_pylist(list(by_path.values()), schema=table.schema)
+        try:
+            (
+                table.merge_insert("image_path")
+                .when_matched_update_all()
+                .when_not_matched_insert_all()
+                .execute(data)
+            )
+        finally:
+            self._bump(name)
+        logger.debug(f"Upserted {len(by_path)} rows into LanceDB table '{name}'")
 
     def delete_by_path(self, name: str, image_path: str) -> None:
-        self._table(name).delete(f"image_path = {_sql_str(image_path)}")
+        try:
+            self._table(name).delete(f"image_path = {_sql_str(image_path)}")
+        finally:
+            self._bump(name)
 
     def delete_by_paths(self, name: str, image_paths: Sequence[str]) -> int:
         """Delete many paths in as few table rewrites as possible.
@@ -84,14 +138,69 @@ class VectorStore:
             return 0
         table = self._table(name)
         batch = 500
-        for start in range(0, len(paths), batch):
-            chunk = paths[start:start + batch]
-            predicate = ", ".join(_sql_str(p) for p in chunk)
-            table.delete(f"image_path IN ({predicate})")
+        try:
+            for start in range(0, len(paths), batch):
+                chunk = paths[start:start + batch]
+                predicate = ", ".join(_sql_str(p) for p in chunk)
+                table.delete(f"image_path IN ({predicate})")
+        finally:
+            self._bump(name)
         return len(paths)
 
+    def rename_paths(self, name: str, moves: Dict[str, Tuple[str, int]]) -> int:
+        """Move vectors to new paths (and directories) without re-embedding.
+
+        ``moves`` maps old path to ``(new path, directory_id)``. The rows are
+        read, rewritten and upserted under their new keys, then the old keys
+        are deleted: a crash in between leaves an extra row for a path that no
+        longer exists, which the consistency checker removes.
+        """
+        if not moves:
+            return 0
+        table = self._table(name)
+        dataset = table.to_lance()
+        sources = list(moves)
+        moved = []
+        for start in range(0, len(sources), 500):
+            chunk = sources[start:start + 500]
+            predicate = ", ".join(_sql_str(p) for p in chunk)
+            rows = dataset.to_table(filter=f"image_path IN ({predicate})").to_pylist()
+            for row in rows:
+                new_path, directory_id = moves[row["image_path"]]
+                row["image_path"], row["directory_id"] = new_path, int(directory_id)
+                moved.append(row)
+        if moved:
+            data = pa.Table.from_pylist(moved, schema=table.schema)
+            try:
+                (
+                    table.merge_insert("image_path")
+                    .when_matched_update_all()
+                    .when_not_matched_insert_all()
+                    .execute(data)
+                )
+            finally:
+                self._bump(name)
+        destinations = {dest for dest, _ in moves.values()}
+        self.delete_by_paths(name, [p for p in sources if p not in destinations])
+        return len(moved)
+
+    def rename_prefix(self, name: str, old_prefix: str, new_prefix: str) -> None:
+        """Rewrite every path under ``old_prefix`` in one update (a renamed folder)."""
+        try:
+            self._table(name).update(
+                where=f"starts_with(image_path, {_sql_str(old_prefix)})",
+                values_sql={
+                    "image_path": f"concat({_sql_str(new_prefix)}, substr(image_path, {len(old_prefix) + 1}))"
+                },
+            )
+        finally:
+            self._bump(name)
+
     def delete_by_directory(self, name: str, directory_id: int) -> None:
-        self._table(name).delete(f"directory_id = {int(directory_id)}")
+        try:
+            self._table(name).delete(f"directory_id = {int(directory_id)}")
+        finally:
+            self._bump(name)
 
     # -- reads ------------------------------------------------------------
     def get_embeddings_by_path(self, name: str, image_path: str) -> List[List[float]]:
@@ -101,6 +210,27 @@ class VectorStore:
         )
         return [row.as_py() for row in table.column("embedding")]
 
+    def existing_paths(self, name: str, image_paths: Sequence[str]) -> Set[str]:
+        """The subset of ``image_paths`` that has a row in table ``name``."""
+        paths = [p for p in dict.fromkeys(image_paths) if p]
+        found: Set[str] = set()
+        if not paths:
+            return found
+        dataset = self._table(name).to_lance()
+        batch = 500
+        for start in range(0, len(paths), batch):
+            chunk = paths[start:start + batch]
+            predicate = ", ".join(_sql_str(p) for p in chunk)
+            table = dataset.to_table(columns=["image_path"], filter=f"image_path IN ({predicate})")
+            found.update(row.as_py() for row in table.column("image_path"))
+        return found
+
+    def iter_paths(self, name: str, batch_size: int = 10000) -> Iterator[List[str]]:
+        """Stream every stored path in chunks rather than one large list."""
+        dataset = self._table(name).to_lance()
+        for batch in dataset.to_batches(columns=["image_path"], batch_size=batch_size):
+            yield [p for p in batch.column("image_path").to_pylist() if p]
+
     def list_all_paths(self, name: str) -> List[str]:
         dataset = self._table(name).to_lance()
         table = dataset.to_table(columns=["image_path"])
@@ -123,3 +253,34 @@ class VectorStore:
             query = query.where(f"directory_id IN ({ids})", prefilter=True)
         results = query.limit(limit).to_list()
         return [r["image_path"] for r in results]
+
+    def search_many(
+        self,
+        name: str,
+        vectors: Sequence[Sequence[float]],
+        limit: int,
+        directory_ids: Optional[Sequence[int]] = None,
+    ) -> List[List[str]]:
+        """``search`` for several vectors at once, ``limit`` hits each.
+
+        Runs as one multi-vector query, whose hits carry the index of their
+        query vector. LanceDB builds without multi-vector queries get one
+        search per vector.
+        """
+        if len(vectors) <= 1:
+            return [self.search(name, v, limit, directory_ids) for v in vectors]
+        query = (
+            self._table(name)
+            .search([[float(x) for x in v] for v in vectors])
+            .metric("cosine")
+        )
+        if directory_ids:
+            ids = ", ".join(str(int(i)) for i in directory_ids)
+            query = query.where(f"directory_id IN ({ids})", prefilter=True)
+        rows = query.limit(limit).to_list()
+        if rows and "query_index" not in rows[0]:
+            return [self.search(name, v, limit, directory_ids) for v in vectors]
+        hits: List[List[str]] = [[] for _ in vectors]
+        for r in sorted(rows, key=lambda r: r["_distance"]):
+            hits[r["query_index"]].append(r["image_path"])
+        return hits
@@ -1,5 +1,23 @@
-from .services.image_indexing_service import ImageIndexingService
+from importlib import import_module
 
-image_indexing_service = ImageIndexingService.instance()
+# Created on first use, so worker processes that only embed (see
+# ``ProcessEmbedderService``) do not build the indexing service and its
+# database on import.
+_SINGLETONS = {
+    "image_indexing_service": (".services.image_indexing_service", "ImageIndexingService"),
+    "indexing_throttle": (".throttle", "IndexingThrottle"),
+    "indexing_telemetry": (".telemetry", "IndexingTelemetry"),
+}
 
-__all__ = ["image_indexing_service"]
+
+def __getattr__(name):
+    try:
+        module, cls = _SINGLETONS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    instance = getattr(import_module(module, __name__), cls).instance()
+    globals()[name] = instance
+    return instance
+
+
+__all__ = list(_SINGLETONS)
@@ -1,86 +1,320 @@
+"""Periodic reconciliation of the database with what is on disk.
+
+A pass used to sleep for the whole interval and then check every directory
+back to back, which gave the disk and the database a load spike every half
+hour. A pass is now cut into units and spread over the interval. Each
+directory gets one unit for its new files, plus one per slice of
+``consistency_slice_rows`` tracked images for stat'ing existing ones. Units of
+different directories are interleaved, start at jittered times, and every unit
+stays within a budget: at most ``consistency_stat_rate`` file stats per second,
+and busy for at most ``consistency_cpu_fraction`` of the wall-clock time.
+
+A directory whose watcher has run cleanly since its last full check is
+skipped, until that check is ``consistency_trust_watcher`` seconds old. The
+watcher already applied everything that happened there.
+
+Each pass ends by removing thumbnails whose content hash no image has any
+more, one hex digit of hashes at a time and within the same budget.
+
+Each pass records its cost and coverage; ``history()`` returns the recent ones.
+"""
+
+import itertools
 import os
+import random
 import threading
 import time
+from collections import deque
+from typing import Dict, List, Tuple
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from models.models import SessionLocal, Directory
-from indexing.file_types import scan_image_paths
+from models.models import SessionLocal, Directory, Image
+from core.thumbnails import ThumbnailStore
+from indexing.file_types import FileStat, file_stat
 from indexing.queue_manager.index_queue_manager import IndexQueueManager
 from indexing.repositories.repositories import DirectoryRepository, ImageRepository, VectorRepository
+from indexing.scanner import DirectoryScanner
+from indexing.watchers.file_watcher_service import FileWatcherService
 from monitoring import logger
+from settings import settings
+
+# Paths handled per database round-trip; also bounds memory per pass.
+CHUNK_SIZE = 500
+# Unit start times wander by up to this fraction of the spacing between units.
+JITTER = 0.25
+# Passes kept for ``history()``.
+HISTORY_SIZE = 20
+
+
+class _Budget:
+    """Paces a unit's work to the configured I/O and CPU budget."""
+
+    def __init__(self):
+        self.stats = 0
+        self.busy_seconds = 0.0
+        self.throttled_seconds = 0.0
+
+    def spend(self, stats: int, busy_seconds: float):
+        """Account for ``stats`` file stats done in ``busy_seconds``, then sleep
+        long enough to stay within budget."""
+        self.stats += stats
+        self.busy_seconds += busy_seconds
+        cfg = settings.directory
+        pause = 0.0
+        if cfg.consistency_stat_rate > 0:
+            pause = max(pause, stats / cfg.consistency_stat_rate - busy_seconds)
+        fraction = cfg.consistency_cpu_fraction
+        if 0 < fraction < 1:
+            pause = max(pause, busy_seconds * (1 - fraction) / fraction)
+        if pause > 0:
+            self.throttled_seconds += pause
+            time.sleep(pause)
 
 
 class ConsistencyChecker:
     def __init__(self, interval: int = 3600):
         self.interval = interval
         self.thread = threading.Thread(target=self.run, daemon=True)
+        # Monotonic time of each directory's last complete check, and where its
+        # slices left off. In memory on purpose: after a restart every
+        # directory is checked once, since nothing watched it while down.
+        self._last_full_check: Dict[int, float] = {}
+        self._slice_cursor: Dict[int, int] = {}
+        self._last_slice: Dict[int, int] = {}
+        self._history = deque(maxlen=HISTORY_SIZE)
 
     def start(self):
         self.thread.start()
 
     def run(self):
         while True:
-            time.sleep(self.interval)
-            self.check_consistency()
+            started = time.monotonic()
+            try:
+                self.run_pass(spread_over=self.interval)
+            except Exception as exc:
+                logger.error(f"Consistency pass failed: {exc}", exc_info=True)
+            # A pass that ran short (few units) still waits out the interval.
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def history(self) -> List[Dict]:
+        """Cost and coverage of recent passes, newest last."""
+        return list(self._history)
 
     def check_consistency(self):
+        """Check every directory now, without spreading or skipping."""
+        self.run_pass(spread_over=0, trust_watcher=False)
+
+    def run_pass(self, spread_over: float, trust_watcher: bool = True):
         logger.debug("Running system-wide consistency check")
+        record = {
+            "started_at": time.time(),
+            "directories_checked": 0,
+            "directories_skipped": 0,
+            "units": 0,
+            "files_checked": 0,
+            "new": 0,
+            "changed": 0,
+            "missing": 0,
+            "thumbnails_removed": 0,
+            "errors": 0,
+        }
+        budget = _Budget()
+        started = time.monotonic()
         session = SessionLocal()
         try:
-            directory_repo = DirectoryRepository(session)
-            # Snapshot the ids first: check_directory commits (and may delete a
-            # directory), which expires the ORM objects and would make the loop
-            # re-fetch each one from the database.
-            directory_ids = [d.id for d in directory_repo.get_all()]
-            for directory_id in directory_ids:
+            units = self._plan(session, trust_watcher, record)
+            record["units"] = len(units)
+            pace = spread_over / len(units) if units else 0.0
+            for i, (directory_id, slice_index) in enumerate(units):
+                if pace:
+                    jitter = random.uniform(-JITTER, JITTER) * pace
+                    time.sleep(max(0.0, started + i * pace + jitter - time.monotonic()))
                 directory = session.get(Directory, directory_id)
                 if directory is None:
                     continue
                 try:
-                    self.check_directory(session, directory)
+                    self._run_unit(session, directory, slice_index, budget, record)
                 except Exception as exc:
                     # One bad directory (permissions, unmounted drive) must not
                     # stop the others from being checked.
                     logger.error(f"Consistency check failed for directory {directory_id}: {exc}", exc_info=True)
+                    record["errors"] += 1
                     session.rollback()
-            logger.debug("Consistency check completed")
-        except Exception as e:
-            logger.error(f"Consistency check error: {e}", exc_info=True)
-            session.rollback()
+            try:
+                self._prune_thumbnails(session, budget, record)
+            except Exception as exc:
+                logger.error(f"Thumbnail pruning failed: {exc}", exc_info=True)
+                record["errors"] += 1
         finally:
             session.close()
+            record["duration_seconds"] = round(time.monotonic() - started, 3)
+            record["busy_seconds"] = round(budget.busy_seconds, 3)
+            record["throttled_seconds"] = round(budget.throttled_seconds, 3)
+            self._history.append(record)
+            logger.info(
+                f"Consistency pass: {record['directories_checked']} director(ies) checked, "
+                f"{record['directories_skipped']} skipped, {record['files_checked']} file(s) in "
+                f"{record['units']} unit(s); {record['new']} new, {record['changed']} changed, "
+                f"{record['missing']} missing"
+            )
 
-    def check_directory(self, session: Session, directory: Directory):
-        logger.debug(f"Checking consistency for directory {directory.path} (ID: {directory.id})")
-        if not os.path.exists(directory.path):
-            logger.warning(f"Directory missing: {directory.path}. Removing from system.")
-            # Also clears the directory's images and vectors, which used to be
-            # left behind pointing at a path that no longer exists.
-            DirectoryRepository(session).delete(directory)
-            return
+    @staticmethod
+    def _prune_thumbnails(session: Session, budget: _Budget, record: Dict):
+        """Delete thumbnails no image row refers to, by first hex digit of the
+        hash so only a sixteenth of the hashes is in memory at once."""
+        store = ThumbnailStore.instance()
+        image_repo = ImageRepository(session)
+        for prefix in "0123456789abcdef":
+            started = time.monotonic()
+            seen, deleted = store.prune(prefix, image_repo.content_hashes_with_prefix(prefix))
+            record["thumbnails_removed"] += deleted
+            budget.spend(seen, time.monotonic() - started)
+
+    def _plan(self, session: Session, trust_watcher: bool, record: Dict) -> List[Tuple[int, int]]:
+        """Units for this pass as ``(directory_id, slice)``; slice -1 is the
+        new-file scan. Slices of different directories are interleaved so a
+        large directory does not monopolise a stretch of the interval."""
+        counts = dict(session.query(Image.directory_id, func.count(Image.id)).group_by(Image.directory_id).all())
+        watchers = FileWatcherService.instance()
+        now = time.monotonic()
+        per_directory = []
+        for directory in DirectoryRepository(session).get_all():
+            last = self._last_full_check.get(directory.id)
+            healthy = watchers.healthy_since(directory.path)
+            if (trust_watcher and last is not None and healthy is not None and healthy <= last
+                    and now - last < settings.directory.consistency_trust_watcher):
+                record["directories_skipped"] += 1
+                continue
+            slices = -(-counts.get(directory.id, 0) // max(1, settings.directory.consistency_slice_rows))
+            per_directory.append([(directory.id, i) for i in range(-1, slices)])
+            self._slice_cursor[directory.id] = 0
+            self._last_slice[directory.id] = slices - 1
+        record["directories_checked"] = len(per_directory)
+        random.shuffle(per_directory)
+        return [unit for round_ in itertools.zip_longest(*per_directory) for unit in round_ if unit]
 
-        fs_paths = scan_image_paths(directory.path)
+    def _run_unit(self, session: Session, directory: Directory, slice_index: int, budget: _Budget, record: Dict):
         image_repo = ImageRepository(session)
-        db_paths = image_repo.get_paths(directory.id)
+        if slice_index < 0:
+            if not os.path.exists(directory.path):
+                logger.warning(f"Directory missing: {directory.path}. Removing from system.")
+                # Also clears the directory's images and vectors, which used to be
+                # left behind pointing at a path that no longer exists.
+                DirectoryRepository(session).delete(directory)
+                return
+            new = self._find_new(image_repo, directory, budget)
+            record["new"] += new
+            changed, deleted = [], []
+        else:
+            after_id = self._slice_cursor.get(directory.id, 0)
+            changed, deleted, last_id, checked = self._find_changed_and_deleted(
+                image_repo, directory, after_id, settings.directory.consistency_slice_rows, budget
+            )
+            self._slice_cursor[directory.id] = last_id
+            record["files_checked"] += checked
+            record["changed"] += len(changed)
+            record["missing"] += len(deleted)
+            new = 0
+        if slice_index == self._last_slice.get(directory.id):
+            self._last_full_check[directory.id] = time.monotonic()
 
-        new_paths = fs_paths - db_paths
-        deleted_paths = db_paths - fs_paths
-        if not new_paths and not deleted_paths:
+        if not new and not changed and not deleted:
             return
-
         logger.info(
-            f"Directory {directory.path}: {len(new_paths)} new image(s), "
-            f"{len(deleted_paths)} missing image(s)"
+            f"Directory {directory.path}: {new} new image(s), "
+            f"{len(changed)} changed image(s), {len(deleted)} missing image(s)"
         )
+        if changed:
+            IndexQueueManager.instance().add_to_queue(
+                directory.id, directory.path, priority=1, image_paths=changed
+            )
+
+    @staticmethod
+    def _find_new(image_repo: ImageRepository, directory: Directory, budget: _Budget) -> int:
+        """Walk the tree in chunks and add files the database does not know.
+
+        The walk is incremental: only directories whose mtime moved since the
+        last scan are listed, since those are the only places a file can have
+        appeared.
+
+        New files are added as unindexed rows and the directory is queued for
+        a sweep, which indexes them; listing them all as hot paths would hold a
+        whole new folder in memory at once. Returns the number added.
+
+        Each chunk is charged to ``budget`` for the directories stat'ed and
+        listed to produce it, the entries it holds and the new files stat'ed.
+        """
+        added = 0
+        scanned = {"listed": 0, "skipped": 0}
+        walk = DirectoryScanner.instance().scan(directory.id, directory.path, stats=scanned)
+        directories = 0
+        while True:
+            started = time.monotonic()
+            chunk = list(itertools.islice(walk, CHUNK_SIZE))
+            visited = scanned["listed"] + scanned["skipped"]
+            if not chunk:
+                budget.spend(visited - directories, time.monotonic() - started)
+                return added
+            known = image_repo.existing_paths(chunk)
+            new = [p for p in chunk if p not in known]
+            stats = {p: s for p, s in ((p, file_stat(p)) for p in new) if s is not None}
+            if stats:
+                image_repo.add_new_images(directory.id, sorted(stats), stats)
+                # Queued per chunk so indexing starts while the walk goes on.
+                IndexQueueManager.instance().add_to_queue(directory.id, directory.path, priority=1)
+                added += len(stats)
+            budget.spend(visited - directories + len(chunk) + len(new), time.monotonic() - started)
+            directories = visited
+
+    @staticmethod
+    def _find_changed_and_deleted(image_repo: ImageRepository, directory: Directory, after_id: int,
+                                  max_rows: int, budget: _Budget) -> Tuple[List[str], List[str], int, int]:
+        """Stat up to ``max_rows`` tracked files after ``after_id``, a chunk at a time.
+
+        A file whose stat signature moved is re-embedded; one that is gone is
+        dropped. Rows that never had a signature get one recorded as-is: the
+        file may or may not have changed, and re-embedding a whole library
+        after an upgrade to find out is not worth it.
 
-        if deleted_paths:
-            # One batched delete per embedder table instead of one call per
-            # path per table: removing a thousand files used to mean thousands
-            # of individual table rewrites.
-            VectorRepository().delete_paths_all_embedders(list(deleted_paths))
-            image_repo.delete_by_paths(list(deleted_paths))
+        Returns ``(changed, deleted, last id seen, rows checked)``.
+        """
+        recursive = settings.directory.recursive_indexing
+        vectors = VectorRepository()
+        changed_total: List[str] = []
+        deleted_total: List[str] = []
+        checked = 0
+        for rows in image_repo.iter_stat_rows(directory.id, min(CHUNK_SIZE, max_rows), after_id):
+            rows = rows[:max_rows - checked]
+            started = time.monotonic()
+            deleted, changed = [], []
+            fresh: Dict[int, FileStat] = {}
+            for image_id, path, stored in rows:
+                current = file_stat(path)
+                if current is None or (not recursive and os.path.dirname(path) != directory.path):
+                    deleted.append(path)
+                elif current != stored:
+                    fresh[image_id] = current
+                    if stored is not None:
+                        changed.append(path)
 
-        if new_paths:
-            image_repo.add_new_images(directory.id, sorted(new_paths))
-            IndexQueueManager.instance().add_to_queue(directory.id, directory.path, priority=1)
+            if deleted:
+                # One batched delete per embedder table instead of one call per
+                # path per table: removing a thousand files used to mean
+                # thousands of individual table rewrites.
+                vectors.delete_paths_all_embedders(deleted)
+                image_repo.delete_by_paths(deleted)
+            if changed:
+                # Stale vectors must go or the index would hold both versions.
+                vectors.delete_paths_all_embedders(changed)
+                image_repo.mark_unindexed(changed)
+            image_repo.update_stats_by_id(fresh)
+            changed_total.extend(changed)
+            deleted_total.extend(deleted)
+            checked += len(rows)
+            after_id = rows[-1][0]
+            budget.spend(len(rows), time.monotonic() - started)
+            if checked >= max_rows:
+                break
+        return changed_total, deleted_total, after_id, checked
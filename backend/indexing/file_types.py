@@ -8,7 +8,7 @@ image.
 """
 
 import os
-from typing import Iterator, Set
+from typing import Iterator, Optional, Set, Tuple
 
 from settings import settings
 
@@ -16,10 +16,26 @@ from settings import settings
 IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".gif", ".tif", ".tiff")
 
 
+#: ``(size, mtime_ns, inode)``: what the checker compares to spot an edited
+#: file without reading it. The inode catches editors that save by writing a
+#: new file and renaming it over the old one.
+FileStat = Tuple[int, int, int]
+
+
 def is_image(path: str) -> bool:
     return path.lower().endswith(IMAGE_EXTENSIONS)
 
 
+def file_stat(path: str) -> Optional[FileStat]:
+    """The stat signature of ``path``, or None if it is gone or unreadable."""
+    try:
+        st = os.stat(path, follow_symlinks=False)
+    except OSError:
+        return None
+    # SQLite integers are signed 64-bit; some filesystems hand out larger inodes.
+    return st.st_size, st.st_mtime_ns, st.st_ino & 0x7FFFFFFFFFFFFFFF
+
+
 def iter_image_paths(root: str, recursive: bool = None) -> Iterator[str]:
     """Yield image paths under ``root``.
 
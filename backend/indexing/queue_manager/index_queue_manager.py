@@ -1,58 +1,215 @@
-import queue
+"""Batch-granular, fair scheduling of indexing work across directories.
+
+Directories used to be queued whole: once a worker picked up a 500k-image
+folder, every folder behind it waited until that one was done. The scheduler
+now hands out one batch at a time. Directories with pending work sit in a
+round-robin ring and a worker takes the head, indexes a single batch and puts
+the directory back at the tail, so every folder makes progress. Images reported
+by the watcher or by a rescan are "hot" and jump ahead of every sweep.
+
+Before each batch a worker checks in with the ``IndexingThrottle``, which holds
+it while indexing is paused or searches are running.
+
+A directory is worked on by at most one worker at a time; its pass state and
+persisted cursor are not meant to be shared.
+"""
+
+import itertools
 import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
 from monitoring import logger
 
 from concurrent.futures import ThreadPoolExecutor
 
 from core.singleton import Singleton
 from models.models import SessionLocal
-from indexing.repositories.repositories import MilvusRepository
-from indexing.services.directory_indexer import DirectoryIndexer
+from indexing.repositories.repositories import ImageRepository, MilvusRepository
+from indexing.services.directory_indexer import DirectoryIndexer, IndexPass
 from indexing.services.embedder_service import EmbedderService
+from indexing.services.process_embedder_service import ProcessEmbedderService
+from indexing.services.remote_embedder_service import RemoteEmbedderService
+from indexing.telemetry import IndexingTelemetry
+from indexing.throttle import IndexingThrottle
 from settings import settings
 
 
+@dataclass
+class _DirectoryWork:
+    directory_id: int
+    path: str
+    index_pass: Optional[IndexPass] = None
+    # Paths to index before the sweep continues; insertion-ordered.
+    hot: Dict[str, None] = field(default_factory=dict)
+    # Set when work arrives mid-pass: rows behind the cursor may have changed,
+    # so another pass runs once this one ends.
+    rerun: bool = False
+    active: bool = False
+    batches: int = 0
+
+
 @Singleton
 class IndexQueueManager:
     def __init__(self):
-        self.index_queue = queue.PriorityQueue()
-        self.processing_paths = set()
-        self.queue_lock = threading.Lock()
-        self.index_workers = ThreadPoolExecutor(max_workers=settings.directory.num_watcher_workers)
-        self.embedder_service = EmbedderService()
+        self._lock = threading.Lock()
+        self._work: Dict[int, _DirectoryWork] = {}
+        self._ring: deque = deque()
+        self._max_workers = settings.directory.num_watcher_workers
+        self._running = 0
+        self.index_workers = ThreadPoolExecutor(max_workers=self._max_workers)
+        if settings.directory.embedding_workers:
+            self.embedder_service = RemoteEmbedderService(settings.directory.embedding_workers)
+        elif settings.directory.indexing_processes > 0:
+            self.embedder_service = ProcessEmbedderService(settings.directory.indexing_processes)
+        else:
+            self.embedder_service = EmbedderService()
+        self.throttle = IndexingThrottle.instance()
         self.milvus_repo = MilvusRepository()
         self.directory_indexer = DirectoryIndexer(self.embedder_service, self.milvus_repo)
 
-    def add_to_queue(self, directory_id: int, path: str, priority: int = 0):
-        with self.queue_lock:
-            if (directory_id, path) in self.processing_paths:
-                # Already queued or being indexed; the running pass will pick up
-                # whatever changed, so there is nothing to add.
-                return
-            self.index_queue.put((priority, (directory_id, path)))
-            self.processing_paths.add((directory_id, path))
+    def add_to_queue(self, directory_id: int, path: str, priority: int = 0, image_paths: Iterable[str] = ()):
+        """Schedule indexing for a directory.
+
+        ``image_paths`` are freshly added or changed files; they are indexed
+        ahead of any sweep. A directory entering the schedule with priority 0
+        goes to the front of the ring, anything else to the back.
+        """
+        with self._lock:
+            work = self._work.get(directory_id)
+            if work is None:
+                work = self._work[directory_id] = _DirectoryWork(directory_id, path)
+                if priority <= 0:
+                    self._ring.appendleft(directory_id)
+                else:
+                    self._ring.append(directory_id)
+            elif work.index_pass is not None:
+                work.rerun = True
+            for image_path in image_paths:
+                work.hot[image_path] = None
+            spawn = self._running < self._max_workers
+            if spawn:
+                self._running += 1
         logger.debug(f"Queued directory {path} (ID: {directory_id}) with priority {priority}")
-        self.index_workers.submit(self._process_queue)
+        if spawn:
+            self.index_workers.submit(self._process_queue)
+
+    def discard(self, directory_id: int):
+        """Stop scheduling a directory (it is being removed)."""
+        with self._lock:
+            work = self._work.pop(directory_id, None)
+            if work is not None and directory_id in self._ring:
+                self._ring.remove(directory_id)
+        IndexingTelemetry.instance().forget(directory_id)
+
+    def backlog(self) -> List[Dict]:
+        """Per-directory view of the schedule, for the status endpoints."""
+        with self._lock:
+            snapshot = [
+                (w.directory_id, w.path, len(w.hot), w.active, w.batches, w.index_pass is not None)
+                for w in self._work.values()
+            ]
+            ring = list(self._ring)
+        session = SessionLocal()
+        try:
+            pending = ImageRepository(session).count_unindexed_by_directory()
+        finally:
+            session.close()
+        return [
+            {
+                "directory_id": directory_id,
+                "path": path,
+                "pending_images": pending.get(directory_id, 0),
+                "hot_images": hot,
+                "active": active,
+                "in_pass": in_pass,
+                "batches_done": batches,
+                "position": ring.index(directory_id) if directory_id in ring else None,
+            }
+            for directory_id, path, hot, active, batches, in_pass in snapshot
+        ]
+
+    def depth(self) -> Dict:
+        """Queue depth without touching the database."""
+        with self._lock:
+            return {
+                "directories": len(self._work),
+                "waiting": len(self._ring),
+                "hot_images": sum(len(w.hot) for w in self._work.values()),
+                "workers_running": self._running,
+            }
+
+    # -- workers ------------------------------------------------------------
+    def _next_work(self) -> Optional[_DirectoryWork]:
+        """Take the next directory to run a batch for, or None when idle."""
+        with self._lock:
+            if not self._ring:
+                self._running -= 1
+                return None
+            # Hot work first: freshly added files should not wait for sweeps.
+            directory_id = next((d for d in self._ring if self._work[d].hot), self._ring[0])
+            self._ring.remove(directory_id)
+            work = self._work[directory_id]
+            work.active = True
+            return work
 
     def _process_queue(self):
         while True:
-            try:
-                # Never block: `empty()` followed by a blocking `get()` races
-                # with the other workers, and the loser would park forever on an
-                # empty queue, permanently consuming a thread from the pool.
-                priority, (directory_id, path) = self.index_queue.get_nowait()
-            except queue.Empty:
+            self.throttle.wait_for_turn()
+            work = self._next_work()
+            if work is None:
                 return
-
+            more = False
             session = SessionLocal()
             try:
-                self.directory_indexer.index_directory(directory_id, path, session)
+                more = self._run_one_batch(work, session)
             except Exception as exc:
-                logger.error(f"Indexing failed for {path} (ID: {directory_id}): {exc}", exc_info=True)
+                logger.error(f"Indexing failed for {work.path} (ID: {work.directory_id}): {exc}", exc_info=True)
+                IndexingTelemetry.instance().record_error(work.directory_id, str(exc))
                 session.rollback()
+                # Drop the pass: retrying a failing batch in a tight loop helps
+                # nobody. The next watcher event or rescan queues it again.
+                with self._lock:
+                    work.index_pass = None
+                    work.hot.clear()
+                    work.rerun = False
             finally:
                 session.close()
-                with self.queue_lock:
-                    self.processing_paths.discard((directory_id, path))
-                self.index_queue.task_done()
-                logger.debug(f"Finished processing directory {path} (ID: {directory_id})")
+                self._release(work, more)
+
+    def _run_one_batch(self, work: _DirectoryWork, session) -> bool:
+        """Advance ``work`` by one batch; returns whether it has more to do."""
+        indexer = self.directory_indexer
+        if work.index_pass is None:
+            work.index_pass = indexer.start_pass(work.directory_id, work.path, session)
+
+        batch_size = self.throttle.batch_size(indexer.batch_size)
+        with self._lock:
+            hot = list(itertools.islice(work.hot, batch_size))
+            for image_path in hot:
+                work.hot.pop(image_path, None)
+
+        more = indexer.index_next_batch(work.index_pass, session, priority_paths=hot, batch_size=batch_size)
+        work.batches += 1
+        if more:
+            return True
+
+        indexer.finish_pass(work.index_pass, session)
+        logger.debug(f"Finished processing directory {work.path} (ID: {work.directory_id})")
+        with self._lock:
+            work.index_pass = None
+            if work.rerun:
+                work.rerun = False
+                return True
+            return bool(work.hot)
+
+    def _release(self, work: _DirectoryWork, more: bool):
+        with self._lock:
+            work.active = False
+            if self._work.get(work.directory_id) is not work:
+                return  # discarded while the batch ran
+            if more or work.hot or work.rerun:
+                self._ring.append(work.directory_id)
+            else:
+                del self._work[work.directory_id]
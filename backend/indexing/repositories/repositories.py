@@ -1,11 +1,31 @@
+import json
+import os
+
 from monitoring import logger
 
-from typing import Dict, List, Set
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 
 from core.vector_store import VectorStore
-from models.models import Directory, Image
+from indexing.file_types import FileStat
+from models.models import Directory, Image, ImageEmbedding, PendingVectorWrite, ScannedDirectory
+
+
+
+
+def _under(column, prefix: str):
+    """``column`` starts with ``prefix``, compared case-sensitively.
+
+    ``startswith`` compiles to ``LIKE``, which ignores ASCII case in SQLite,
+    so ``/x/A/`` would also match a sibling ``/x/a/``. A range on the raw
+    string is exact and can use the column's index: SQLite compares text
+    bytewise, and UTF-8 keeps code point order.
+    """
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return (column >= prefix) & (column < upper)
 
 
 class DirectoryRepository:
@@ -26,6 +46,17 @@ class DirectoryRepository:
     def get_all(self) -> List[Directory]:
         return self.session.query(Directory).all()
 
+    def get_index_cursor(self, directory_id: int) -> int:
+        row = self.session.query(Directory.index_cursor).filter(Directory.id == directory_id).first()
+        return (row[0] or 0) if row else 0
+
+    def set_index_cursor(self, directory_id: int, image_id: int):
+        """Record indexing progress. Not committed: the caller commits it
+        together with the batch it belongs to, so the two cannot disagree."""
+        self.session.query(Directory).filter(Directory.id == directory_id).update(
+            {Directory.index_cursor: int(image_id)}, synchronize_session=False
+        )
+
     def delete(self, directory: Directory):
         """Remove a directory and everything tracked under it.
 
@@ -38,11 +69,18 @@ class DirectoryRepository:
         self.session.query(Image).filter(Image.directory_id == directory_id).delete(
             synchronize_session=False
         )
+        self.session.query(ScannedDirectory).filter(ScannedDirectory.directory_id == directory_id).delete(
+            synchronize_session=False
+        )
         self.session.delete(directory)
         self.session.commit()
         logger.info(f"Removed directory {directory_id} and its tracked images")
 
 
+#: Filters accepted by ``ImageRepository.list_page``.
+IMAGE_STATUSES = ("indexed", "unindexed", "failed")
+
+
 class ImageRepository:
     def __init__(self, session: Session):
         self.session = session
@@ -55,16 +93,8 @@ class ImageRepository:
         rows = self.session.query(Image.path).filter(Image.directory_id == directory_id).all()
         return {row[0] for row in rows}
 
-    def add_new_images(self, directory_id: int, image_paths: List[str]) -> int:
-        """Insert the paths that aren't tracked yet and return how many were added.
-
-        Existing paths are found with a single query instead of one lookup per
-        path: adding a folder of 10k images used to issue 10k SELECTs.
-        """
-        paths = list(dict.fromkeys(image_paths))
-        if not paths:
-            return 0
-
+    def existing_paths(self, paths: List[str]) -> Set[str]:
+        """The subset of ``paths`` that is already tracked."""
         known: Set[str] = set()
         # SQLite caps the number of variables per statement (999 by default), so
         # the IN clause has to be chunked.
@@ -72,28 +102,183 @@ class ImageRepository:
             chunk = paths[start:start + 500]
             rows = self.session.query(Image.path).filter(Image.path.in_(chunk)).all()
             known.update(row[0] for row in rows)
+        return known
+
+    def add_new_images(self, directory_id: int, image_paths: List[str],
+                       stats: Optional[Dict[str, FileStat]] = None) -> int:
+        """Insert the paths that aren't tracked yet and return how many were added.
+
+        Existing paths are found with a single query instead of one lookup per
+        path: adding a folder of 10k images used to issue 10k SELECTs. ``stats``
+        optionally carries each file's stat signature to store with it.
+        """
+        added = self.stage_new_images(directory_id, image_paths, stats)
+        if added:
+            self.session.commit()
+        logger.info(f"Added {added} new images to database for directory {directory_id}")
+        return added
+
+    def stage_new_images(self, directory_id: int, image_paths: List[str],
+                         stats: Optional[Dict[str, FileStat]] = None) -> int:
+        """``add_new_images`` without the commit, for callers batching several
+        directories into one transaction."""
+        paths = list(dict.fromkeys(image_paths))
+        if not paths:
+            return 0
 
+        known = self.existing_paths(paths)
+        stats = stats or {}
         new_paths = [p for p in paths if p not in known]
         if new_paths:
-            self.session.bulk_save_objects([
-                Image(path=p, directory_id=directory_id, is_indexed=False)
-                for p in new_paths
-            ])
-            self.session.commit()
-        logger.info(f"Added {len(new_paths)} new images to database for directory {directory_id}")
+            rows = []
+            for p in new_paths:
+                size, mtime_ns, inode = stats.get(p) or (None, None, None)
+                rows.append(Image(path=p, directory_id=directory_id, is_indexed=False,
+                                  size=size, mtime_ns=mtime_ns, inode=inode))
+            self.session.bulk_save_objects(rows)
         return len(new_paths)
 
-    def get_unindexed_images(self, directory_id: int) -> List[Image]:
-        return self.session.query(Image).filter(
+    def next_unindexed_batch(
+            self,
+            directory_id: int,
+            batch_size: int,
+            after_id: int = 0,
+            until_id: Optional[int] = None,
+    ) -> List[Tuple[int, str]]:
+        """The next ``batch_size`` unindexed images after ``after_id`` as ``(id, path)``.
+
+        Keyset pagination on ``Image.id`` instead of ``.all()``: only one batch
+        of plain tuples is alive at a time, so memory stays flat however large
+        the directory is, and each page is a cheap index range scan that is not
+        disturbed by earlier rows flipping to indexed in between. ``until_id``
+        (inclusive) bounds the sweep from above.
+        """
+        query = self.session.query(Image.id, Image.path).filter(
             Image.directory_id == directory_id,
+            Image.is_indexed == False,
+            Image.id > after_id,
+        )
+        if until_id is not None:
+            query = query.filter(Image.id <= until_id)
+        return [tuple(row) for row in query.order_by(Image.id).limit(batch_size).all()]
+
+    def iter_unindexed_batches(
+            self,
+            directory_id: int,
+            batch_size: int,
+            after_id: int = 0,
+            until_id: Optional[int] = None,
+    ) -> Iterator[List[Tuple[int, str]]]:
+        """Yield ``next_unindexed_batch`` pages until the range is exhausted."""
+        last_id = after_id
+        while True:
+            rows = self.next_unindexed_batch(directory_id, batch_size, last_id, until_id)
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    def get_unindexed_by_paths(self, directory_id: int, paths: List[str]) -> List[Tuple[int, str]]:
+        """``(id, path)`` of the unindexed images among ``paths``."""
+        paths = [p for p in dict.fromkeys(paths) if p]
+        rows = []
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            rows.extend(
+                tuple(row) for row in self.session.query(Image.id, Image.path).filter(
+                    Image.directory_id == directory_id,
+                    Image.is_indexed == False,
+                    Image.path.in_(chunk),
+                ).order_by(Image.id).all()
+            )
+        return rows
+
+    def count_unindexed_by_directory(self) -> Dict[int, int]:
+        """Unindexed image count per directory, in one grouped query."""
+        rows = self.session.query(Image.directory_id, func.count(Image.id)).filter(
             Image.is_indexed == False
-        ).all()
+        ).group_by(Image.directory_id).all()
+        return {row[0]: row[1] for row in rows}
+
+    def count_progress(self, directory_id: int) -> Tuple[int, int]:
+        """``(total, indexed)`` image counts for a directory (maintained counters)."""
+        row = self.session.query(Directory.image_count, Directory.indexed_count).filter(
+            Directory.id == directory_id
+        ).first()
+        if row is None:
+            return 0, 0
+        return row[0] or 0, row[1] or 0
+
+    def has_indexed(self, directory_id: int) -> bool:
+        row = self.session.query(Image.id).filter(
+            Image.directory_id == directory_id, Image.is_indexed == True
+        ).first()
+        return row is not None
+
+    def mark_indexed(self, image_ids: List[int]) -> int:
+        """Flag images as indexed by id. Not committed (see ``set_index_cursor``)."""
+        ids = list(dict.fromkeys(image_ids))
+        updated = 0
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            updated += self.session.query(Image).filter(Image.id.in_(chunk)).update(
+                {Image.is_indexed: True, Image.index_error: None}, synchronize_session=False
+            )
+        return updated
+
+    def set_index_errors(self, errors: Dict[int, str]) -> int:
+        """Record why images could not be indexed, by id. Not committed."""
+        self.session.bulk_update_mappings(Image, [
+            {"id": image_id, "index_error": error} for image_id, error in errors.items()
+        ])
+        return len(errors)
+
+    def set_content_hashes(self, hashes: Dict[int, str]) -> int:
+        """Record content hashes by image id. Not committed."""
+        self.session.bulk_update_mappings(Image, [
+            {"id": image_id, "content_hash": digest} for image_id, digest in hashes.items()
+        ])
+        return len(hashes)
+
+    def record_content_hash(self, path: str, digest: str) -> bool:
+        """Fill in the hash of a tracked row that has none (indexed before
+        hashes were recorded). Committed; returns whether a row was updated."""
+        updated = self.session.query(Image).filter(
+            Image.path == path, Image.content_hash.is_(None)
+        ).update({Image.content_hash: digest}, synchronize_session=False)
+        self.session.commit()
+        return bool(updated)
+
+    def get_content_hashes(self, paths: List[str]) -> Dict[str, str]:
+        """Content hash per tracked path that has one."""
+        hashes: Dict[str, str] = {}
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            hashes.update(self.session.query(Image.path, Image.content_hash).filter(
+                Image.path.in_(chunk), Image.content_hash.isnot(None)
+            ).all())
+        return hashes
+
+    def content_hashes_with_prefix(self, prefix: str) -> Set[str]:
+        """Distinct content hashes starting with ``prefix`` (hex, so no escaping)."""
+        return {digest for (digest,) in self.session.query(Image.content_hash).filter(
+            Image.content_hash.like(f"{prefix}%")
+        ).distinct()}
+
+    def get_paths_by_ids(self, image_ids: List[int]) -> Dict[int, str]:
+        ids = list(dict.fromkeys(image_ids))
+        paths: Dict[int, str] = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self.session.query(Image.id, Image.path).filter(Image.id.in_(chunk)).all()
+            paths.update((row[0], row[1]) for row in rows)
+        return paths
 
     def delete(self, image: Image):
         self.session.delete(image)
         self.session.commit()
 
-    def delete_by_paths(self, paths: List[str]) -> int:
+    def delete_by_paths(self, paths: List[str], commit: bool = True) -> int:
         """Bulk-delete image rows by path (one statement per chunk)."""
         paths = [p for p in dict.fromkeys(paths) if p]
         if not paths:
@@ -104,36 +289,312 @@ class ImageRepository:
             deleted += self.session.query(Image).filter(Image.path.in_(chunk)).delete(
                 synchronize_session=False
             )
-        self.session.commit()
+        if commit:
+            self.session.commit()
         return deleted
 
     def mark_unindexed(self, paths: List[str]) -> int:
-        """Flag paths for re-embedding without loading the ORM objects."""
+        """Flag paths for re-embedding by every embedder, without loading the ORM objects."""
         paths = [p for p in dict.fromkeys(paths) if p]
         if not paths:
             return 0
         updated = 0
         for start in range(0, len(paths), 500):
             chunk = paths[start:start + 500]
+            ids = select(Image.id).where(Image.path.in_(chunk))
+            self.session.query(ImageEmbedding).filter(ImageEmbedding.image_id.in_(ids)).delete(
+                synchronize_session=False
+            )
             updated += self.session.query(Image).filter(Image.path.in_(chunk)).update(
-                {Image.is_indexed: False}, synchronize_session=False
+                {Image.is_indexed: False, Image.content_hash: None, Image.index_error: None},
+                synchronize_session=False
             )
         self.session.commit()
         return updated
 
+    def has_any_indexed(self) -> bool:
+        return self.session.query(Image.id).filter(Image.is_indexed == True).first() is not None
+
+    def paths_under(self, prefix: str) -> List[str]:
+        """Tracked paths below a directory (``prefix`` ends with a separator)."""
+        rows = self.session.query(Image.path).filter(_under(Image.path, prefix)).all()
+        return [row[0] for row in rows]
+
+    def rename_paths(self, moves: Dict[str, Tuple[str, int]]) -> int:
+        """Point rows at new paths (and directories), keeping their ids, flags
+        and per-embedder state. Rows already at a destination are replaced.
+        Not committed: the caller commits together with the vector rewrite.
+        """
+        if not moves:
+            return 0
+        self.delete_by_paths([dest for dest, _ in moves.values() if dest not in moves], commit=False)
+        ids: Dict[str, int] = {}
+        sources = list(moves)
+        for start in range(0, len(sources), 500):
+            chunk = sources[start:start + 500]
+            ids.update(self.session.query(Image.path, Image.id).filter(Image.path.in_(chunk)).all())
+        self.session.bulk_update_mappings(Image, [
+            {"id": ids[src], "path": dest, "directory_id": directory_id}
+            for src, (dest, directory_id) in moves.items() if src in ids
+        ])
+        return len(ids)
+
+    def rename_prefix(self, old_prefix: str, new_prefix: str) -> int:
+        """Rewrite every path under ``old_prefix`` in one statement. Not committed."""
+        return self.session.query(Image).filter(_under(Image.path, old_prefix)).update(
+            {Image.path: new_prefix + func.substr(Image.path, len(old_prefix) + 1)},
+            synchronize_session=False,
+        )
+
+    def list_page(self, directory_id: int, status: Optional[str] = None, after_id: int = 0,
+                  limit: int = 500) -> List[Tuple[int, str, bool, Optional[str]]]:
+        """One page of ``(id, path, is_indexed, index_error)`` in id order.
+
+        Keyset-paginated: pass the last id of a page as ``after_id`` for the
+        next, so each page is an index range scan however deep it is.
+        ``status`` is one of ``IMAGE_STATUSES`` (None for all).
+        """
+        query = self.session.query(Image.id, Image.path, Image.is_indexed, Image.index_error).filter(
+            Image.directory_id == directory_id, Image.id > after_id
+        )
+        if status == "indexed":
+            query = query.filter(Image.is_indexed == True)
+        elif status == "unindexed":
+            query = query.filter(Image.is_indexed != True)
+        elif status == "failed":
+            query = query.filter(Image.index_error.isnot(None))
+        return [tuple(row) for row in query.order_by(Image.id).limit(limit).all()]
+
+    def iter_stat_rows(self, directory_id: int, chunk_size: int = 500, after_id: int = 0) -> Iterator[List[Tuple]]:
+        """Stream ``(id, path, stat)`` rows of a directory in id order.
+
+        Keyset-paginated so a pass over a huge directory holds one chunk at a
+        time; ``stat`` is None for rows whose signature was never recorded.
+        """
+        while True:
+            rows = self.session.query(
+                Image.id, Image.path, Image.size, Image.mtime_ns, Image.inode
+            ).filter(
+                Image.directory_id == directory_id, Image.id > after_id
+            ).order_by(Image.id).limit(chunk_size).all()
+            if not rows:
+                return
+            after_id = rows[-1][0]
+            yield [
+                (row[0], row[1], None if row[2] is None else (row[2], row[3], row[4]))
+                for row in rows
+            ]
+
+    def get_stats(self, paths: List[str]) -> Dict[str, Optional[FileStat]]:
+        """Stored stat signature per tracked path (None when never recorded)."""
+        stats: Dict[str, Optional[FileStat]] = {}
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            rows = self.session.query(Image.path, Image.size, Image.mtime_ns, Image.inode).filter(
+                Image.path.in_(chunk)
+            ).all()
+            stats.update((row[0], None if row[1] is None else (row[1], row[2], row[3])) for row in rows)
+        return stats
+
+    def update_stats(self, stats: Dict[str, FileStat]) -> int:
+        """Store new stat signatures by path."""
+        paths = list(stats)
+        ids: Dict[str, int] = {}
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            ids.update(self.session.query(Image.path, Image.id).filter(Image.path.in_(chunk)).all())
+        return self.update_stats_by_id({ids[p]: stat for p, stat in stats.items() if p in ids})
+
+    def update_stats_by_id(self, stats: Dict[int, FileStat]) -> int:
+        if not stats:
+            return 0
+        self.session.bulk_update_mappings(Image, [
+            {"id": image_id, "size": size, "mtime_ns": mtime_ns, "inode": inode}
+            for image_id, (size, mtime_ns, inode) in stats.items()
+        ])
+        self.session.commit()
+        return len(stats)
+
+
+class EmbeddingStateRepository:
+    """Per-(image, embedder) indexing state; see ``models.ImageEmbedding``."""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def get_embedders(self, image_ids: List[int]) -> Dict[int, Set[str]]:
+        ids = list(dict.fromkeys(image_ids))
+        found: Dict[int, Set[str]] = {}
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            rows = self.session.query(ImageEmbedding.image_id, ImageEmbedding.embedder).filter(
+                ImageEmbedding.image_id.in_(chunk)
+            ).all()
+            for image_id, embedder in rows:
+                found.setdefault(image_id, set()).add(embedder)
+        return found
+
+    def record(self, pairs: Iterable[Tuple[int, str]]):
+        """Note stored vectors as ``(image_id, embedder)`` pairs. Not committed:
+        it belongs to the commit that marks the batch indexed."""
+        rows = [{"image_id": i, "embedder": e} for i, e in dict.fromkeys(pairs)]
+        # Two parameters per row; stay under SQLite's variable limit.
+        for start in range(0, len(rows), 400):
+            stmt = sqlite_insert(ImageEmbedding).values(rows[start:start + 400])
+            self.session.execute(stmt.on_conflict_do_nothing())
+
+    def record_paths(self, embedder_name: str, paths: List[str]) -> int:
+        """Record ``embedder_name`` for every tracked image among ``paths``, and commit."""
+        paths = [p for p in dict.fromkeys(paths) if p]
+        recorded = 0
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            ids = [row[0] for row in self.session.query(Image.id).filter(Image.path.in_(chunk)).all()]
+            self.record((image_id, embedder_name) for image_id in ids)
+            recorded += len(ids)
+        self.session.commit()
+        return recorded
+
+    def is_empty(self) -> bool:
+        return self.session.query(ImageEmbedding.image_id).first() is None
+
+    def retire(self, embedder_name: str) -> int:
+        """Forget an embedder that is no longer configured, and commit."""
+        deleted = self.session.query(ImageEmbedding).filter(
+            ImageEmbedding.embedder == embedder_name
+        ).delete(synchronize_session=False)
+        self.session.commit()
+        return deleted
+
+    def reset_incomplete(self, embedder_names: List[str]) -> int:
+        """Mark images lacking a vector from any of ``embedder_names`` as
+        unindexed, and commit. The indexer then runs only the missing models."""
+        names = list(dict.fromkeys(embedder_names))
+        if not names:
+            return 0
+        stored = (
+            select(func.count(ImageEmbedding.embedder))
+            .where(ImageEmbedding.image_id == Image.id, ImageEmbedding.embedder.in_(names))
+            .correlate(Image)
+            .scalar_subquery()
+        )
+        updated = self.session.query(Image).filter(
+            Image.is_indexed == True, stored < len(names)
+        ).update({Image.is_indexed: False}, synchronize_session=False)
+        self.session.commit()
+        return updated
+
+
+class ScanStateRepository:
+    """Per-directory scan state of indexed trees; see ``models.ScannedDirectory``."""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def load(self, directory_id: int) -> Dict[str, Tuple[Optional[int], Optional[List[str]]]]:
+        rows = self.session.query(
+            ScannedDirectory.path, ScannedDirectory.mtime_ns, ScannedDirectory.subdirs
+        ).filter(ScannedDirectory.directory_id == directory_id).all()
+        return {
+            path: (mtime_ns, None if subdirs is None else json.loads(subdirs))
+            for path, mtime_ns, subdirs in rows
+        }
+
+    def save(self, directory_id: int, records: Dict[str, Tuple[Optional[int], Optional[List[str]]]],
+             removed: List[str]):
+        """Replace the saved state of the given paths and drop ``removed`` ones."""
+        rows = [
+            {
+                "path": path,
+                "directory_id": directory_id,
+                "mtime_ns": mtime_ns,
+                "subdirs": None if subdirs is None else json.dumps(subdirs),
+            }
+            for path, (mtime_ns, subdirs) in records.items()
+        ]
+        for start in range(0, len(rows), 200):
+            stmt = sqlite_insert(ScannedDirectory).values(rows[start:start + 200])
+            self.session.execute(stmt.on_conflict_do_update(
+                index_elements=[ScannedDirectory.path],
+                set_={
+                    "directory_id": stmt.excluded.directory_id,
+                    "mtime_ns": stmt.excluded.mtime_ns,
+                    "subdirs": stmt.excluded.subdirs,
+                },
+            ))
+        for start in range(0, len(removed), 500):
+            self.session.query(ScannedDirectory).filter(
+                ScannedDirectory.path.in_(removed[start:start + 500])
+            ).delete(synchronize_session=False)
+        self.session.commit()
+
+    def forget_under(self, path: str):
+        """Drop saved state for a directory and everything below it (it moved),
+        so the next scan lists that subtree afresh. Not committed."""
+        self.session.query(ScannedDirectory).filter(
+            (ScannedDirectory.path == path)
+            | _under(ScannedDirectory.path, path.rstrip("/\\") + os.sep)
+        ).delete(synchronize_session=False)
+
+
+class OutboxRepository:
+    """Pending vector writes; see ``models.PendingVectorWrite``."""
+
+    def __init__(self, session: Session):
+        self.session = session
+
+    def record(self, directory_id: int, image_ids: List[int]):
+        """Note that vectors for these images are about to be written, and commit."""
+        ids = list(dict.fromkeys(image_ids))
+        if not ids:
+            return
+        # A batch that failed earlier in this run may have left rows behind.
+        self.clear(ids)
+        self.session.bulk_save_objects([
+            PendingVectorWrite(image_id=image_id, directory_id=directory_id) for image_id in ids
+        ])
+        self.session.commit()
+
+    def clear(self, image_ids: List[int]):
+        """Drop outbox rows. Not committed: this belongs to the batch's commit."""
+        ids = list(dict.fromkeys(image_ids))
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            self.session.query(PendingVectorWrite).filter(
+                PendingVectorWrite.image_id.in_(chunk)
+            ).delete(synchronize_session=False)
+
+    def pending(self) -> List[Tuple[int, int]]:
+        """All ``(image_id, directory_id)`` rows left behind by an interrupted run."""
+        rows = self.session.query(PendingVectorWrite.image_id, PendingVectorWrite.directory_id).all()
+        return [tuple(row) for row in rows]
+
 
 class VectorRepository:
     """Access layer for the embedded LanceDB vector store.
 
-    One table per embedder; rows are {image_path, directory_id, embedding}.
+    One table per embedder; rows are {image_path, directory_id, embedding},
+    written with upsert semantics keyed by image_path.
     """
 
     def __init__(self):
         self._store = VectorStore.instance()
 
-    def insert_entries(self, embedder_name: str, entries: List[Dict]):
-        self._store.insert(embedder_name, entries)
-        logger.debug(f"Inserted {len(entries)} entries into vector table '{embedder_name}'")
+    def upsert_entries(self, embedder_name: str, entries: List[Dict]):
+        self._store.upsert(embedder_name, entries)
+        logger.debug(f"Upserted {len(entries)} entries into vector table '{embedder_name}'")
+
+    def existing_paths(self, embedder_name: str, image_paths: List[str]) -> Set[str]:
+        return self._store.existing_paths(embedder_name, image_paths)
+
+    def table_names(self) -> List[str]:
+        return self._store.table_names()
+
+    def drop_table(self, embedder_name: str):
+        self._store.drop_table(embedder_name)
+
+    def iter_paths(self, embedder_name: str) -> Iterator[List[str]]:
+        return self._store.iter_paths(embedder_name)
 
     def delete_by_path(self, embedder_name: str, image_path: str):
         self._store.delete_by_path(embedder_name, image_path)
@@ -162,6 +623,25 @@ class VectorRepository:
             except Exception as exc:
                 logger.error(f"Failed to delete vectors from '{embedder_name}': {exc}", exc_info=True)
 
+    def rename_paths_all_embedders(self, moves: Dict[str, Tuple[str, int]]):
+        """Move vectors to new paths in every embedder table.
+
+        Unlike deletes, failures propagate: a half-applied rename must not be
+        committed on the SQLite side.
+        """
+        from core import embedder_manager
+
+        if not moves:
+            return
+        for embedder_name in embedder_manager.get_image_embedders():
+            self._store.rename_paths(embedder_name, moves)
+
+    def rename_prefix_all_embedders(self, old_prefix: str, new_prefix: str):
+        from core import embedder_manager
+
+        for embedder_name in embedder_manager.get_image_embedders():
+            self._store.rename_prefix(embedder_name, old_prefix, new_prefix)
+
     def delete_directory_all_embedders(self, directory_id: int):
         from core import embedder_manager
 
@@ -181,9 +661,15 @@ class VectorRepository:
     def list_all_paths(self, embedder_name: str) -> List[str]:
         return self._store.list_all_paths(embedder_name)
 
+    def version(self, embedder_name: str) -> int:
+        return self._store.version(embedder_name)
+
     def search(self, embedder_name: str, vector, limit: int, directory_ids=None) -> List[str]:
         return self._store.search(embedder_name, vector, limit, directory_ids)
 
+    def search_many(self, embedder_name: str, vectors, limit: int, directory_ids=None) -> List[List[str]]:
+        return self._store.search_many(embedder_name, vectors, limit, directory_ids)
+
 
 # Backwards-compatible alias for existing imports.
 MilvusRepository = VectorRepository
\ No newline at end of file
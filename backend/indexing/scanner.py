@@ -0,0 +1,138 @@
+"""Parallel, incremental discovery of image files under an indexed directory.
+
+``iter_image_paths`` lists one directory at a time on a single thread. On a NAS
+with a deep tree every listing is a network round-trip, so the full rescans run
+by ``add_directory`` and by every consistency pass took minutes.
+
+``DirectoryScanner`` fans subdirectories out over a thread pool and remembers,
+per directory, its mtime and the subdirectories it had. A directory's mtime
+changes whenever an entry is created, removed or renamed directly inside it.
+If the mtime has not changed, no file can have appeared there, so the scanner
+reuses the recorded subdirectory list instead of listing the directory again.
+A rescan therefore costs one ``stat`` per directory plus a listing of each
+changed one.
+
+Changes to a file's content do not touch its directory's mtime; the consistency
+checker catches those by comparing the file's own stat signature.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.singleton import Singleton
+from indexing.file_types import is_image
+from models.models import SessionLocal
+from indexing.repositories.repositories import ScanStateRepository
+from monitoring import logger
+from settings import settings
+
+# Directory mtimes this close to the scan's start are not trusted: a file added
+# in the same clock tick as the listing would otherwise be missed for good.
+_MTIME_SLACK_NS = 2_000_000_000
+
+# (mtime_ns or None, subdirectory names or None if listed non-recursively)
+_Record = Tuple[Optional[int], Optional[List[str]]]
+
+
+@Singleton
+class DirectoryScanner:
+    def __init__(self):
+        workers = max(1, settings.directory.scan_workers)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan")
+        # One scan per root at a time: two would race on its saved state.
+        self._root_locks: Dict[int, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def scan(self, directory_id: int, root: str, recursive: Optional[bool] = None,
+             incremental: bool = True, stats: Optional[Dict[str, int]] = None) -> Iterator[str]:
+        """Yield image paths under ``root``.
+
+        With ``incremental`` only images in directories that changed since the
+        last scan are yielded; otherwise every image is. Either way the
+        directory state is saved once the generator is exhausted, so callers
+        must handle every path before finishing the iteration.
+
+        ``stats``, if given, is kept up to date with the number of directories
+        ``listed`` and ``skipped`` (stat'ed only), so a caller can pace itself.
+        """
+        if recursive is None:
+            recursive = settings.directory.recursive_indexing
+        with self._locks_guard:
+            lock = self._root_locks.setdefault(directory_id, threading.Lock())
+        with lock:
+            session = SessionLocal()
+            try:
+                repo = ScanStateRepository(session)
+                previous = repo.load(directory_id) if incremental else {}
+                seen: Dict[str, _Record] = {}
+                stats = stats if stats is not None else {}
+                stats.setdefault("listed", 0)
+                stats.setdefault("skipped", 0)
+                yield from self._walk(root, recursive, previous, seen, stats)
+                removed = [p for p in previous if p not in seen]
+                repo.save(directory_id, seen, removed)
+                logger.debug(
+                    f"Scanned {root}: {stats['listed']} directories listed, "
+                    f"{stats['skipped']} unchanged"
+                )
+            finally:
+                session.close()
+
+    def _walk(self, root: str, recursive: bool, previous: Dict[str, _Record],
+              seen: Dict[str, _Record], stats: Dict[str, int]) -> Iterator[str]:
+        started_ns = time.time_ns()
+        pending = {self._pool.submit(self._visit, root, recursive, previous.get(root), started_ns)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result is None:
+                    continue
+                path, record, images, listed = result
+                seen[path] = record
+                stats["listed" if listed else "skipped"] += 1
+                if recursive:
+                    for name in record[1] or ():
+                        child = os.path.join(path, name)
+                        pending.add(self._pool.submit(
+                            self._visit, child, recursive, previous.get(child), started_ns
+                        ))
+                yield from images
+
+    @staticmethod
+    def _visit(path: str, recursive: bool, previous: Optional[_Record], started_ns: int):
+        """List ``path`` unless its mtime shows nothing was added since last time.
+
+        Returns ``(path, record, image paths, listed)`` or None if the
+        directory is gone or unreadable.
+        """
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+        if (previous is not None and previous[0] == mtime_ns
+                and (previous[1] is not None or not recursive)):
+            return path, previous, [], False
+
+        images, subdirs = [], ([] if recursive else None)
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file(follow_symlinks=False):
+                            if is_image(entry.name):
+                                images.append(entry.path)
+                        # Symlinked directories are not followed: they can point
+                        # back into the tree (see file_types.iter_image_paths).
+                        elif recursive and entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            return None
+        trusted = mtime_ns < started_ns - _MTIME_SLACK_NS
+        return path, (mtime_ns if trusted else None, subdirs), images, True
+
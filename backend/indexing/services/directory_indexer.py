@@ -1,71 +1,258 @@
+from typing import Dict, List, Optional, Tuple
+
 from monitoring import logger
 from sqlalchemy.orm import Session
 from models.models import Directory
-from indexing.repositories.repositories import MilvusRepository, ImageRepository
+from indexing.repositories.repositories import DirectoryRepository, EmbeddingStateRepository, MilvusRepository, \
+    ImageRepository, OutboxRepository
 from indexing.services.embedder_service import EmbedderService
+from indexing.telemetry import IndexingTelemetry
 from settings import settings
 
 
+class IndexPass:
+    """One indexing pass over a directory, advanced a batch at a time.
+
+    A pass resumes from the directory's persisted cursor and then wraps around
+    for rows before it: those were either handled by an earlier run or were
+    marked for re-indexing since, and both deserve another look.
+    """
+
+    def __init__(self, directory_id: int, directory_path: str, start_id: int = 0):
+        self.directory_id = directory_id
+        self.directory_path = directory_path
+        self.sweeps: List[Tuple[int, Optional[int]]] = [(start_id, None)]
+        if start_id:
+            self.sweeps.append((0, start_id))
+        self.after_id = start_id
+        self.seen_any = False
+        self.indexed_any = False
+        self.batches = 0
+
+    @property
+    def done(self) -> bool:
+        return not self.sweeps
+
+
 class DirectoryIndexer:
     def __init__(self, embedder_service: EmbedderService, milvus_repo: MilvusRepository):
         self.embedder_service = embedder_service
         self.milvus_repo = milvus_repo
 
+    @property
+    def batch_size(self) -> int:
+        # One batch per worker process per page, so every worker stays busy.
+        return settings.directory.batch_size * self.embedder_service.parallelism
+
     def index_directory(self, directory_id: int, directory_path: str, session: Session):
+        """Index everything pending in a directory in one go."""
+        index_pass = self.start_pass(directory_id, directory_path, session)
+        while self.index_next_batch(index_pass, session):
+            pass
+        self.finish_pass(index_pass, session)
+
+    def start_pass(self, directory_id: int, directory_path: str, session: Session) -> IndexPass:
         logger.info(f"Starting indexing for directory {directory_path} (ID: {directory_id})")
+        total, indexed = ImageRepository(session).count_progress(directory_id)
+        IndexingTelemetry.instance().start_directory(directory_id, directory_path, total, indexed)
+        start_id = DirectoryRepository(session).get_index_cursor(directory_id)
+        if start_id:
+            logger.info(f"Resuming indexing of {directory_path} after image ID {start_id}")
+        return IndexPass(directory_id, directory_path, start_id)
+
+    def index_next_batch(self, index_pass: IndexPass, session: Session, priority_paths: List[str] = (),
+                         batch_size: Optional[int] = None) -> bool:
+        """Index one batch and commit it; returns False once the pass is exhausted.
+
+        ``priority_paths`` (freshly added or changed files) are indexed ahead of
+        the sweep, without moving its cursor. ``batch_size`` overrides the
+        configured size for this batch.
+        """
+        batch_size = batch_size or self.batch_size
         image_repo = ImageRepository(session)
-        unindexed_images = image_repo.get_unindexed_images(directory_id)
-        total_images = len(unindexed_images)
-        if total_images == 0:
+        if priority_paths:
+            batch = image_repo.get_unindexed_by_paths(index_pass.directory_id, list(priority_paths))
+            if batch:
+                self._run_batch(index_pass, batch, image_repo)
+                session.commit()
+            return not index_pass.done
+
+        while index_pass.sweeps:
+            _, until_id = index_pass.sweeps[0]
+            batch = image_repo.next_unindexed_batch(
+                index_pass.directory_id, batch_size, index_pass.after_id, until_id
+            )
+            if batch:
+                self._run_batch(index_pass, batch, image_repo)
+                index_pass.after_id = batch[-1][0]
+                DirectoryRepository(session).set_index_cursor(index_pass.directory_id, index_pass.after_id)
+                session.commit()
+                return True
+            index_pass.sweeps.pop(0)
+            if index_pass.sweeps:
+                index_pass.after_id = index_pass.sweeps[0][0]
+        return False
+
+    def _run_batch(self, index_pass: IndexPass, batch: List[Tuple[int, str]], image_repo: ImageRepository):
+        index_pass.seen_any = True
+        index_pass.batches += 1
+        logger.debug(f"Processing batch {index_pass.batches} with {len(batch)} images")
+        indexed = self._index_batch(index_pass.directory_id, batch, image_repo)
+        if indexed:
+            index_pass.indexed_any = True
+        IndexingTelemetry.instance().record_batch(index_pass.directory_id, indexed, len(batch) - indexed)
+
+    def finish_pass(self, index_pass: IndexPass, session: Session):
+        directory_id, directory_path = index_pass.directory_id, index_pass.directory_path
+        DirectoryRepository(session).set_index_cursor(directory_id, 0)
+        session.commit()
+
+        telemetry = IndexingTelemetry.instance()
+        directory = session.get(Directory, directory_id)
+        if directory is None:
+            # Removed while the pass was running.
+            telemetry.forget(directory_id)
+            return
+        # Re-sync: images added by the watcher mid-pass were not in the totals.
+        total, indexed = ImageRepository(session).count_progress(directory_id)
+        telemetry.start_directory(directory_id, directory_path, total, indexed)
+
+        if not index_pass.seen_any:
             logger.info(f"No images to index in directory {directory_path}")
+            # Crash recovery may have settled the last batch of a pass without
+            # running it, so the directory can be complete without having been
+            # flagged as such.
+            if not directory.is_indexed and ImageRepository(session).has_indexed(directory_id):
+                directory.is_indexed = True
+                session.commit()
             return
 
-        batch_size = settings.directory.batch_size
-        indexed_any = False
-        for i in range(0, total_images, batch_size):
-            batch = unindexed_images[i:i + batch_size]
-            batch_paths = [img.path for img in batch]
-            logger.debug(f"Processing batch {i // batch_size + 1} with {len(batch)} images")
+        # Mark the directory as fully indexed only if we actually stored vectors.
+        if index_pass.indexed_any:
+            directory.is_indexed = True
+            session.commit()
+            logger.info(f"Completed indexing for directory {directory_path}")
+        else:
+            logger.error(
+                f"Indexing produced no embeddings for '{directory_path}'; "
+                "directory left unindexed (are the embedder models loaded?)"
+            )
+
+    def recover_pending_writes(self, session: Session):
+        """Settle batches whose vector writes were interrupted by a crash.
+
+        Every vector that reached its table is recorded without re-running
+        inference. Images holding a vector from every embedder are marked
+        indexed; the rest stay unindexed, and the next pass runs only the
+        models they are still missing.
+        """
+        outbox = OutboxRepository(session)
+        pending = outbox.pending()
+        if not pending:
+            return
+        embedder_names = list(self.embedder_service.embedders)
+        if not embedder_names:
+            # Nothing to check against yet; keep the rows for the next start.
+            return
 
-            # Compute embeddings for the current batch in one forward pass per embedder
-            embeddings = self.embedder_service.compute_batch_embeddings(batch_paths)
+        image_repo = ImageRepository(session)
+        state = EmbeddingStateRepository(session)
+        paths = image_repo.get_paths_by_ids([image_id for image_id, _ in pending])
+        ids_by_path = {path: image_id for image_id, path in paths.items()}
+        stored_count: Dict[int, int] = {}
+        for embedder_name in embedder_names:
+            stored = self.milvus_repo.existing_paths(embedder_name, list(ids_by_path))
+            state.record((ids_by_path[p], embedder_name) for p in stored)
+            for p in stored:
+                stored_count[ids_by_path[p]] = stored_count.get(ids_by_path[p], 0) + 1
+
+        settled = [image_id for image_id, n in stored_count.items() if n == len(embedder_names)]
+        image_repo.mark_indexed(settled)
+        outbox.clear([image_id for image_id, _ in pending])
+        session.commit()
+        logger.info(
+            f"Recovered {len(pending)} interrupted vector write(s): {len(settled)} already "
+            f"stored, {len(pending) - len(settled)} left for re-indexing"
+        )
+
+    def _index_batch(self, directory_id: int, batch: List[Tuple[int, str]], image_repo: ImageRepository) -> int:
+        """Embed one batch of ``(id, path)`` rows and store its vectors.
 
-            # Accumulate Milvus entries for each embedder in this batch
-            embedder_batches = {}
-            for img in batch:
+        Each image only goes through the embedders it has no vector from yet,
+        so a newly added model backfills without re-running the others.
+        Returns how many images in the batch were indexed. The caller commits.
+        """
+        active = list(self.embedder_service.embedders)
+        if not active:
+            logger.warning("No embedders loaded; leaving batch unindexed")
+            return 0
+
+        # Group images by the set of embedders they are missing: each group is
+        # decoded once and run through exactly those models.
+        state = EmbeddingStateRepository(image_repo.session)
+        have = state.get_embedders([image_id for image_id, _ in batch])
+        groups: Dict[Tuple[str, ...], List[Tuple[int, str]]] = {}
+        for image_id, path in batch:
+            missing = tuple(n for n in active if n not in have.get(image_id, ()))
+            groups.setdefault(missing, []).append((image_id, path))
+
+        # Images that already hold every vector (e.g. settled by recovery) only
+        # need their flag flipped.
+        indexed_ids = [image_id for image_id, _ in groups.pop((), [])]
+        embedder_batches = {}
+        stored_pairs = []
+        written_ids = []
+        content_hashes: Dict[str, str] = {}
+        failures: Dict[int, str] = {}
+        for names, rows in groups.items():
+            # Compute embeddings for the group in one forward pass per embedder
+            embeddings = self.embedder_service.compute_batch_embeddings(
+                [path for _, path in rows], embedder_names=names, content_hashes=content_hashes
+            )
+            for image_id, path in rows:
                 # Only accept images for which at least one embedder produced a
                 # usable embedding. Without this guard an image could be marked
                 # indexed while no vector is stored (e.g. if embedders were not
                 # yet loaded), silently breaking search.
-                img_embeddings = embeddings.get(img.path) or {}
+                img_embeddings = embeddings.get(path) or {}
                 usable = {n: e for n, e in img_embeddings.items() if e is not None}
                 if not usable:
-                    logger.warning(f"No embeddings produced for '{img.path}'; leaving it unindexed")
+                    logger.warning(f"No embeddings produced for '{path}'; leaving it unindexed")
+                    failures[image_id] = (
+                        "No embedder produced a vector" if path in content_hashes
+                        else "Could not read or decode the file"
+                    )
                     continue
                 for embedder_name, emb in usable.items():
                     embedder_batches.setdefault(embedder_name, []).append({
                         "directory_id": directory_id,
-                        "image_path": img.path,
+                        "image_path": path,
                         "embedding": emb
                     })
-                # Mark the image as indexed in the DB
-                img.is_indexed = True
-                indexed_any = True
+                    stored_pairs.append((image_id, embedder_name))
+                written_ids.append(image_id)
 
-            # Insert all embeddings for each embedder in one batch call
-            for embedder_name, entries in embedder_batches.items():
-                self.milvus_repo.insert_entries(embedder_name, entries)
+        if written_ids:
+            # Record the intent before writing vectors: if we crash between the
+            # two stores, recovery knows which images to reconcile.
+            outbox = OutboxRepository(image_repo.session)
+            with IndexingTelemetry.instance().stage("write", len(written_ids)):
+                outbox.record(directory_id, written_ids)
 
-            session.commit()
+                # Upsert all embeddings for each embedder in one batch call
+                for embedder_name, entries in embedder_batches.items():
+                    self.milvus_repo.upsert_entries(embedder_name, entries)
 
-        # Mark the directory as fully indexed only if we actually stored vectors.
-        if indexed_any:
-            directory = session.query(Directory).get(directory_id)
-            directory.is_indexed = True
-            session.commit()
-            logger.info(f"Completed indexing for directory {directory_path}")
-        else:
-            logger.error(
-                f"Indexing produced no embeddings for '{directory_path}'; "
-                "directory left unindexed (are the embedder models loaded?)"
-            )
+            # Per-embedder state, the indexed flag and the outbox all settle in
+            # the caller's commit.
+            state.record(stored_pairs)
+            outbox.clear(written_ids)
+            indexed_ids.extend(written_ids)
+
+        image_repo.mark_indexed(indexed_ids)
+        image_repo.set_index_errors(failures)
+        # Keys of the thumbnails written while decoding (core/thumbnails.py).
+        image_repo.set_content_hashes({
+            image_id: content_hashes[path] for image_id, path in batch if path in content_hashes
+        })
+        return len(indexed_ids)
@@ -1,8 +1,11 @@
 from monitoring import logger
-from typing import Dict, List
-from PIL import Image as PImage
+from typing import Dict, Iterable, List, Optional
+import numpy as np
 import torch
 from core import embedder_manager
+from core.inference import PRIORITY_INDEXING
+from core.thumbnails import ThumbnailStore, read_image
+from indexing.telemetry import IndexingTelemetry
 
 class EmbedderService:
     def __init__(self):
@@ -16,49 +19,83 @@ class EmbedderService:
     def embedders(self):
         return embedder_manager.get_image_embedders()
 
-    def compute_batch_embeddings(self, image_paths: List[str]) -> Dict[str, Dict[str, List[float]]]:
+    @property
+    def parallelism(self) -> int:
+        """How many batches one ``compute_batch_embeddings`` call can work on at once."""
+        return 1
+
+    def _forward(self, embedder, batch: torch.Tensor) -> np.ndarray:
+        """Run one preprocessed ``[N, 3, H, W]`` batch through ``embedder``.
+
+        Goes through the embedder's inference server, which batches it with
+        other callers and lets queries go first.
+        """
+        return embedder.server.run(batch, priority=PRIORITY_INDEXING)
+
+    def compute_batch_embeddings(
+            self,
+            image_paths: List[str],
+            embedder_names: Optional[Iterable[str]] = None,
+            content_hashes: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Dict[str, List[float]]]:
+        """Embed ``image_paths`` with every loaded embedder, or only with
+        ``embedder_names`` when given (backfilling a newly added model).
+
+        Thumbnails are written from the decoded images on the way; the content
+        hash keying them is filled into ``content_hashes`` per path.
+        """
+        embedders = self.embedders
+        if embedder_names is not None:
+            embedders = {n: embedders[n] for n in embedder_names if n in embedders}
+
+        telemetry = IndexingTelemetry.instance()
+
         # Load images from disk
         images = []
-        for path in image_paths:
-            try:
-                img = PImage.open(path).convert("RGB")
-                images.append(img)
-                logger.debug(f"Loaded image: {path}")
-            except Exception as e:
-                logger.error(f"Error loading image {path}: {e}", exc_info=True)
-                images.append(None)  # Placeholder in case of failure
+        thumbnails = {}
+        with telemetry.stage("decode", len(image_paths)):
+            for path in image_paths:
+                try:
+                    img, digest, orientation = read_image(path)
+                    images.append(img)
+                    thumbnails[digest] = (img, orientation)
+                    if content_hashes is not None:
+                        content_hashes[path] = digest
+                    logger.debug(f"Loaded image: {path}")
+                except Exception as e:
+                    logger.error(f"Error loading image {path}: {e}", exc_info=True)
+                    images.append(None)  # Placeholder in case of failure
+        with telemetry.stage("thumbnails", len(thumbnails)):
+            ThumbnailStore.instance().save_batch(thumbnails)
+        del thumbnails
 
         # For each embedder, process all images at once
         batch_embeddings = {}
-        for embedder_name, embedder in self.embedders.items():
+        for embedder_name, embedder in embedders.items():
             try:
                 # Preprocess each image; if an image failed to load, replace it with a zero tensor
-                processed = []
-                for img in images:
-                    if img is not None:
-                        processed.append(embedder.preprocess(img))
-                    else:
-                        # Create a zero tensor with the expected input shape.
-                        # If available, retrieve the expected input size from the model's config.
-                        # For simplicity, we assume a fallback size of (3, 224, 224)
-                        processed.append(torch.zeros((3, 224, 224)))
-                # Stack the processed images into a batch tensor
-                batch = torch.stack(processed, dim=0).to(embedder.device)
+                with telemetry.stage("preprocess", len(images)):
+                    processed = []
+                    for img in images:
+                        if img is not None:
+                            processed.append(embedder.preprocess(img))
+                        else:
+                            # Create a zero tensor with the expected input shape.
+                            # If available, retrieve the expected input size from the model's config.
+                            # For simplicity, we assume a fallback size of (3, 224, 224)
+                            processed.append(torch.zeros((3, 224, 224)))
+                    # Stack the processed images into a batch tensor
+                    batch = torch.stack(processed, dim=0)
+                    del processed
 
-                with torch.inference_mode():
-                    # Forward pass: DataParallel will split the batch among GPUs if applicable
-                    output = embedder.model(batch)
                 # Assume output shape is [batch_size, embedding_dim]
-                embeddings_np = output.detach().cpu().numpy()
+                with telemetry.stage(f"embed:{embedder_name}", len(images)):
+                    embeddings_np = self._forward(embedder, batch)
                 # Convert each sample's embedding to a list
                 embeddings_list = embeddings_np.tolist()
                 batch_embeddings[embedder_name] = embeddings_list
                 logger.debug(f"Computed batch embeddings for embedder {embedder_name}")
-                # Release activations/inputs promptly so peak memory stays bounded
-                # when several large models run over the same batch.
-                del batch, output, embeddings_np, processed
-                if embedder.device.type == "cuda":
-                    torch.cuda.empty_cache()
+                del batch, embeddings_np
             except Exception as e:
                 logger.error(f"Error processing batch with embedder {embedder_name}: {e}", exc_info=True)
                 batch_embeddings[embedder_name] = [None] * len(image_paths)
@@ -68,5 +105,5 @@ class EmbedderService:
         embeddings = {}
         for idx, path in enumerate(image_paths):
             embeddings[path] = {embedder_name: batch_embeddings[embedder_name][idx]
-                                for embedder_name in self.embedders.keys()}
+                                for embedder_name in embedders.keys()}
         return embeddings
@@ -6,10 +6,11 @@ from core import embedder_manager
 from core.singleton import Singleton
 from models.models import SessionLocal
 from indexing.consistency.consistency_checker import ConsistencyChecker
-from indexing.file_types import scan_image_paths
 from indexing.watchers.file_watcher_service import FileWatcherService
 from indexing.queue_manager.index_queue_manager import IndexQueueManager
-from indexing.repositories.repositories import DirectoryRepository, ImageRepository
+from indexing.scanner import DirectoryScanner
+from indexing.repositories.repositories import DirectoryRepository, EmbeddingStateRepository, ImageRepository, \
+    VectorRepository
 from settings import settings
 
 
@@ -37,8 +38,9 @@ class ImageIndexingService:
             if not directory:
                 directory = directory_repo.create(path)
 
-            # Find and add images from the filesystem
-            image_paths = sorted(scan_image_paths(path))
+            # Find and add images from the filesystem. A full scan, which also
+            # records the tree's state so later rescans can be incremental.
+            image_paths = sorted(DirectoryScanner.instance().scan(directory.id, path, incremental=False))
             image_repo = ImageRepository(session)
             image_repo.add_new_images(directory.id, image_paths)
 
@@ -65,6 +67,7 @@ class ImageIndexingService:
             directory_repo = DirectoryRepository(session)
             directory = directory_repo.get_by_path(path)
             if directory:
+                self.index_queue_manager.discard(directory.id)
                 # Drops the directory's vectors and image rows as well.
                 directory_repo.delete(directory)
         except Exception as e:
@@ -73,6 +76,55 @@ class ImageIndexingService:
         finally:
             session.close()
 
+    def sync_embedders(self) -> int:
+        """Align per-embedder indexing state with the embedders now loaded.
+
+        Called after every model load. Tables of embedders that are no longer
+        configured are dropped, and images missing a vector from a newly added
+        one are flagged so indexing backfills just that model. Returns how many
+        images were flagged.
+        """
+        active = list(self.embedders)
+        if not active:
+            return 0
+        session = SessionLocal()
+        try:
+            state = EmbeddingStateRepository(session)
+            vectors = VectorRepository()
+            if state.is_empty() and ImageRepository(session).has_any_indexed():
+                # Libraries indexed before per-embedder state existed: derive it
+                # from what the vector tables actually hold.
+                for name in vectors.table_names():
+                    recorded = sum(state.record_paths(name, chunk) for chunk in vectors.iter_paths(name))
+                    logger.info(f"Recorded {recorded} existing vector(s) for embedder '{name}'")
+
+            for name in vectors.table_names():
+                if name not in active:
+                    logger.info(f"Embedder '{name}' is no longer configured; retiring its table")
+                    vectors.drop_table(name)
+                    state.retire(name)
+
+            flagged = state.reset_incomplete(active)
+            if flagged:
+                logger.info(f"{flagged} image(s) need vectors from newly added embedders")
+            return flagged
+        except Exception as exc:
+            logger.error(f"Syncing embedder state failed: {exc}", exc_info=True)
+            session.rollback()
+            return 0
+        finally:
+            session.close()
+
+    def requeue_all(self):
+        """Queue every tracked directory for an indexing pass."""
+        session = SessionLocal()
+        try:
+            for directory in DirectoryRepository(session).get_all():
+                if os.path.exists(directory.path):
+                    self.index_queue_manager.add_to_queue(directory.id, directory.path, priority=1)
+        finally:
+            session.close()
+
     def start(self):
         logger.info("Starting ImageIndexingService")
         self.file_watcher_service.start()
@@ -80,6 +132,13 @@ class ImageIndexingService:
         # Re-queue and re-watch all tracked directories from the database.
         session = SessionLocal()
         try:
+            # Settle writes a previous run left half-done before anything new
+            # is queued, so no batch is embedded twice.
+            try:
+                self.index_queue_manager.directory_indexer.recover_pending_writes(session)
+            except Exception as exc:
+                logger.error(f"Recovering pending vector writes failed: {exc}", exc_info=True)
+                session.rollback()
             directory_repo = DirectoryRepository(session)
             directories = directory_repo.get_all()
             for directory in directories:
@@ -0,0 +1,225 @@
+"""Data-parallel indexing across worker processes.
+
+``EmbedderService`` runs inside the API process, where every indexing thread
+shares one copy of each model and image decoding, preprocessing and the Python
+glue all contend for the GIL. This service spreads each batch over N worker
+processes instead. Every worker loads its own copy of the configured embedders
+and gets an even share of the CPU threads, so throughput scales with cores
+rather than with how well one interpreter can keep torch fed.
+
+The coordinator splits a page of images into contiguous image-id ranges, one
+per worker. Workers hand vectors back through a shared-memory block rather than
+pickling them through the result pipe.
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from indexing.services.embedder_service import EmbedderService
+from indexing.telemetry import IndexingTelemetry
+from monitoring import logger
+from settings import settings
+
+# Layout of a result block: {embedder_name: (column offset, dim)}; None marks an
+# embedder that failed for the whole chunk.
+_Layout = Dict[str, Optional[Tuple[int, int]]]
+
+
+def _init_worker(threads: int):
+    """Runs once in each worker process: pin its thread share and load models."""
+    import torch
+
+    torch.set_num_threads(threads)
+    from core import embedder_manager, thread_budget
+
+    # Inference leases in this process must stay within the pinned share.
+    thread_budget.pin(threads)
+
+    embedder_manager.load()
+
+
+def _embed_chunk(image_paths: List[str], embedder_names: Optional[List[str]]):
+    """Embed one chunk in a worker and publish the vectors in shared memory.
+
+    Returns ``(block name, layout, failed rows, content hashes)``; the
+    coordinator owns the block from then on and unlinks it once copied out.
+    """
+    content_hashes: Dict[str, str] = {}
+    embeddings = EmbedderService().compute_batch_embeddings(image_paths, embedder_names, content_hashes)
+
+    layout: _Layout = {}
+    width = 0
+    names = list(next(iter(embeddings.values()), {}).keys()) if embeddings else []
+    for name in names:
+        first = next((embeddings[p][name] for p in image_paths if embeddings[p][name] is not None), None)
+        if first is None:
+            layout[name] = None
+            continue
+        layout[name] = (width, len(first))
+        width += len(first)
+
+    failed = []
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(image_paths) * width * 4))
+    try:
+        matrix = np.ndarray((len(image_paths), width), dtype=np.float32, buffer=block.buf)
+        for row, path in enumerate(image_paths):
+            for name, slot in layout.items():
+                if slot is None:
+                    continue
+                vector = embeddings[path][name]
+                if vector is None:
+                    failed.append((row, name))
+                    continue
+                offset, dim = slot
+                matrix[row, offset:offset + dim] = vector
+        del matrix
+        return block.name, layout, failed, content_hashes
+    finally:
+        block.close()
+
+
+def _unlink(block_name: str):
+    try:
+        block = shared_memory.SharedMemory(name=block_name)
+    except FileNotFoundError:
+        return
+    block.close()
+    block.unlink()
+
+
+class ProcessEmbedderService(EmbedderService):
+    """``EmbedderService`` whose batch embedding runs in a pool of processes."""
+
+    def __init__(self, processes: int):
+        super().__init__()
+        self._processes = max(1, int(processes))
+        self._threads = max(1, (os.cpu_count() or 1) // self._processes)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._signature = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    @property
+    def parallelism(self) -> int:
+        return self._processes
+
+    def _config_signature(self):
+        from core import setup_manager
+
+        embedders = tuple((e.name, e.model_name) for e in settings.image_embedders)
+        return embedders, setup_manager.use_gpu()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """The worker pool, restarted whenever the embedder config changes
+        (profile switch, GPU toggle) so workers never run stale models."""
+        signature = self._config_signature()
+        with self._lock:
+            if self._executor is not None and signature == self._signature:
+                return self._executor
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            logger.info(
+                f"Starting {self._processes} indexing worker process(es) "
+                f"with {self._threads} thread(s) each"
+            )
+            # spawn, not fork: forking a process that already holds torch
+            # thread pools (and possibly a CUDA context) is not safe.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self._processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self._threads,),
+            )
+            self._signature = signature
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def compute_batch_embeddings(
+            self,
+            image_paths: List[str],
+            embedder_names: Optional[Iterable[str]] = None,
+            content_hashes: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Dict[str, List[float]]]:
+        names = list(embedder_names) if embedder_names is not None else list(self.embedders)
+        if not image_paths or not names:
+            return super().compute_batch_embeddings(image_paths, names, content_hashes)
+
+        # Contiguous slices of an id-ordered page are image-id ranges.
+        size = -(-len(image_paths) // self._processes)
+        chunks = [image_paths[i:i + size] for i in range(0, len(image_paths), size)]
+        futures = []
+        try:
+            pool = self._pool()
+            # Decode, preprocess and inference all happen inside the workers,
+            # whose own counters are not visible here.
+            with IndexingTelemetry.instance().stage("workers", len(image_paths)):
+                futures = [pool.submit(_embed_chunk, chunk, names) for chunk in chunks]
+                results = [f.result() for f in futures]
+        except BrokenProcessPool as exc:
+            self._discard(futures)
+            logger.error(f"Indexing worker process died ({exc}); embedding this batch in-process")
+            self.shutdown()
+            return super().compute_batch_embeddings(image_paths, names, content_hashes)
+        except BaseException:
+            self._discard(futures)
+            raise
+
+        embeddings: Dict[str, Dict[str, List[float]]] = {}
+        for i, (chunk, (block_name, layout, failed, hashes)) in enumerate(zip(chunks, results)):
+            try:
+                embeddings.update(self._collect(chunk, names, block_name, layout, failed))
+            except BaseException:
+                for later in results[i + 1:]:
+                    _unlink(later[0])
+                raise
+            if content_hashes is not None:
+                content_hashes.update(hashes)
+        return embeddings
+
+    @staticmethod
+    def _discard(futures):
+        """Unlink the result blocks of chunks that finished when another failed.
+
+        Waits for chunks still running, since they publish a block on the way out.
+        """
+        wait(futures)
+        for future in futures:
+            if not future.cancelled() and future.exception() is None:
+                _unlink(future.result()[0])
+
+    @staticmethod
+    def _collect(chunk: List[str], names: List[str], block_name: str, layout: _Layout, failed) -> Dict:
+        block = shared_memory.SharedMemory(name=block_name)
+        try:
+            width = sum(slot[1] for slot in layout.values() if slot is not None)
+            matrix = np.ndarray((len(chunk), width), dtype=np.float32, buffer=block.buf).copy()
+        finally:
+            block.close()
+            block.unlink()
+
+        failed = set(failed)
+        out = {}
+        for row, path in enumerate(chunk):
+            vectors = {}
+            for name in names:
+                slot = layout.get(name)
+                if slot is None or (row, name) in failed:
+                    vectors[name] = None
+                else:
+                    offset, dim = slot
+                    vectors[name] = matrix[row, offset:offset + dim]
+            out[path] = vectors
+        return out
@@ -0,0 +1,62 @@
+"""Indexing against out-of-process embedding workers.
+
+Images are still decoded and preprocessed here, but the forward passes run in
+one or more Needle Embedder services (``embedder-service/``), on this machine
+or another one. A batch is split evenly across the workers and the pieces are
+sent concurrently. A worker that fails is skipped for that piece; if none can
+take it, the piece is embedded in-process so indexing never stalls.
+"""
+
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+import torch
+
+from core.connectors import EmbeddingWorkerConnector
+from indexing.services.embedder_service import EmbedderService
+from monitoring import logger
+
+
+class RemoteEmbedderService(EmbedderService):
+    """``EmbedderService`` whose forward passes run on embedding workers."""
+
+    def __init__(self, worker_urls: List[str]):
+        super().__init__()
+        self._workers = [EmbeddingWorkerConnector(url) for url in worker_urls]
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._requests = ThreadPoolExecutor(max_workers=len(self._workers))
+        logger.info(f"Indexing forward passes go to {len(self._workers)} embedding worker(s): "
+                    f"{', '.join(w.base_url for w in self._workers)}")
+
+    @property
+    def parallelism(self) -> int:
+        return len(self._workers)
+
+    def _rotation(self) -> List[EmbeddingWorkerConnector]:
+        """All workers, starting at the next one in round-robin order."""
+        with self._lock:
+            start = next(self._next) % len(self._workers)
+        return self._workers[start:] + self._workers[:start]
+
+    def _forward(self, embedder, batch: torch.Tensor) -> np.ndarray:
+        rotation = self._rotation()
+        chunks = [c for c in torch.tensor_split(batch, min(len(rotation), batch.shape[0])) if c.shape[0]]
+        futures = [
+            self._requests.submit(self._forward_chunk, embedder, chunk, rotation[i:] + rotation[:i])
+            for i, chunk in enumerate(chunks)
+        ]
+        return np.concatenate([f.result() for f in futures], axis=0)
+
+    def _forward_chunk(self, embedder, chunk: torch.Tensor, workers: List[EmbeddingWorkerConnector]) -> np.ndarray:
+        array = chunk.numpy()
+        for worker in workers:
+            try:
+                return worker.embed(embedder.model_name, array)
+            except Exception as exc:
+                logger.warning(f"Embedding worker {worker.base_url} failed for {embedder.model_name}: {exc}")
+        logger.warning(f"No embedding worker available for {embedder.model_name}; embedding in-process")
+        return super()._forward(embedder, chunk)
@@ -0,0 +1,153 @@
+"""Live indexing counters, kept in memory.
+
+The only progress signal used to be ``indexing_ratio``, which ``/directory``
+recomputed on every call by loading every image row. The indexer now reports
+what it does as it does it, and ``snapshot()`` reads these counters back:
+
+* per stage (decode, preprocess, each embedder, write): images handled, the
+  time spent, and the throughput while busy;
+* overall and per directory: images indexed per second over the last minute;
+* per directory: total, indexed, pending, failures and an ETA.
+
+Directory totals are seeded with one COUNT when a pass starts and then
+advanced batch by batch, so reading them costs nothing. The counters start
+from zero with every backend start.
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from core.singleton import Singleton
+
+# Rates are computed over this many trailing seconds.
+RATE_WINDOW = 60.0
+
+
+class RateCounter:
+    """Events per second over the trailing ``RATE_WINDOW``."""
+
+    def __init__(self):
+        self._events = deque()
+
+    def add(self, count: int, now: float):
+        self._events.append((now, count))
+        self._trim(now)
+
+    def _trim(self, now: float):
+        while self._events and now - self._events[0][0] > RATE_WINDOW:
+            self._events.popleft()
+
+    def per_second(self, now: float) -> float:
+        self._trim(now)
+        if not self._events:
+            return 0.0
+        # Measure from the first event in the window, so a fresh start is not
+        # diluted by a minute of idle time that never happened.
+        span = max(now - self._events[0][0], 1.0)
+        return sum(count for _, count in self._events) / span
+
+
+class _Stage:
+    def __init__(self):
+        self.images = 0
+        self.seconds = 0.0
+
+
+class _DirectoryProgress:
+    def __init__(self, path: str):
+        self.path = path
+        self.total = 0
+        self.indexed = 0
+        self.failures = 0
+        self.rate = RateCounter()
+        self.last_error: Optional[str] = None
+
+
+@Singleton
+class IndexingTelemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Stage] = {}
+        self._rate = RateCounter()
+        self._indexed = 0
+        self._failures = 0
+        self._directories: Dict[int, _DirectoryProgress] = {}
+
+    @contextmanager
+    def stage(self, name: str, images: int):
+        """Time a pipeline stage that handled ``images`` images."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                stage = self._stages.setdefault(name, _Stage())
+                stage.images += images
+                stage.seconds += elapsed
+
+    def start_directory(self, directory_id: int, path: str, total: int, indexed: int):
+        with self._lock:
+            progress = self._directories.setdefault(directory_id, _DirectoryProgress(path))
+            progress.path, progress.total, progress.indexed = path, total, indexed
+
+    def record_batch(self, directory_id: int, indexed: int, failed: int):
+        now = time.monotonic()
+        with self._lock:
+            self._indexed += indexed
+            self._failures += failed
+            self._rate.add(indexed, now)
+            progress = self._directories.get(directory_id)
+            if progress is not None:
+                progress.indexed += indexed
+                progress.failures += failed
+                progress.rate.add(indexed, now)
+
+    def record_error(self, directory_id: int, error: str):
+        with self._lock:
+            self._failures += 1
+            progress = self._directories.get(directory_id)
+            if progress is not None:
+                progress.failures += 1
+                progress.last_error = error
+
+    def forget(self, directory_id: int):
+        with self._lock:
+            self._directories.pop(directory_id, None)
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            stages = {
+                name: {
+                    "images": s.images,
+                    "seconds": round(s.seconds, 3),
+                    "images_per_sec": round(s.images / s.seconds, 2) if s.seconds else None,
+                }
+                for name, s in self._stages.items()
+            }
+            directories = []
+            for directory_id, p in self._directories.items():
+                pending = max(p.total - p.indexed, 0)
+                rate = p.rate.per_second(now)
+                directories.append({
+                    "directory_id": directory_id,
+                    "path": p.path,
+                    "total_images": p.total,
+                    "indexed_images": min(p.indexed, p.total),
+                    "pending_images": pending,
+                    "failures": p.failures,
+                    "last_error": p.last_error,
+                    "images_per_sec": round(rate, 2),
+                    "eta_seconds": round(pending / rate, 1) if pending and rate else (0.0 if not pending else None),
+                })
+            return {
+                "images_indexed": self._indexed,
+                "failures": self._failures,
+                "images_per_sec": round(self._rate.per_second(now), 2),
+                "stages": stages,
+                "directories": directories,
+            }
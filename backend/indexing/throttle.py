@@ -0,0 +1,97 @@
+"""Keeps background indexing out of the way of interactive searches.
+
+Indexing and ``/search`` share the same cores and the same model instances, so
+a search issued during a large import used to run several times slower than on
+an idle machine. Searches now announce themselves through ``searching()``;
+indexing workers check in with ``wait_for_turn()`` between batches and hold off
+while any search is in flight. For a short cool-down afterwards they run
+smaller batches, so a user refining a query does not land behind a full page of
+inference.
+
+Operators can also hold indexing outright (``pause()``/``resume()``), e.g.
+during peak hours. Batches already running finish; no new one starts.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from core.singleton import Singleton
+from monitoring import logger
+from settings import settings
+
+
+@Singleton
+class IndexingThrottle:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._searches = 0
+        self._last_search = float("-inf")
+        self._paused = False
+
+    @property
+    def paused(self) -> bool:
+        return self._paused
+
+    @property
+    def searches_in_flight(self) -> int:
+        return self._searches
+
+    def pause(self):
+        with self._cond:
+            if not self._paused:
+                logger.info("Indexing paused")
+            self._paused = True
+
+    def resume(self):
+        with self._cond:
+            if self._paused:
+                logger.info("Indexing resumed")
+            self._paused = False
+            self._cond.notify_all()
+
+    @contextmanager
+    def searching(self):
+        """Mark a search as in flight for the duration of the block."""
+        with self._cond:
+            self._searches += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._searches -= 1
+                self._last_search = time.monotonic()
+                self._cond.notify_all()
+
+    def wait_for_turn(self):
+        """Block an indexing worker until it may start its next batch.
+
+        Waits for as long as indexing is paused. Waits for in-flight searches
+        too, but only up to ``max_search_yield`` seconds, so a steady stream
+        of searches slows indexing down without starving it.
+        """
+        yielded_since = None
+        with self._cond:
+            while True:
+                if self._paused:
+                    yielded_since = None
+                    self._cond.wait()
+                    continue
+                if not self._searches or not settings.directory.yield_to_search:
+                    return
+                now = time.monotonic()
+                if yielded_since is None:
+                    yielded_since = now
+                remaining = settings.directory.max_search_yield - (now - yielded_since)
+                if remaining <= 0:
+                    return
+                self._cond.wait(timeout=remaining)
+
+    def batch_size(self, full_size: int) -> int:
+        """The batch size to use right now, given the unthrottled one."""
+        if not settings.directory.yield_to_search:
+            return full_size
+        recent = time.monotonic() - self._last_search < settings.directory.search_cooldown
+        if self._searches or recent:
+            return max(1, min(full_size, settings.directory.batch_size // 2 or 1))
+        return full_size
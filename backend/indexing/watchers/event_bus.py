@@ -0,0 +1,405 @@
+"""One coalescing queue for the filesystem events of every watched directory.
+
+Each watcher handler used to keep its own lock, debounce timer, database
+session and flush. A bulk copy touching fifty watched roots meant fifty
+timers, fifty transactions and fifty separate trips into the index queue. Now
+handlers only publish events here. A single flush thread applies everything
+pending, across all directories, in one batch of database work per kind of
+change.
+
+Events are coalesced per path, so repeated modify events for a file that is
+already pending cost a set lookup. A batch is applied once events have been
+quiet for ``FLUSH_DELAY_SECONDS``, or after ``MAX_BATCH_AGE_SECONDS`` under a
+steady stream. When more than ``MAX_PENDING`` paths are waiting, it is applied
+at once and publishers block until it drains. Watchdog then stops reading
+events, and the OS queue buffers them in the meantime.
+
+Renames and moves keep their vectors. A moved file or folder is a path rewrite
+in SQLite and in every vector table; nothing is decoded or embedded again.
+Watchdog reports a move between two watched roots as a delete in one and a
+create in the other. Such pairs are matched by stat signature (inode, size,
+mtime), which a rename leaves untouched, and treated as moves too.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from core.singleton import Singleton
+from indexing.file_types import FileStat, file_stat
+from indexing.queue_manager.index_queue_manager import IndexQueueManager
+from indexing.repositories.repositories import ImageRepository, ScanStateRepository, VectorRepository
+from indexing.telemetry import RateCounter
+from models.models import SessionLocal
+from monitoring import logger
+
+#: How long to wait for a burst of events to settle before applying them. Also
+#: covers the window where a file is still being written: watchdog reports
+#: `created` as soon as the entry appears, long before the bytes have landed.
+FLUSH_DELAY_SECONDS = 2.0
+#: Upper bound on how long an event waits while events keep arriving.
+MAX_BATCH_AGE_SECONDS = 10.0
+#: Pending paths above which publishers are held back until a flush drains them.
+MAX_PENDING = 50_000
+
+
+def _under(path: str, directory: str) -> bool:
+    return path.startswith(directory + os.sep)
+
+
+class _DirectoryChanges:
+    """Pending changes of one watched root, kept in the namespace of the
+    latest folder renames: those are applied first, so every other pending
+    path is rewritten along with them."""
+
+    def __init__(self, directory_path: str):
+        self.directory_path = directory_path
+        self.added: Set[str] = set()
+        self.removed: Set[str] = set()
+        self.changed: Set[str] = set()
+        # Original path -> current path, with the reverse map for chains.
+        self.moved: Dict[str, str] = {}
+        self._origin: Dict[str, str] = {}
+        self.moved_dirs: List[Tuple[str, str]] = []
+        self.removed_dirs: Set[str] = set()
+
+    def __len__(self):
+        return (len(self.added) + len(self.removed) + len(self.changed) + len(self.moved)
+                + len(self.moved_dirs) + len(self.removed_dirs))
+
+    def _implied(self, src: str, dest: str) -> bool:
+        # Watchdog follows a folder rename with one event per entry inside it.
+        return any(_under(src, old) and dest == new + src[len(old):] for old, new in self.moved_dirs)
+
+    def remove(self, path: str):
+        # A file removed after being added in the same window never needs to
+        # be indexed at all.
+        self.added.discard(path)
+        self.changed.discard(path)
+        origin = self._origin.pop(path, None)
+        if origin is not None:
+            # Moved, then deleted: it is the original row that goes.
+            del self.moved[origin]
+            path = origin
+        self.removed.add(path)
+
+    def move(self, src: str, dest: str) -> bool:
+        """Record a file move; False if it adds nothing."""
+        if self._implied(src, dest):
+            return False
+        # Whatever was at the destination has been replaced.
+        self.added.discard(dest)
+        self.changed.discard(dest)
+        self.removed.discard(dest)
+        if src in self.added:
+            self.added.discard(src)
+            self.added.add(dest)
+            return True
+        origin = self._origin.pop(src, src)
+        if origin == dest:
+            self.moved.pop(origin, None)
+        else:
+            self.moved[origin] = dest
+            self._origin[dest] = origin
+        if src in self.changed:
+            self.changed.discard(src)
+            self.changed.add(dest)
+        return True
+
+    def move_dir(self, src: str, dest: str) -> bool:
+        """Record a folder rename; False if implied by a pending one."""
+        if self._implied(src, dest):
+            return False
+
+        def rekey(path: str) -> str:
+            return dest + path[len(src):] if path == src or _under(path, src) else path
+
+        self.added = {rekey(p) for p in self.added}
+        self.removed = {rekey(p) for p in self.removed}
+        self.changed = {rekey(p) for p in self.changed}
+        self.removed_dirs = {rekey(p) for p in self.removed_dirs}
+        self.moved = {rekey(a): rekey(b) for a, b in self.moved.items()}
+        self._origin = {b: a for a, b in self.moved.items()}
+        self.moved_dirs.append((src, dest))
+        return True
+
+    def remove_dir(self, path: str):
+        self.added = {p for p in self.added if not _under(p, path)}
+        self.changed = {p for p in self.changed if not _under(p, path)}
+        self.removed_dirs.add(path)
+
+
+@Singleton
+class WatcherEventBus:
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending: Dict[int, _DirectoryChanges] = {}
+        self._pending_count = 0
+        # Paths taken by the flush in progress; they still count toward
+        # backpressure until applied.
+        self._inflight = 0
+        self._first_event: Optional[float] = None
+        self._last_event = 0.0
+        self._flush_requested = False
+        # Monotonic time since which each directory's changes have applied
+        # cleanly; see healthy_since().
+        self._healthy_since: Dict[int, Optional[float]] = {}
+
+        self._events = 0
+        self._duplicates = 0
+        self._event_rate = RateCounter()
+        self._flushes = 0
+        self._flush_errors = 0
+        self._moves = 0
+        self._backpressure_waits = 0
+        self._last_flush_latency: Optional[float] = None
+        self._max_flush_latency = 0.0
+        self._total_flush_latency = 0.0
+
+        self._thread = threading.Thread(target=self._run, name="watcher-event-bus", daemon=True)
+        self._thread.start()
+
+    # -- publishing -------------------------------------------------------
+    def register(self, directory_id: int):
+        with self._cond:
+            self._healthy_since.setdefault(directory_id, time.monotonic())
+
+    def unregister(self, directory_id: int):
+        with self._cond:
+            self._healthy_since.pop(directory_id, None)
+
+    def publish(self, directory_id: int, directory_path: str, added=(), removed=(), changed=(),
+                moved=(), moved_dirs=(), removed_dirs=()):
+        """Queue changes of one watched root. ``moved`` and ``moved_dirs``
+        hold ``(src, dest)`` pairs."""
+        with self._cond:
+            while self._pending_count + self._inflight >= MAX_PENDING:
+                self._backpressure_waits += 1
+                self._flush_requested = True
+                self._cond.notify_all()
+                self._cond.wait(timeout=1.0)
+
+            now = time.monotonic()
+            pending = self._pending.get(directory_id)
+            if pending is None:
+                pending = self._pending[directory_id] = _DirectoryChanges(directory_path)
+            before = len(pending)
+            count = 0
+            for path in added:
+                count += 1
+                pending.removed.discard(path)
+                pending.added.add(path)
+            for path in removed:
+                count += 1
+                pending.remove(path)
+            for src, dest in moved_dirs:
+                count += 1
+                if not pending.move_dir(src, dest):
+                    self._duplicates += 1
+            for src, dest in moved:
+                count += 1
+                if not pending.move(src, dest):
+                    self._duplicates += 1
+            for path in removed_dirs:
+                count += 1
+                pending.remove_dir(path)
+            for path in changed:
+                count += 1
+                if path in pending.added or path in pending.changed:
+                    self._duplicates += 1
+                    continue
+                pending.changed.add(path)
+
+            self._events += count
+            self._event_rate.add(count, now)
+            self._pending_count += len(pending) - before
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+            self._cond.notify_all()
+
+    def flush(self):
+        """Apply everything pending now and wait for it (e.g. on unwatch)."""
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while self._pending_count or self._flush_requested:
+                self._cond.wait(timeout=1.0)
+
+    def healthy_since(self, directory_id: int) -> Optional[float]:
+        with self._cond:
+            return self._healthy_since.get(directory_id)
+
+    # -- flushing -----------------------------------------------------------
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._first_event is not None:
+                        now = time.monotonic()
+                        due = min(self._last_event + FLUSH_DELAY_SECONDS,
+                                  self._first_event + MAX_BATCH_AGE_SECONDS)
+                        if self._flush_requested or now >= due:
+                            break
+                        self._cond.wait(timeout=due - now)
+                    elif self._flush_requested:
+                        # Nothing pending: the request is already satisfied.
+                        self._flush_requested = False
+                        self._cond.notify_all()
+                        self._cond.wait()
+                    else:
+                        self._cond.wait()
+                batch, self._pending = self._pending, {}
+                first_event = self._first_event
+                self._first_event = None
+                self._inflight, self._pending_count = self._pending_count, 0
+
+            ok = self._apply(batch)
+            finished = time.monotonic()
+            with self._cond:
+                latency = finished - first_event
+                self._inflight = 0
+                self._flushes += 1
+                self._last_flush_latency = latency
+                self._max_flush_latency = max(self._max_flush_latency, latency)
+                self._total_flush_latency += latency
+                for directory_id in batch:
+                    if directory_id not in self._healthy_since:
+                        continue  # unwatched meanwhile
+                    if not ok:
+                        self._healthy_since[directory_id] = None
+                    elif self._healthy_since[directory_id] is None:
+                        self._healthy_since[directory_id] = finished
+                if not ok:
+                    self._flush_errors += 1
+                if not self._pending_count:
+                    self._flush_requested = False
+                self._cond.notify_all()
+
+    def _apply(self, batch: Dict[int, _DirectoryChanges]) -> bool:
+        """Apply one batch across all directories; returns whether it succeeded."""
+        added: Dict[int, Set[str]] = {did: set(c.added) for did, c in batch.items()}
+        removed = {p for c in batch.values() for p in c.removed}
+        current: Dict[str, Optional[FileStat]] = {}
+        session = SessionLocal()
+        try:
+            images = ImageRepository(session)
+            vectors = VectorRepository()
+            scan_state = ScanStateRepository(session)
+
+            # Renamed folders first: every other pending path is already
+            # expressed in their new names (see _DirectoryChanges.move_dir).
+            moved = 0
+            for changes in batch.values():
+                for old, new in changes.moved_dirs:
+                    vectors.rename_prefix_all_embedders(old + os.sep, new + os.sep)
+                    moved += images.rename_prefix(old + os.sep, new + os.sep)
+                    scan_state.forget_under(old)
+                    scan_state.forget_under(new)
+
+            # Moved files that were never tracked are simply new.
+            moves = {src: (dest, did) for did, c in batch.items() for src, dest in c.moved.items()}
+            tracked = images.get_stats(list(moves))
+            for src in [src for src in moves if src not in tracked]:
+                dest, did = moves.pop(src)
+                added[did].add(dest)
+
+            # Deleted folders: everything tracked below them goes.
+            for changes in batch.values():
+                for path in changes.removed_dirs:
+                    removed.update(images.paths_under(path + os.sep))
+
+            # A move between watched roots arrives as a delete plus a create.
+            # Pair them by stat signature, which a rename does not change.
+            if removed and any(added.values()):
+                stored = images.get_stats(sorted(removed))
+                by_signature = {stat: p for p, stat in stored.items() if stat is not None}
+                for did, paths in added.items():
+                    for path in sorted(paths):
+                        stat = current[path] = file_stat(path)
+                        src = by_signature.pop(stat, None) if stat is not None else None
+                        if src is not None:
+                            moves[src] = (path, did)
+                            removed.discard(src)
+                            paths.discard(path)
+
+            if moves:
+                vectors.rename_paths_all_embedders(moves)
+                moved += images.rename_paths(moves)
+            if moved:
+                logger.info(f"Moved {moved} image(s) without re-embedding")
+
+            # Deleted and moved-away files: drop their vectors, then their rows.
+            if removed:
+                vectors.delete_paths_all_embedders(list(removed))
+                deleted = images.delete_by_paths(list(removed), commit=False)
+                if deleted:
+                    logger.info(f"Removed {deleted} deleted image(s)")
+
+            # Modified files keep their row but need re-embedding, so the stale
+            # vectors must go or the index would hold both versions. Events
+            # that left the stat signature alone (metadata-only changes, a
+            # second event for the same write) are not worth re-embedding.
+            changed = [p for did, c in batch.items() for p in c.changed if p not in added[did]]
+            stored = images.get_stats(changed)
+            modified_stats = {p: file_stat(p) for p in stored}
+            modified = {p for p, stat in modified_stats.items() if stat is not None and stat != stored[p]}
+            if modified:
+                vectors.delete_paths_all_embedders(list(modified))
+                images.mark_unindexed(list(modified))
+                images.update_stats({p: modified_stats[p] for p in modified})
+
+            queued: Dict[int, List[str]] = {}
+            added_total = 0
+            for directory_id, changes in batch.items():
+                new_paths = added[directory_id]
+                if new_paths:
+                    stats = {p: current[p] if p in current else file_stat(p) for p in new_paths}
+                    stats = {p: s for p, s in stats.items() if s is not None}
+                    added_total += images.stage_new_images(directory_id, sorted(new_paths), stats)
+                paths = sorted(new_paths) + sorted(p for p in changes.changed if p in modified)
+                if paths:
+                    queued[directory_id] = paths
+            session.commit()
+            if added_total:
+                logger.info(f"Detected {added_total} new image(s) across {len(queued)} director(ies)")
+
+            queue = IndexQueueManager.instance()
+            for directory_id, paths in queued.items():
+                # The files themselves go ahead of any sweep of the directory.
+                queue.add_to_queue(directory_id, batch[directory_id].directory_path, priority=0,
+                                   image_paths=paths)
+            with self._cond:
+                self._moves += moved
+            return True
+        except Exception as exc:
+            logger.error(f"Error applying filesystem changes: {exc}", exc_info=True)
+            session.rollback()
+            return False
+        finally:
+            session.close()
+
+    # -- reporting ------------------------------------------------------------
+    def metrics(self) -> Dict:
+        now = time.monotonic()
+        with self._cond:
+            return {
+                "events": self._events,
+                "events_per_sec": round(self._event_rate.per_second(now), 2),
+                "duplicates_dropped": self._duplicates,
+                "pending_paths": self._pending_count,
+                "pending_directories": len(self._pending),
+                "flushes": self._flushes,
+                "flush_errors": self._flush_errors,
+                "moves_applied": self._moves,
+                "backpressure_waits": self._backpressure_waits,
+                "last_flush_latency_seconds": (
+                    round(self._last_flush_latency, 3) if self._last_flush_latency is not None else None
+                ),
+                "mean_flush_latency_seconds": (
+                    round(self._total_flush_latency / self._flushes, 3) if self._flushes else None
+                ),
+                "max_flush_latency_seconds": round(self._max_flush_latency, 3),
+                "watched_directories": len(self._healthy_since),
+            }
@@ -1,10 +1,13 @@
 import threading
 import time
+from typing import Optional
+
 from monitoring import logger
 
 from watchdog.observers import Observer
 
 from core.singleton import Singleton
+from indexing.watchers.event_bus import WatcherEventBus
 from indexing.watchers.image_change_handler import ImageChangeHandler
 
 
@@ -35,6 +38,14 @@ class FileWatcherService:
             handler.stop()
             logger.info(f"Stopped filesystem watcher for {directory_path}")
 
+    def healthy_since(self, directory_path: str) -> Optional[float]:
+        """Monotonic time since which the watcher for ``directory_path`` has
+        been running without errors, or None if it is not healthy."""
+        entry = self.handlers.get(directory_path)
+        if entry is None or not self.observer.is_alive():
+            return None
+        return WatcherEventBus.instance().healthy_since(entry[0].directory_id)
+
     def start(self):
         thread = threading.Thread(target=self._run, daemon=True)
         thread.start()
@@ -1,43 +1,52 @@
+import asyncio
 import base64
+import json
 import os
 import re
 import threading
 import time
 
-from collections import defaultdict
 from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List
 
 import requests
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import Depends, FastAPI, HTTPException, Query as QueryParam, Request
 from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
-from core import embedder_manager, image_generator, query_manager, setup_manager
+from core import embedder_manager, image_generator, query_manager, setup_manager, thread_budget
 from core.device import gpu_available, select_device
+from core.generation.cache import GenerationCache
 from core.generation.local_engine import (
     DEFAULT_MODEL as LOCAL_DEFAULT_MODEL,
     MODELS as LOCAL_MODELS,
     is_downloaded as is_model_downloaded,
 )
+from core.image_cache import ImageCache, TTL_SECONDS as IMAGE_CACHE_TTL
+from core import search as search_pipeline
 from core.query import Query
-from indexing.repositories.repositories import VectorRepository
+from core.result_cache import SearchResultCache
+from core.search import SearchJobManager
+from core.thumbnails import MEDIA_TYPE as THUMBNAIL_MEDIA_TYPE, ThumbnailStore, thumbnail_query
+from indexing.repositories.repositories import IMAGE_STATUSES, ImageRepository
+from indexing.watchers.event_bus import WatcherEventBus
 from models.models import SessionLocal, Directory, Image
 from models.schemas import AddDirectoryRequest, AddDirectoryResponse, HealthCheckResponse, DirectoryListResponse, \
     DirectoryModel, DirectoryDetailResponse, RemoveDirectoryResponse, RemoveDirectoryRequest, CreateQueryRequest, \
     CreateQueryResponse, GeneratorInfo, SearchLogsResponse, QueryLogEntry, \
     ServiceStatusResponse, ServiceLogResponse, SearchResponse, SearchRequest, UpdateDirectoryResponse, \
-    UpdateDirectoryRequest, GeneratePoolRequest, GeneratePoolResponse, GuideImageData, EmbeddingData, \
+    UpdateDirectoryRequest, IndexQueueResponse, IndexingStateResponse, IndexingStatusResponse, GeneratePoolRequest, GeneratePoolResponse, GuideImageData, EmbeddingData, \
     ComputeEmbeddingsRequest, ComputeEmbeddingsResponse, ImageEmbeddingsResponse, SetCredentialsRequest, \
+    ImageOutputOptions, SearchJobResponse, BatchSearchRequest, \
     ConfigureSetupRequest, GeneratorPreferencesRequest, SetGpuRequest, GenerateImagesRequest, LoadModelRequest, SaveImageRequest
-from indexing import image_indexing_service
+from indexing import image_indexing_service, indexing_telemetry, indexing_throttle
 from monitoring import logger
 from settings import settings
-from utils import aggregate_rankings, pil_image_to_base64, Timer
+from utils import IMAGE_FORMATS, encode_image, pil_image_to_base64
 from version import VERSION as BACKEND_VERSION
 
 
@@ -65,6 +74,7 @@ app.add_middleware(
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
+search_jobs = SearchJobManager.instance()
 
 
 @app.get("/health", response_model=HealthCheckResponse)
@@ -128,68 +138,101 @@ def add_directory(request: AddDirectoryRequest):
         raise HTTPException(status_code=404, detail=str(e))
 
 
+def _indexing_ratio(directory: Directory) -> float:
+    # From the counters the image triggers maintain (models._COUNT_TRIGGERS).
+    if directory.is_indexed:
+        return 1.0
+    if not directory.image_count:
+        return 0.0
+    return (directory.indexed_count or 0) / directory.image_count
+
+
 @app.get("/directory", response_model=DirectoryListResponse)
 async def get_directories():
     with SessionLocal() as session:
         directories = session.query(Directory).all()
-        directory_models = []
-        for d in directories:
-            # Calculate indexing progress
-            images = session.query(Image).filter_by(directory_id=d.id).all()
-            if not d.is_indexed and len(images) > 0:
-                indexed_images_count = session.query(Image).filter_by(
-                    directory_id=d.id, is_indexed=True
-                ).count()
-                indexing_ratio = indexed_images_count / len(images)
-            else:
-                indexing_ratio = 1.0 if d.is_indexed else 0.0
-            
-            directory_models.append(DirectoryModel(
-                id=d.id, 
-                path=d.path, 
-                is_indexed=d.is_indexed, 
+        directory_models = [
+            DirectoryModel(
+                id=d.id,
+                path=d.path,
+                is_indexed=d.is_indexed,
                 is_enabled=d.is_enabled,
-                indexing_ratio=indexing_ratio
-            ))
+                indexing_ratio=_indexing_ratio(d),
+                image_count=d.image_count or 0,
+                indexed_count=d.indexed_count or 0,
+            )
+            for d in directories
+        ]
     return DirectoryListResponse(directories=directory_models)
 
 
+_STATUS_PATTERN = f"^({'|'.join(IMAGE_STATUSES)})$"
+
+
 @app.get("/directory/{did}", response_model=DirectoryDetailResponse)
-async def get_directory(did: int):
+def get_directory(
+        did: int,
+        limit: int = QueryParam(500, ge=0, le=10000, description="Page size; 0 returns only the summary"),
+        cursor: int = QueryParam(0, ge=0, description="next_cursor of the previous page"),
+        status: str = QueryParam(None, pattern=_STATUS_PATTERN),
+):
+    """A directory's summary and one page of its images.
+
+    Pages are keyed on image id, so fetching page 1000 costs the same as page
+    one. Use ``/directory/{did}/images`` for the whole list in one stream.
+    """
     with SessionLocal() as session:
         directory = session.query(Directory).filter_by(id=did).first()
         if not directory:
             raise HTTPException(status_code=404, detail="Directory not found")
 
-        images = session.query(Image).filter_by(directory_id=directory.id).all()
-        image_paths = [img.path for img in images]
-
-        if not directory.is_indexed:
-            total_images = len(images)
-            if total_images > 0:
-                indexed_images_count = session.query(Image).filter_by(
-                    directory_id=directory.id, is_indexed=True
-                ).count()
-                ratio = indexed_images_count / total_images
-            else:
-                ratio = 0.0
-        else:
-            ratio = 1.0
+        rows = ImageRepository(session).list_page(did, status, after_id=cursor, limit=limit) if limit else []
 
         directory_model = DirectoryModel(
             id=directory.id,
             path=directory.path,
             is_indexed=directory.is_indexed,
-            is_enabled=directory.is_enabled
+            is_enabled=directory.is_enabled,
+            image_count=directory.image_count or 0,
+            indexed_count=directory.indexed_count or 0,
         )
+        ratio = _indexing_ratio(directory)
 
     return DirectoryDetailResponse(
         directory=directory_model,
-        images=image_paths,
-        indexing_ratio=ratio
+        images=[path for _, path, _, _ in rows],
+        indexing_ratio=ratio,
+        errors={path: error for _, path, _, error in rows if error} if status == "failed" else None,
+        next_cursor=rows[-1][0] if len(rows) == limit and rows else None,
     )
 
 
+@app.get("/directory/{did}/images")
+def stream_directory_images(did: int, status: str = QueryParam(None, pattern=_STATUS_PATTERN)):
+    """Every image of a directory as NDJSON, one object per line.
+
+    Rows are read a page at a time while the response is sent, so memory
+    stays flat however large the directory is.
+    """
+    with SessionLocal() as session:
+        if session.query(Directory.id).filter_by(id=did).first() is None:
+            raise HTTPException(status_code=404, detail="Directory not found")
+
+    def lines():
+        after_id = 0
+        while True:
+            with SessionLocal() as session:
+                rows = ImageRepository(session).list_page(did, status, after_id=after_id, limit=1000)
+            for image_id, path, is_indexed, error in rows:
+                yield json.dumps({"id": image_id, "path": path, "is_indexed": bool(is_indexed),
+                                  "error": error}) + "\n"
+            if len(rows) < 1000:
+                return
+            after_id = rows[-1][0]
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.put("/directory/{did}", response_model=UpdateDirectoryResponse)
 async def update_directory(did: int, request: UpdateDirectoryRequest):
     with SessionLocal() as session:
@@ -221,8 +264,59 @@ async def remove_directory(request: RemoveDirectoryRequest):
     return RemoveDirectoryResponse(status="Directory removed successfully.")
 
 
+@app.get("/indexing/queue", response_model=IndexQueueResponse)
+def get_index_queue():
+    # Sync: the pending counts come from one GROUP BY over the images table.
+    return IndexQueueResponse(directories=image_indexing_service.index_queue_manager.backlog())
+
+
+@app.get("/indexing/status", response_model=IndexingStatusResponse)
+async def get_indexing_status():
+    # In-memory counters only: cheap enough to poll.
+    return IndexingStatusResponse(
+        paused=indexing_throttle.paused,
+        searches_in_flight=indexing_throttle.searches_in_flight,
+        queue=image_indexing_service.index_queue_manager.depth(),
+        **indexing_telemetry.snapshot(),
+    )
+
+
+@app.get("/indexing/watcher")
+async def get_watcher_metrics():
+    """Filesystem event bus: events/sec, duplicates dropped, pending, flush latency."""
+    return WatcherEventBus.instance().metrics()
+
+
+@app.get("/indexing/consistency")
+async def get_consistency_history():
+    """Cost and coverage of recent consistency passes, newest last."""
+    return {"passes": image_indexing_service.consistency_checker.history()}
+
+
+def _indexing_state() -> IndexingStateResponse:
+    return IndexingStateResponse(
+        paused=indexing_throttle.paused,
+        searches_in_flight=indexing_throttle.searches_in_flight,
+    )
+
+
+@app.post("/indexing/pause", response_model=IndexingStateResponse)
+async def pause_indexing():
+    # Batches already running finish; workers stop before the next one.
+    indexing_throttle.pause()
+    return _indexing_state()
+
+
+@app.post("/indexing/resume", response_model=IndexingStateResponse)
+async def resume_indexing():
+    indexing_throttle.resume()
+    return _indexing_state()
+
+
 @app.post("/query", response_model=CreateQueryResponse)
-async def create_query(request: CreateQueryRequest):
+# Sync so it runs in the threadpool: adding a query commits to SQLite and now
+# and then applies the retention policy, deleting image directories.
+def create_query(request: CreateQueryRequest):
     query_object = Query(request.q)
     qid = query_manager.add_query(query_object)
     return CreateQueryResponse(qid=qid)
@@ -238,101 +332,179 @@ def search(
         request_obj: Request = None
 ):
     _require_ready()
-    timings = {}
-    total_timer_start = time.perf_counter()
+    # Indexing backs off while this runs; see indexing/throttle.py.
+    with indexing_throttle.searching():
+        return _search(request, request_obj)
+
+
+def _search(request: SearchRequest, request_obj: Request, emit=None, is_cancelled=None) -> SearchResponse:
     query_object = query_manager.get_query(request.qid)
     if not query_object:
         raise HTTPException(status_code=404, detail="Query not found")
 
-    query = query_object.query
-    generated_images = []
+    outcome = search_pipeline.execute(
+        query_object,
+        request.generation_config.model_dump(),
+        k=request.num_images_to_retrieve,
+        emit=emit,
+        is_cancelled=is_cancelled,
+    )
+    try:
+        query_manager.save(query_object)
+    except Exception as e:
+        # The results are still returned; only their history entry is stale.
+        logger.error(f"Could not save query {request.qid}: {e}", exc_info=True)
+    return SearchResponse(
+        results=outcome.results,
+        qid=request.qid,
+        preview_url=str(request_obj.url_for("gallery", qid=request.qid)),
+        thumbnails=thumbnail_urls(request_obj, outcome.results) if request.include_thumbnails else None,
+        base_images=[image_ref(image, request.image_output, request_obj) for image, _ in
+                     outcome.generated_images] if request.include_base_images_in_preview else None,
+        verbose_results=outcome.verbose if request.verbose else None,
+        timings=outcome.timings,
+        cached=outcome.cached,
+    )
 
-    if not query_object.generated_images:
-        generation_request = request.generation_config.model_dump()
-        generation_request["prompt"] = query
-        # Engines are optional: when the client omits them the orchestrator
-        # applies the saved preferences, which is the shared path.
-        for engine in generation_request.get("engines") or []:
-            engine["prompt"] = query
 
-        with Timer("image_generation", timings):
-            generated_images.extend(image_generator.generate(generation_request))
+@app.post("/search/batch")
+def search_batch(request: BatchSearchRequest, request_obj: Request):
+    """Search for many prompts in one request, streamed back as NDJSON.
 
-        query_object.generated_images.extend(generated_images)
-    else:
-        generated_images = query_object.generated_images
+    Each prompt becomes a query. Its line is sent as soon as its results are
+    ready, so lines come in completion order; ``index`` is the prompt's
+    position in the request. A prompt that failed has ``error`` instead of
+    ``results``.
+    """
+    _require_ready()
+    if any(not prompt.strip() for prompt in request.prompts):
+        raise HTTPException(status_code=400, detail="Prompts must not be empty")
+    query_objects = [Query(prompt) for prompt in request.prompts]
+    for query_object in query_objects:
+        query_manager.add_query(query_object)
+
+    def lines():
+        # Indexing backs off while this runs; see indexing/throttle.py.
+        with indexing_throttle.searching():
+            for i, outcome in search_pipeline.execute_batch(
+                    query_objects, request.generation_config.model_dump(), k=request.num_images_to_retrieve):
+                query_object = query_objects[i]
+                line = {"index": i, "prompt": query_object.query, "qid": query_object.id}
+                if isinstance(outcome, Exception):
+                    line["error"] = str(outcome)
+                    yield json.dumps(line) + "\n"
+                    continue
+                try:
+                    query_manager.save(query_object)
+                except Exception as e:
+                    logger.error(f"Could not save query {query_object.id}: {e}", exc_info=True)
+                line.update(
+                    results=outcome.results,
+                    thumbnails=thumbnail_urls(request_obj, outcome.results) if request.include_thumbnails else None,
+                    cached=outcome.cached,
+                    timings=outcome.timings,
+                )
+                yield json.dumps(line) + "\n"
 
-    embedders = embedder_manager.get_image_embedders()
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-    with SessionLocal() as session:
-        indexed_directories = session.query(Directory.id).filter(
-            Directory.is_indexed == True, Directory.is_enabled == True).all()
-
-    indexed_directory_ids = [d[0] for d in indexed_directories]
-    if not indexed_directory_ids:
-        return SearchResponse(
-            results=[],
-            qid=request.qid,
-            base_images=[pil_image_to_base64(image) for image, _ in
-                         generated_images] if request.include_base_images_in_preview else None,
-            preview_url=str(request_obj.url_for("gallery", qid=request.qid))
-        )
 
-    # Restrict search to indexed & enabled directories
-    directory_ids = indexed_directory_ids
-
-    results = {}
-    ranking_weights = []
-    verbose = {}
-    vector_repo = VectorRepository()
-    for embedder_name, embedder in embedders.items():
-        verbose[embedder_name] = defaultdict(list)
-
-        for i, (image, engine_name) in enumerate(generated_images):
-            with Timer(f"embedding_{embedder_name}", timings, aggregate=True):
-                query_embedding = embedder.embed(image)
-
-            with Timer(f"retrieval_{embedder_name}", timings, aggregate=True):
-                hit_paths = vector_repo.search(
-                    embedder_name,
-                    query_embedding,
-                    limit=request.num_images_to_retrieve,
-                    directory_ids=directory_ids,
-                )
+@app.post("/search/jobs", response_model=SearchJobResponse)
+def submit_search_job(request: SearchRequest, request_obj: Request):
+    """Start a search in the background and return at once.
 
-            results[f"{embedder_name}_{i}"] = hit_paths
+    Progress is streamed by ``GET /search/jobs/{job_id}/events``, and the
+    final event carries the same body ``POST /search`` returns.
+    """
+    _require_ready()
+    if not query_manager.get_query(request.qid):
+        raise HTTPException(status_code=404, detail="Query not found")
 
-            verbose[embedder_name][engine_name].append(hit_paths)
+    def run(job):
+        def emit(event, data):
+            if event == "image_ready":
+                image = data.pop("image")
+                if request.include_base_images_in_preview:
+                    data["image"] = image_ref(image, request.image_output, request_obj)
+            elif event in ("results_updated", "embedder_done") and request.include_thumbnails:
+                data["thumbnails"] = thumbnail_urls(request_obj, data["results"])
+            job.emit(event, data)
 
-        rankings = [ranking for e, ranking in results.items() if e.startswith(embedder_name)]
-        embedder_top_results = aggregate_rankings(rankings, weights=[1] * len(generated_images),
-                                                  k=request.num_images_to_retrieve)
-        query_object.add_embedder_results(embedder_name=embedder_name, results=embedder_top_results)
+        # Indexing backs off while this runs; see indexing/throttle.py.
+        with indexing_throttle.searching():
+            return _search(request, request_obj, emit, lambda: job.cancelled).model_dump()
 
-        for r in rankings:
-            ranking_weights.append((r, embedder.weight, embedder_name))
+    job = search_jobs.submit(request.qid, run)
+    return _search_job_response(job, request_obj)
 
-    with Timer("ranking_aggregation", timings):
-        top_images = aggregate_rankings(
-            rankers_results=[r for r, w, _ in ranking_weights],
-            weights=[w for r, w, _ in ranking_weights],
-            k=request.num_images_to_retrieve
-        )
 
-    query_object.final_results = top_images
+def _search_job_response(job, request_obj: Request) -> SearchJobResponse:
+    return SearchJobResponse(
+        **job.summary(),
+        events_url=str(request_obj.url_for("search_job_events", job_id=job.id)),
+    )
 
-    # Add total time and calculate the overhead
-    timings["total_request_time"] = time.perf_counter() - total_timer_start
 
-    return SearchResponse(
-        results=top_images,
-        qid=request.qid,
-        preview_url=str(request_obj.url_for("gallery", qid=request.qid)),
-        base_images=[pil_image_to_base64(image) for image, _ in
-                     generated_images] if request.include_base_images_in_preview else None,
-        verbose_results=verbose if request.verbose else None,
-        timings=timings
-    )
+def _get_search_job(job_id: str):
+    job = search_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Search job not found")
+    return job
+
+
+@app.get("/search/jobs/{job_id}", response_model=SearchJobResponse)
+async def get_search_job(job_id: str, request_obj: Request):
+    return _search_job_response(_get_search_job(job_id), request_obj)
+
+
+@app.post("/search/jobs/{job_id}/cancel", response_model=SearchJobResponse)
+async def cancel_search_job(job_id: str, request_obj: Request):
+    job = _get_search_job(job_id)
+    job.cancel()
+    return _search_job_response(job, request_obj)
+
+
+@app.get("/search/jobs/{job_id}/events")
+async def search_job_events(job_id: str, request_obj: Request, after: int = 0):
+    """Server-sent events for a search job, from the start or after event
+    ``after`` (or the ``Last-Event-ID`` of a reconnecting EventSource).
+
+    Events: started, generation_started, then image_ready and results_updated
+    for each guide image as it is matched, embedder_done, then one
+    of done, failed or cancelled, after which the stream ends. (Not "error",
+    which EventSource reserves for connection problems.)
+    """
+    job = _get_search_job(job_id)
+    last_event_id = request_obj.headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+
+    async def stream():
+        seq = after
+        idle = 0.0
+        while True:
+            # Read the state first: a job seen as finished already holds its
+            # final event.
+            finished = job.finished
+            events = job.events_after(seq)
+            for seq, event, data in events:
+                yield f"id: {seq}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+            if finished and not events:
+                return
+            if events:
+                idle = 0.0
+                continue
+            if await request_obj.is_disconnected():
+                return
+            await asyncio.sleep(0.1)
+            idle += 0.1
+            if idle >= 15:
+                # Comment line: keeps proxies from timing out an idle stream.
+                idle = 0.0
+                yield ": keep-alive\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 @app.get("/file")
@@ -345,6 +517,52 @@ async def get_file(file_path: str):
         raise HTTPException(status_code=500, detail=f"Error retrieving file: {str(e)}")
 
 
+def thumbnail_urls(request_obj: Request, paths: List[str], size: int = None) -> List[str]:
+    """``/thumbnail`` URLs for ``paths``, pinned to their content where known."""
+    with SessionLocal() as session:
+        hashes = ImageRepository(session).get_content_hashes(paths)
+    base = str(request_obj.url_for("get_thumbnail"))
+    return [f"{base}?{thumbnail_query(p, hashes.get(p), size)}" for p in paths]
+
+
+@app.get("/thumbnail")
+def get_thumbnail(file_path: str, request: Request, size: int = None, v: str = None):
+    """A downscaled JPEG of ``file_path``, at the smallest stored size of at
+    least ``size`` pixels (the smallest one by default).
+
+    Revalidates with ``If-None-Match``. URLs carrying the content hash (``v``,
+    as handed out by search and the gallery) may be cached indefinitely.
+    """
+    store = ThumbnailStore.instance()
+    size = store.fit(size)
+    with SessionLocal() as session:
+        recorded = ImageRepository(session).get_content_hashes([file_path]).get(file_path)
+    digest = recorded
+    if digest is None or not store.has(digest, size):
+        # Not indexed (yet), indexed before hashes were recorded, or a size
+        # made on demand.
+        if not os.path.isfile(file_path):
+            raise HTTPException(status_code=404, detail="File not found")
+        try:
+            digest = store.put_file(file_path, size)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error creating thumbnail: {str(e)}")
+        if recorded is None:
+            # Rows indexed before hashes were recorded get theirs here, so
+            # later URLs carry ``v`` and consistency passes keep the files.
+            with SessionLocal() as session:
+                ImageRepository(session).record_content_hash(file_path, digest)
+
+    etag = f'"{digest}-{size}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable" if v == digest else "no-cache",
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(store.path(digest, size), media_type=THUMBNAIL_MEDIA_TYPE, headers=headers)
+
+
 @app.get("/generator", response_model=List[GeneratorInfo])
 async def get_generators():
     return image_generator.get_available_engines()
@@ -391,7 +609,8 @@ async def get_generator_capabilities(name: str, base_url: str | None = None):
 
 @app.post("/generator/{name}/test")
 # Sync on purpose: generation blocks for seconds. See the note on /search.
-def test_generator(name: str, request: SetCredentialsRequest):
+def test_generator(name: str, request: SetCredentialsRequest, request_obj: Request,
+                   output: ImageOutputOptions = Depends()):
     """Generate a single small test image with one engine. Also warms the model
     so the first real search is fast. Returns the image as a data URL + timing."""
     params = request.params or {}
@@ -427,7 +646,7 @@ def test_generator(name: str, request: SetCredentialsRequest):
     return {
         "engine": engine_name,
         "elapsed_ms": int((time.perf_counter() - started) * 1000),
-        "image": pil_image_to_base64(image),
+        "image": image_ref(image, output, request_obj),
     }
 
 
@@ -482,8 +701,9 @@ def _load_model_quietly(engine, model_id: str):
 
 
 @app.post("/generate/images")
-async def generate_images(request: GenerateImagesRequest):
-    """Generate images on-device and return them as data URLs."""
+async def generate_images(request: GenerateImagesRequest, request_obj: Request):
+    """Generate images on-device and return them as data URLs (or cache URLs,
+    see ``ImageOutputOptions``)."""
     engine = image_generator.local_engine()
     if not engine.libraries_available():
         raise HTTPException(status_code=503, detail="On-device generation is not available in this build")
@@ -516,7 +736,9 @@ async def generate_images(request: GenerateImagesRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
     return {
-        "images": [pil_image_to_base64(im) for im in images],
+        "images": await run_in_threadpool(
+            lambda: [image_ref(im, request.image_output, request_obj) for im in images]
+        ),
         "prompt": request.prompt,
         **meta,
     }
@@ -535,22 +757,59 @@ async def generate_save(request: SaveImageRequest):
     stem = re.sub(r"[^A-Za-z0-9._-]", "_", stem).lstrip(".") or "needle"
     stem = Path(stem).stem
 
-    target = directory / f"{stem}.png"
+    # Images come back inline as data URLs or by reference (/images/{token}).
+    match = re.search(r"/images/([A-Za-z0-9_-]+)$", request.image)
+    if match:
+        cached = ImageCache.instance().get(match.group(1))
+        if cached is None:
+            raise HTTPException(status_code=410, detail="Image expired; generate it again")
+        data, media_type = cached
+    else:
+        header, _, payload = request.image.rpartition(",")
+        media_type = re.match(r"data:([^;]+)", header).group(1) if header.startswith("data:") else "image/png"
+        try:
+            data = base64.b64decode(payload)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid image data: {e}")
+    extension = next((ext for _, mt, ext in IMAGE_FORMATS.values() if mt == media_type), ".png")
+
+    target = directory / f"{stem}{extension}"
     counter = 1
     while target.exists():
-        target = directory / f"{stem}-{counter}.png"
+        target = directory / f"{stem}-{counter}{extension}"
         counter += 1
 
-    payload = request.image.split(",", 1)[-1]
     try:
-        target.write_bytes(base64.b64decode(payload))
+        target.write_bytes(data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Could not save image: {e}")
     return {"path": str(target)}
 
 
+def image_ref(image, options: ImageOutputOptions, request_obj: Request) -> str:
+    """Encode a generated image for a response: a data URL, or with
+    ``by_reference`` the URL of a short-lived copy in the image cache."""
+    if not options.by_reference:
+        return pil_image_to_base64(image, options.format, options.quality)
+    data, media_type = encode_image(image, options.format, options.quality)
+    token = ImageCache.instance().put(data, media_type)
+    return str(request_obj.url_for("get_cached_image", token=token))
+
+
+@app.get("/images/{token}")
+async def get_cached_image(token: str):
+    """A generated image returned by reference; gone after a few minutes."""
+    cached = ImageCache.instance().get(token)
+    if cached is None:
+        raise HTTPException(status_code=404, detail="Image not found or expired")
+    data, media_type = cached
+    return Response(content=data, media_type=media_type,
+                    headers={"Cache-Control": f"private, max-age={IMAGE_CACHE_TTL}, immutable"})
+
+
 @app.get("/search/logs", response_model=SearchLogsResponse)
-async def get_search_logs():
+# Sync for the same reason as create_query: the query list is read from SQLite.
+def get_search_logs():
     queries = query_manager.list_queries()
     query_logs = [
         QueryLogEntry(qid=qid, query=qstr)
@@ -664,6 +923,42 @@ def system_info():
     return _system_info()
 
 
+@app.get("/system/inference")
+async def system_inference():
+    """Per-embedder inference queues: depth, queue wait, batch fill, latency."""
+    return {name: e.server.metrics() for name, e in embedder_manager.get_image_embedders().items()}
+
+
+@app.get("/system/image-cache")
+async def system_image_cache():
+    """Generated images held for by-reference responses."""
+    return ImageCache.instance().metrics()
+
+
+@app.get("/system/generation-cache")
+async def system_generation_cache():
+    """On-disk cache of generated query images and embeddings: size and hit rates."""
+    return GenerationCache.instance().metrics()
+
+
+@app.get("/system/search-cache")
+async def system_search_cache():
+    """Search result cache size and hit rate."""
+    return SearchResultCache.instance().metrics()
+
+
+@app.get("/system/search-jobs")
+async def system_search_jobs():
+    """Search jobs kept in memory, by state."""
+    return search_jobs.metrics()
+
+
+@app.get("/system/threads")
+async def system_threads():
+    """CPU thread budget: grants in flight and utilization per workload class."""
+    return thread_budget.metrics()
+
+
 @app.get("/system/update")
 def system_update():
     """Check GitHub for a newer release.
@@ -725,7 +1020,7 @@ async def service_log():
 
 
 @app.post("/variance-analysis/generate-pool", response_model=GeneratePoolResponse)
-async def generate_pool(request: GeneratePoolRequest):
+async def generate_pool(request: GeneratePoolRequest, request_obj: Request):
     """
     Generate a pool of guide images for variance analysis.
     This endpoint generates M_pool guide images and computes embeddings for all embedders.
@@ -767,7 +1062,7 @@ async def generate_pool(request: GeneratePoolRequest):
         
         guide_images_data.append(GuideImageData(
             image_index=idx,
-            base64_image=pil_image_to_base64(image),
+            base64_image=image_ref(image, request.image_output, request_obj),
             embeddings=embeddings_data
         ))
     
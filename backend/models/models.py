@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, String, Integer, ForeignKey, Boolean, Index, event
+from sqlalchemy import create_engine, Column, String, Integer, ForeignKey, Boolean, Index, Text, Float, event, \
+    inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from settings import settings
@@ -34,6 +35,14 @@ class Directory(Base):
     path = Column(String, unique=True, index=True)
     is_indexed = Column(Boolean, default=False)
     is_enabled = Column(Boolean, default=True)
+    # Id of the last image the indexer finished with in the current pass, so an
+    # interrupted run resumes there instead of starting over. 0 means no pass in
+    # progress.
+    index_cursor = Column(Integer, default=0, server_default="0")
+    # Image counts, kept current by the triggers in _install_count_triggers so
+    # that listing directories never has to count image rows.
+    image_count = Column(Integer, default=0, server_default="0")
+    indexed_count = Column(Integer, default=0, server_default="0")
 
     images = relationship("Image", back_populates="directory")
 
@@ -44,6 +53,17 @@ class Image(Base):
     path = Column(String, unique=True, index=True)
     directory_id = Column(Integer, ForeignKey("directories.id"))
     is_indexed = Column(Boolean, default=False)
+    # Stat signature (see indexing.file_types.FileStat) as of the last time the
+    # file was seen. NULL for rows created before these columns existed; the
+    # consistency checker fills them in without re-indexing.
+    size = Column(Integer, nullable=True)
+    mtime_ns = Column(Integer, nullable=True)
+    inode = Column(Integer, nullable=True)
+    # Hash of the file's bytes when it was last indexed; keys its thumbnails
+    # (core/thumbnails.py). NULL until indexed, and again once modified.
+    content_hash = Column(String, nullable=True)
+    # Why the last attempt to index this image failed; NULL once it succeeds.
+    index_error = Column(String, nullable=True)
 
     directory = relationship("Directory", back_populates="images")
 
@@ -54,4 +74,151 @@ class Image(Base):
     )
 
 
+class ImageEmbedding(Base):
+    """One row per (image, embedder) whose vector is stored.
+
+    ``Image.is_indexed`` only says the current embedder set has processed an
+    image. Which models actually hold a vector is tracked here, so adding an
+    embedder (or switching to a profile with more of them) only runs the new
+    models over the library instead of re-embedding everything.
+    """
+    __tablename__ = "image_embeddings"
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
+    embedder = Column(String, primary_key=True)
+
+    __table_args__ = (
+        Index('ix_image_embeddings_embedder', 'embedder'),
+    )
+
+
+class PendingVectorWrite(Base):
+    """Outbox row for an image whose vectors are being written.
+
+    Vectors (LanceDB) and ``Image.is_indexed`` (SQLite) live in two stores with
+    no shared transaction. The indexer commits these rows after inference and
+    before touching LanceDB, and removes them in the same commit that marks the
+    images indexed. Rows left behind by a crash name exactly the images whose
+    vectors may already be stored, so recovery can settle them without running
+    the models again.
+    """
+    __tablename__ = "pending_vector_writes"
+    image_id = Column(Integer, ForeignKey("images.id", ondelete="CASCADE"), primary_key=True)
+    directory_id = Column(Integer, index=True)
+
+
+class ScannedDirectory(Base):
+    """What the scanner saw in one directory of an indexed tree last time.
+
+    Lets a rescan skip listing directories whose mtime has not moved; see
+    ``indexing.scanner``. ``subdirs`` is a JSON list of child directory names,
+    NULL when the directory was listed without recursion.
+    """
+    __tablename__ = "scanned_directories"
+    path = Column(String, primary_key=True)
+    directory_id = Column(Integer, ForeignKey("directories.id", ondelete="CASCADE"), index=True)
+    mtime_ns = Column(Integer, nullable=True)
+    subdirs = Column(Text, nullable=True)
+
+
+class StoredQuery(Base):
+    """A search query and what its last search produced.
+
+    ``results`` and ``embedder_results`` are JSON (a list of paths, and paths
+    per embedder). ``engines`` is a JSON list naming the engine of each
+    generated image; the images themselves are files under
+    ``<data_dir>/queries/<id>/`` (see ``core.query``). AUTOINCREMENT keeps ids
+    of deleted queries from being handed out again.
+    """
+    __tablename__ = "queries"
+    id = Column(Integer, primary_key=True)
+    text = Column(Text, nullable=False)
+    created_at = Column(Float, nullable=False)
+    last_used = Column(Float, nullable=False, index=True)
+    results = Column(Text, nullable=True)
+    embedder_results = Column(Text, nullable=True)
+    engines = Column(Text, nullable=True)
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+
+def _add_missing_columns():
+    """Bring tables created by an older build up to the current schema.
+
+    ``create_all`` only creates missing tables and never alters existing ones, so
+    columns added since a user's database was created are added here. New
+    columns must therefore be nullable or carry a ``server_default``.
+    """
+    inspector = inspect(engine)
+    added = []
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(engine.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                conn.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+_INDEXED = "CASE WHEN {row}.is_indexed THEN 1 ELSE 0 END"
+
+# Triggers rather than bookkeeping in Python: images are inserted, deleted,
+# re-flagged and moved between directories by bulk statements all over the
+# indexing code, and a trigger sees every one of them in the same transaction.
+_COUNT_TRIGGERS = {
+    "images_count_insert": f"""
+        AFTER INSERT ON images BEGIN
+            UPDATE directories
+            SET image_count = image_count + 1,
+                indexed_count = indexed_count + {_INDEXED.format(row="NEW")}
+            WHERE id = NEW.directory_id;
+        END""",
+    "images_count_delete": f"""
+        AFTER DELETE ON images BEGIN
+            UPDATE directories
+            SET image_count = image_count - 1,
+                indexed_count = indexed_count - {_INDEXED.format(row="OLD")}
+            WHERE id = OLD.directory_id;
+        END""",
+    "images_count_update": f"""
+        AFTER UPDATE OF is_indexed, directory_id ON images BEGIN
+            UPDATE directories
+            SET image_count = image_count - 1,
+                indexed_count = indexed_count - {_INDEXED.format(row="OLD")}
+            WHERE id = OLD.directory_id;
+            UPDATE directories
+            SET image_count = image_count + 1,
+                indexed_count = indexed_count + {_INDEXED.format(row="NEW")}
+            WHERE id = NEW.directory_id;
+        END""",
+}
+
+
+def _install_count_triggers():
+    """Create the image count triggers, recounting once when any was missing
+    (a database from an older build, whose counters start at zero)."""
+    with engine.begin() as conn:
+        existing = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+        missing = [name for name in _COUNT_TRIGGERS if name not in existing]
+        if not missing:
+            return
+        for name in _COUNT_TRIGGERS:
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+            conn.execute(text(f"CREATE TRIGGER {name} {_COUNT_TRIGGERS[name]}"))
+        conn.execute(text(f"""
+            UPDATE directories SET
+                image_count = (SELECT COUNT(*) FROM images WHERE images.directory_id = directories.id),
+                indexed_count = (SELECT COALESCE(SUM({_INDEXED.format(row="images")}), 0)
+                                 FROM images WHERE images.directory_id = directories.id)
+        """))
+
+
 Base.metadata.create_all(bind=engine)
+_add_missing_columns()
+_install_count_triggers()
@@ -28,6 +28,8 @@ class DirectoryModel(BaseModel):
     is_indexed: bool
     is_enabled: bool
     indexing_ratio: Optional[float] = None
+    image_count: Optional[int] = None
+    indexed_count: Optional[int] = None
 
 
 class DirectoryListResponse(BaseModel):
@@ -36,8 +38,69 @@ class DirectoryListResponse(BaseModel):
 
 class DirectoryDetailResponse(BaseModel):
     directory: DirectoryModel
+    # One page of paths, in id order; see next_cursor.
     images: List[str]
     indexing_ratio: float
+    # Path -> reason, for the images on this page (status=failed only).
+    errors: Optional[Dict[str, str]] = None
+    # Pass as ``cursor`` for the next page; None on the last one.
+    next_cursor: Optional[int] = None
+
+
+class IndexQueueEntry(BaseModel):
+    directory_id: int
+    path: str
+    pending_images: int
+    hot_images: int
+    active: bool
+    in_pass: bool
+    batches_done: int
+    position: Optional[int] = None
+
+
+class IndexQueueResponse(BaseModel):
+    directories: List[IndexQueueEntry]
+
+
+class IndexingStateResponse(BaseModel):
+    paused: bool
+    searches_in_flight: int
+
+
+class IndexingStageStats(BaseModel):
+    images: int
+    seconds: float
+    images_per_sec: Optional[float] = None
+
+
+class DirectoryIndexingStatus(BaseModel):
+    directory_id: int
+    path: str
+    total_images: int
+    indexed_images: int
+    pending_images: int
+    failures: int
+    last_error: Optional[str] = None
+    images_per_sec: float
+    eta_seconds: Optional[float] = None
+
+
+class IndexingQueueDepth(BaseModel):
+    directories: int
+    waiting: int
+    hot_images: int
+    workers_running: int
+
+
+class IndexingStatusResponse(BaseModel):
+    paused: bool
+    searches_in_flight: int
+    images_indexed: int
+    failures: int
+    images_per_sec: float
+    queue: IndexingQueueDepth
+    stages: Dict[str, IndexingStageStats]
+    directories: List[DirectoryIndexingStatus]
 
 
 class RemoveDirectoryRequest(BaseModel):
@@ -70,6 +133,14 @@ class EngineConfig(BaseModel):
     params: Dict[str, Any] = Field(..., description="Required parameters including auth")
 
 
+class ImageOutputOptions(BaseModel):
+    """How generated images are returned."""
+    format: str = Field("png", pattern="^(png|jpeg|webp)$",
+                        description="png (lossless) or jpeg/webp (much smaller and faster to encode)")
+    quality: int = Field(85, ge=1, le=100, description="Quality for jpeg and webp")
+    by_reference: bool = Field(False, description="Return short-lived /images/{token} URLs instead of data URLs")
+
+
 class GenerationConfig(BaseModel):
     # Optional on purpose: when omitted the backend applies the saved generator
     # preferences, so every client resolves a search the same way. Supplying
@@ -91,6 +162,18 @@ class SearchRequest(BaseModel):
     include_base_images_in_preview: bool = Field(settings.query.include_base_images_in_preview,
                                                  description="Whether to include base images in the preview")
     verbose: bool = Field(True, description="Include Verbose results")
+    include_thumbnails: bool = Field(True, description="Include a thumbnail URL for each result")
+    image_output: ImageOutputOptions = Field(default_factory=ImageOutputOptions,
+                                             description="Encoding of base_images")
+    generation_config: GenerationConfig = Field(..., description="Configuration for image generation")
+
+
+class BatchSearchRequest(BaseModel):
+    prompts: List[str] = Field(..., min_length=1, max_length=1000,
+                               description="Prompts to search for; each becomes a query")
+    num_images_to_retrieve: int = Field(settings.query.num_images_to_retrieve,
+                                        description="Number of images to retrieve per prompt")
+    include_thumbnails: bool = Field(True, description="Include a thumbnail URL for each result")
     generation_config: GenerationConfig = Field(..., description="Configuration for image generation")
 
 
@@ -98,9 +181,25 @@ class SearchResponse(BaseModel):
     results: List[str]
     qid: int
     preview_url: str
+    # One URL per entry of ``results``, in the same order.
+    thumbnails: Optional[List[str]] = None
     base_images: Optional[List[str]] = None
     verbose_results : Optional[Dict[str, Any]] = None
     timings: Optional[Dict[str, Any]] = None
+    # True when the results came from the search result cache.
+    cached: bool = False
+
+
+class SearchJobResponse(BaseModel):
+    job_id: str
+    qid: int
+    # queued | running | done | failed | cancelled
+    state: str
+    events_url: str
+    events: int = 0
+    # The SearchResponse body once done.
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
 
 
 class GeneratorRequirement(BaseModel):
@@ -156,10 +255,11 @@ class GenerateImagesRequest(BaseModel):
     height: Optional[int] = Field(None, ge=128, le=1536)
     steps: Optional[int] = Field(None, ge=1, le=50, description="Denoising steps")
     seed: Optional[int] = Field(None, description="Seed for reproducible output; omit for random")
+    image_output: ImageOutputOptions = Field(default_factory=ImageOutputOptions)
 
 
 class SaveImageRequest(BaseModel):
-    image: str = Field(..., description="PNG image as a base64 string or data URL")
+    image: str = Field(..., description="Image as a data URL, base64 PNG, or an /images/{token} URL")
     directory: str = Field(..., description="Destination folder chosen by the user")
     filename: Optional[str] = Field(None, description="Preferred file name (without extension)")
 
@@ -186,6 +286,7 @@ class GeneratePoolRequest(BaseModel):
     query: str = Field(..., description="Query string")
     pool_size: int = Field(20, description="Number of guide images to generate (M_pool)")
     generation_config: GenerationConfig = Field(..., description="Configuration for image generation")
+    image_output: ImageOutputOptions = Field(default_factory=ImageOutputOptions)
 
 
 class EmbeddingData(BaseModel):
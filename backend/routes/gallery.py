@@ -4,6 +4,9 @@ from fastapi.templating import Jinja2Templates
 
 from core import query_manager
 from core.query import Query
+from core.thumbnails import thumbnail_query
+from indexing.repositories.repositories import ImageRepository
+from models.models import SessionLocal
 
 router = APIRouter()
 
@@ -15,7 +18,7 @@ templates = Jinja2Templates(directory="templates")
 
 
 @router.get("/gallery/{qid}", response_class=HTMLResponse)
-async def gallery(request: Request, qid: int, page: int = 1):
+def gallery(request: Request, qid: int, page: int = 1):
     # Validate query and retrieve results
     query_object: Query = query_manager.get_query(qid)
     if query_object is None:
@@ -32,6 +35,11 @@ async def gallery(request: Request, qid: int, page: int = 1):
     end = start + page_size
     paginated_results = results[start:end]
 
+    # Tiles load thumbnails; the link still opens the original.
+    with SessionLocal() as session:
+        hashes = ImageRepository(session).get_content_hashes(paginated_results)
+    thumbnails = [thumbnail_query(p, hashes.get(p)) for p in paginated_results]
+
     # Determine pagination controls
     has_next = len(results) > end
     has_prev = page > 1
@@ -40,7 +48,7 @@ async def gallery(request: Request, qid: int, page: int = 1):
     return templates.TemplateResponse("gallery.html", {
         "request": request,
         "query": query_object.query,
-        "results": paginated_results,
+        "results": list(zip(paginated_results, thumbnails)),
         "page": page,
         "has_next": has_next,
         "has_prev": has_prev,
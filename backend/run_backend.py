@@ -5,6 +5,7 @@ PyInstaller, switches the working directory to the bundle root so the relative
 ``static``/``templates`` paths used by the app continue to resolve.
 """
 
+import multiprocessing
 import os
 import sys
 
@@ -21,7 +22,8 @@ os.environ.setdefault("PYTORCH_ENABLE_MPS_FALLBACK", "1")
 
 # Let CPU inference use all cores. Frozen apps / some BLAS backends otherwise
 # default to a single thread, making embedding (search + indexing) very slow.
-# Must be set before torch/numpy import to take effect.
+# Must be set before torch/numpy import to take effect. This sizes the pool;
+# core.threads divides it between indexing, queries and generation.
 _cores = os.cpu_count() or 4
 os.environ.setdefault("OMP_NUM_THREADS", str(_cores))
 os.environ.setdefault("MKL_NUM_THREADS", str(_cores))
@@ -38,6 +40,9 @@ def _prepare_frozen_cwd() -> None:
 
 
 def main() -> None:
+    # Indexing worker processes (DIRECTORY__INDEXING_PROCESSES) are spawned by
+    # re-running this executable; in a frozen build that has to be intercepted.
+    multiprocessing.freeze_support()
     _prepare_frozen_cwd()
 
     # Ensure torch uses all CPU cores for inference (see env setup above).
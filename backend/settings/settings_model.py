@@ -79,6 +79,17 @@ class QuerySettings(BaseModel):
     num_engines_to_use: int = Field(1)
     use_fallback: bool = Field(True)
     include_base_images_in_preview: bool = Field(False)
+    # Fused search results kept for repeated searches (see core/result_cache.py),
+    # at most result_cache_size of them holding result_cache_mb of guide
+    # images; 0 for either turns the cache off.
+    result_cache_size: int = Field(128)
+    result_cache_mb: int = Field(256)
+    # Queries are stored in SQLite; this many stay loaded, generated images
+    # included. Queries unused for retention_days, and the least recently
+    # used beyond max_stored_queries, are deleted.
+    hot_queries: int = Field(32)
+    retention_days: int = Field(30)
+    max_stored_queries: int = Field(5000)
 
 
 class DirectorySettings(BaseModel):
@@ -87,7 +98,51 @@ class DirectorySettings(BaseModel):
     # through each of them in one forward pass. Big batches exhaust RAM/VRAM.
     batch_size: int = Field(8)
     recursive_indexing: bool = Field(False)
+    # Threads listing directories in parallel during scans; mostly waiting on
+    # I/O, so more than the core count helps on network mounts.
+    scan_workers: int = Field(8)
+    # Worker processes for data-parallel indexing, each with its own copy of
+    # the models. 0 keeps indexing on threads inside the API process.
+    indexing_processes: int = Field(0)
+    # Base URLs of Needle Embedder services (embedder-service/) that run the
+    # models for indexing batches. Takes precedence over indexing_processes.
+    embedding_workers: List[str] = Field(default_factory=list)
+    # Edge lengths of the thumbnails written while indexing (see
+    # core/thumbnails.py), larger ones made only when first requested, and
+    # their JPEG quality.
+    thumbnail_sizes: List[int] = Field(default_factory=lambda: [256])
+    thumbnail_on_demand_sizes: List[int] = Field(default_factory=lambda: [1024])
+    thumbnail_quality: int = Field(85)
     consistency_check_interval: int = Field(1800)
+    # Budget for consistency passes, which are spread over the interval:
+    # file stats per second (0 = unlimited), share of wall-clock time spent
+    # busy, and tracked images stat'ed per unit of work.
+    consistency_stat_rate: int = Field(500)
+    consistency_cpu_fraction: float = Field(0.25)
+    consistency_slice_rows: int = Field(5000)
+    # A directory whose watcher has run cleanly since its last full check is
+    # skipped until that check is this many seconds old.
+    consistency_trust_watcher: int = Field(86400)
+    # Hold indexing between batches while searches run (for at most
+    # max_search_yield seconds at a time), then use small batches for
+    # search_cooldown seconds after the last one.
+    yield_to_search: bool = Field(True)
+    max_search_yield: float = Field(30.0)
+    search_cooldown: float = Field(5.0)
+
+
+class ComputeSettings(BaseModel):
+    # CPU threads shared by the torch workloads below; 0 means every core.
+    threads: int = Field(0)
+    # Relative shares of those threads while the workloads run concurrently.
+    # A workload with nothing to do lends its share to the others.
+    indexing_share: float = Field(0.5)
+    query_share: float = Field(0.3)
+    generation_share: float = Field(0.2)
+    # Embedder forward passes are merged into micro-batches of up to
+    # inference_max_batch images, waiting at most inference_window_ms for more.
+    inference_max_batch: int = Field(32)
+    inference_window_ms: float = Field(2.0)
 
 
 class ServiceSettings(BaseModel):
@@ -101,6 +156,17 @@ class ImageGeneratorSettings(BaseModel):
     # Generation is delegated to the Needle Generator companion or an API
     # provider (no bundled model). "remote" is still accepted as an alias.
     default_engine: str = Field("needle-local")
+    # Images the on-device engine renders per pipeline call during a search;
+    # 0 renders them all in one call. Search embeds each chunk while the next
+    # one renders, so small chunks show results sooner, but on a GPU they
+    # make generation as a whole slower.
+    local_chunk_size: int = Field(0)
+    # Images per pipeline call in batch searches, which pass several prompts
+    # to one call.
+    local_batch_images: int = Field(8)
+    # On-disk cache of images generated for searches and their query
+    # embeddings (core/generation/cache.py); 0 turns it off.
+    cache_size_mb: int = Field(1024)
 
     @property
     def url(self) -> str:
@@ -115,6 +181,7 @@ class Settings(BaseSettings):
     service: ServiceSettings = ServiceSettings()
     generator: ImageGeneratorSettings = ImageGeneratorSettings()
     directory: DirectorySettings = DirectorySettings()
+    compute: ComputeSettings = ComputeSettings()
     query: QuerySettings = QuerySettings()
 
     # JSON config
@@ -0,0 +1,200 @@
+"""Needle Embedder Service — an out-of-process embedding worker for Needle.
+
+Part of the Needle suite. Run this wherever you have spare compute (a GPU box,
+another machine, or the same machine as Needle) and point Needle's indexing at
+it with ``DIRECTORY__EMBEDDING_WORKERS``. Needle keeps decoding and
+preprocessing images itself and sends ready-made input tensors here; this
+service only runs the models.
+
+Payloads are binary tensors in NumPy ``.npy`` format (``application/x-npy``):
+a float32 ``[N, 3, H, W]`` batch goes in, a float32 ``[N, D]`` matrix comes out.
+Requests for the same model that arrive within a few milliseconds of each other
+are merged into one forward pass, so several Needle indexing threads (or several
+Needle instances) sharing one worker still get large batches.
+
+API:
+    GET  /health          -> {status, service, device, models}
+    GET  /capabilities    -> {service, version, device, max_batch, batch_window_ms, models: [...]}
+    POST /embed?model=... -> application/x-npy float32 [N, D]
+        body: application/x-npy float32 [N, 3, H, W], already preprocessed
+              with the model's timm eval transform
+
+Environment:
+    EMBED_MODELS          Comma-separated timm model names to load at startup
+                          (default: none; models load on first request).
+    EMBED_MAX_BATCH       Largest merged batch per forward pass (default: 32).
+    EMBED_BATCH_WINDOW_MS How long to wait for more requests to merge (default: 5).
+    EMBED_HOST            Bind host (default: 0.0.0.0)
+    EMBED_PORT            Bind port (default: 8002)
+"""
+
+import asyncio
+import io
+import os
+import platform
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from timm import create_model
+
+VERSION = "1.0.0"
+NPY_MEDIA_TYPE = "application/x-npy"
+
+MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", "32"))
+BATCH_WINDOW_SECONDS = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5")) / 1000.0
+
+app = FastAPI(title="Needle Embedder Service", version=VERSION)
+
+
+def _device() -> torch.device:
+    if torch.cuda.is_available():
+        return torch.device("cuda")
+    if torch.backends.mps.is_available() and platform.system() == "Darwin":
+        return torch.device("mps")
+    return torch.device("cpu")
+
+
+class ModelWorker:
+    """One model plus the loop that batches requests for it.
+
+    Requests are queued as (tensor, future) pairs. The loop takes the first
+    one, keeps collecting for ``BATCH_WINDOW_SECONDS`` (or until ``MAX_BATCH``
+    rows are waiting), runs a single forward pass and splits the output back
+    across the callers.
+    """
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.device = _device()
+        print(f"[embedder] loading {model_name} on {self.device} - first run downloads weights")
+        self.model = create_model(model_name, pretrained=True, num_classes=0).to(self.device).eval()
+        self.embedding_dim = None
+        self._queue: "queue.Queue[Tuple[torch.Tensor, Future]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, batch: torch.Tensor) -> Future:
+        future: Future = Future()
+        self._queue.put((batch, future))
+        return future
+
+    def _collect(self) -> List[Tuple[torch.Tensor, Future]]:
+        pending = [self._queue.get()]
+        rows = pending[0][0].shape[0]
+        deadline = time.monotonic() + BATCH_WINDOW_SECONDS
+        while rows < MAX_BATCH:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            pending.append(item)
+            rows += item[0].shape[0]
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            # Only tensors of the same input shape can share a forward pass.
+            by_shape: Dict[Tuple[int, ...], List[Tuple[torch.Tensor, Future]]] = {}
+            for batch, future in pending:
+                by_shape.setdefault(tuple(batch.shape[1:]), []).append((batch, future))
+            for group in by_shape.values():
+                try:
+                    merged = torch.cat([b for b, _ in group], dim=0).to(self.device)
+                    with torch.inference_mode():
+                        output = self.model(merged).float().cpu().numpy()
+                    self.embedding_dim = output.shape[1]
+                    start = 0
+                    for batch, future in group:
+                        future.set_result(output[start:start + batch.shape[0]])
+                        start += batch.shape[0]
+                except Exception as exc:
+                    for _, future in group:
+                        if not future.done():
+                            future.set_exception(exc)
+
+
+_workers: Dict[str, ModelWorker] = {}
+_workers_lock = threading.Lock()
+
+
+def _worker(model_name: str) -> ModelWorker:
+    worker = _workers.get(model_name)
+    if worker is not None:
+        return worker
+    with _workers_lock:
+        if model_name not in _workers:
+            _workers[model_name] = ModelWorker(model_name)
+        return _workers[model_name]
+
+
+@app.get("/health")
+def health():
+    return {
+        "status": "running",
+        "service": "Needle Embedder",
+        "device": str(_device()),
+        "models": list(_workers),
+    }
+
+
+@app.get("/capabilities")
+def capabilities():
+    return {
+        "service": "Needle Embedder",
+        "version": VERSION,
+        "device": str(_device()),
+        "max_batch": MAX_BATCH,
+        "batch_window_ms": int(BATCH_WINDOW_SECONDS * 1000),
+        "models": [
+            {"model_name": name, "embedding_dim": w.embedding_dim}
+            for name, w in _workers.items()
+        ],
+    }
+
+
+@app.post("/embed")
+async def embed(model: str, request: Request):
+    body = await request.body()
+    try:
+        array = np.load(io.BytesIO(body), allow_pickle=False)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"Body is not a .npy tensor: {exc}")
+    if array.ndim != 4:
+        raise HTTPException(status_code=400, detail=f"Expected [N, C, H, W], got shape {list(array.shape)}")
+
+    try:
+        # Loading (and on first use downloading) a model blocks for a while.
+        worker = await run_in_threadpool(_worker, model)
+    except Exception as exc:
+        raise HTTPException(status_code=400, detail=f"Could not load model '{model}': {exc}")
+
+    future = worker.submit(torch.from_numpy(np.ascontiguousarray(array, dtype=np.float32)))
+    try:
+        output = await asyncio.wrap_future(future)
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Embedding failed: {exc}")
+
+    buf = io.BytesIO()
+    np.save(buf, output.astype(np.float32, copy=False), allow_pickle=False)
+    return Response(content=buf.getvalue(), media_type=NPY_MEDIA_TYPE)
+
+
+if __name__ == "__main__":
+    host = os.environ.get("EMBED_HOST", "0.0.0.0")
+    port = int(os.environ.get("EMBED_PORT", "8002"))
+    for name in [m.strip() for m in os.environ.get("EMBED_MODELS", "").split(",") if m.strip()]:
+        _worker(name)
+    print(f"[embedder] Needle Embedder v{VERSION} on {_device()} - models: {', '.join(_workers) or 'on demand'}")
+    uvicorn.run(app, host=host, port=port)
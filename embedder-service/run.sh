@@ -0,0 +1,23 @@
+#!/usr/bin/env bash
+#
+# Start the Needle Embedder Service. Creates a local venv on first run.
+#
+#   ./run.sh                                   # CPU or auto-detected GPU
+#   EMBED_PORT=9002 ./run.sh                   # custom port
+#   EMBED_MODELS=vit_large_patch14_reg4_dinov2.lvd142m ./run.sh   # preload a model
+#
+# For NVIDIA GPUs, install a CUDA build of torch inside the venv (see README).
+
+set -euo pipefail
+HERE="$(cd "$(dirname "$0")" && pwd)"
+cd "$HERE"
+
+if [ ! -d venv ]; then
+  python3 -m venv venv
+fi
+# shellcheck disable=SC1091
+source venv/bin/activate
+python -m pip install --upgrade pip >/dev/null
+python -m pip install -r requirements.txt
+
+exec python main.py
@@ -1,6 +1,7 @@
 # api_client.py
+import json
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import requests
 
@@ -62,16 +63,53 @@ class BackendClient:
         """
         return self._get("/directory")
 
-    def describe_directory(self, did: int) -> Any:
+    def describe_directory(self, did: int, limit: int = 500, cursor: int = 0,
+                           status: Optional[str] = None) -> Any:
         """
         GET /directory/{did}
-        Returns DirectoryDetailResponse with directory info, image paths, indexing ratio, etc.
+        Returns DirectoryDetailResponse with directory info, indexing ratio and one
+        page of image paths; pass its next_cursor back as ``cursor`` for the next.
         """
-        return self._get(f"/directory/{did}")
+        params = {"limit": limit, "cursor": cursor}
+        if status:
+            params["status"] = status
+        return self._get(f"/directory/{did}", params=params)
+
+    def iter_directory_images(self, did: int, status: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        GET /directory/{did}/images
+        Yields every image of the directory as it streams in (NDJSON).
+        """
+        params = {"status": status} if status else None
+        with requests.get(f"{self.base_url}/directory/{did}/images", params=params, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
 
     def update_directory(self, did: int, is_enabled: bool):
         return self._put(f"/directory/{did}", data={"is_enabled": is_enabled})
 
+    def get_index_queue(self) -> Any:
+        """
+        GET /indexing/queue
+        Returns per-directory indexing backlog (IndexQueueResponse).
+        """
+        return self._get("/indexing/queue")
+
+    def get_indexing_status(self) -> Any:
+        """
+        GET /indexing/status
+        Live indexing counters: throughput per stage, queue depth, per-directory ETA.
+        """
+        return self._get("/indexing/status")
+
+    def pause_indexing(self) -> Any:
+        return self._post("/indexing/pause")
+
+    def resume_indexing(self) -> Any:
+        return self._post("/indexing/resume")
+
     # -------------------------------------------------------------------------
     # Generators
     # -------------------------------------------------------------------------
@@ -140,12 +178,87 @@ class BackendClient:
             num_images_per_engine: Optional[int] = None,
             image_size: Optional[str] = None,
     ) -> Any:
-        """Create a query, then run the search for it.
+        """Create a query, then run the search for it and wait for the result.
 
         Engines are deliberately not sent: the backend applies the shared
         generator preferences, so the CLI and the desktop app resolve a search
         exactly the same way.
         """
+        return self._post("/search", data=self._search_body(
+            prompt, num_images_to_retrieve, include_base_images, num_images_per_engine, image_size))
+
+    def start_search_job(
+            self,
+            prompt: str,
+            num_images_to_retrieve: Optional[int] = None,
+            include_base_images: Optional[bool] = None,
+            num_images_per_engine: Optional[int] = None,
+            image_size: Optional[str] = None,
+    ) -> Any:
+        """
+        POST /search/jobs
+        Like ``run_search`` but returns at once with a job id; follow it with
+        ``iter_search_events``.
+        """
+        return self._post("/search/jobs", data=self._search_body(
+            prompt, num_images_to_retrieve, include_base_images, num_images_per_engine, image_size))
+
+    def iter_search_events(self, job_id: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        GET /search/jobs/{job_id}/events
+        Yields ``(event, data)`` from the server-sent event stream until the job ends.
+        """
+        url = f"{self.base_url}/search/jobs/{job_id}/events"
+        with requests.get(url, stream=True, headers={"Accept": "text/event-stream"}) as response:
+            response.raise_for_status()
+            event, data = None, []
+            for line in response.iter_lines(decode_unicode=True):
+                if line is None:
+                    continue
+                if not line:
+                    # A blank line ends an event.
+                    if event is not None:
+                        yield event, json.loads("\n".join(data) or "{}")
+                    event, data = None, []
+                elif line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:"):
+                    data.append(line[len("data:"):].strip())
+
+    def cancel_search_job(self, job_id: str) -> Any:
+        """
+        POST /search/jobs/{job_id}/cancel
+        """
+        return self._post(f"/search/jobs/{job_id}/cancel")
+
+    def iter_batch_search(
+            self,
+            prompts: List[str],
+            num_images_to_retrieve: Optional[int] = None,
+            num_images_per_prompt: Optional[int] = None,
+            image_size: Optional[str] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        POST /search/batch
+        Searches for every prompt in one request; yields one result per prompt
+        as it finishes (NDJSON), in completion order.
+        """
+        generation_config = {}
+        if num_images_per_prompt is not None:
+            generation_config["num_images"] = num_images_per_prompt
+        if image_size is not None:
+            generation_config["image_size"] = image_size
+        body = {"prompts": prompts, "generation_config": generation_config}
+        if num_images_to_retrieve is not None:
+            body["num_images_to_retrieve"] = num_images_to_retrieve
+        with requests.post(f"{self.base_url}/search/batch", json=body, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def _search_body(self, prompt, num_images_to_retrieve, include_base_images,
+                     num_images_per_engine, image_size) -> Dict[str, Any]:
         qres = self._post("/query", data={"q": prompt})
         qid = qres["qid"]
 
@@ -170,7 +283,7 @@ class BackendClient:
             if value is not None:
                 search_request_body[optional] = value
 
-        return self._post("/search", data=search_request_body)
+        return search_request_body
 
     def get_search_logs(self) -> Any:
         """
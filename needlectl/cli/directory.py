@@ -1,4 +1,5 @@
 # cli/directory.py
+import json
 import os
 import time
 
@@ -51,7 +52,7 @@ def add_directory(
     start_time = time.time()
 
     while True:
-        d_resp = client.describe_directory(did)
+        d_resp = client.describe_directory(did, limit=0)
         ratio = d_resp["indexing_ratio"]
 
         pbar.n = int(ratio * 100)
@@ -103,7 +104,86 @@ def directory_disable(ctx: typer.Context, did: int):
 
 
 @directory_app.command("describe")
-def directory_detail(ctx: typer.Context, did: int):
+def directory_detail(
+        ctx: typer.Context,
+        did: int,
+        limit: int = typer.Option(50, help="Images per page (0 for the summary only)"),
+        cursor: int = typer.Option(0, help="Continue from the cursor printed with the previous page"),
+        status: str = typer.Option(None, help="Only indexed, unindexed or failed images"),
+        all_images: bool = typer.Option(False, "--all", help="Stream every image instead of one page"),
+):
     client = BackendClient(ctx.obj["api_url"])
-    result = client.describe_directory(did)
+    if all_images:
+        # One line per image as it arrives, so this works for any folder size
+        # and pipes into other tools.
+        for image in client.iter_directory_images(did, status):
+            if ctx.obj["output"] == "human":
+                typer.echo(image["path"] + (f"  ({image['error']})" if image["error"] else ""))
+            else:
+                typer.echo(json.dumps(image))
+        return
+    result = client.describe_directory(did, limit=limit, cursor=cursor, status=status)
     print_result(result, ctx.obj["output"])
+    if ctx.obj["output"] == "human" and result.get("next_cursor") is not None:
+        typer.echo(f"More images: --cursor {result['next_cursor']}")
+
+
+@directory_app.command("queue")
+def directory_queue(ctx: typer.Context):
+    """Show which folders are waiting to be indexed and how much is left."""
+    client = BackendClient(ctx.obj["api_url"])
+    result = client.get_index_queue()
+    print_result(result, ctx.obj["output"])
+
+
+@directory_app.command("pause")
+def directory_pause(ctx: typer.Context):
+    """Hold indexing (e.g. during peak hours) until resumed."""
+    client = BackendClient(ctx.obj["api_url"])
+    result = client.pause_indexing()
+    if ctx.obj["output"] == "human":
+        typer.echo("Indexing paused.")
+    else:
+        print_result(result, ctx.obj["output"])
+
+
+@directory_app.command("resume")
+def directory_resume(ctx: typer.Context):
+    """Resume indexing after a pause."""
+    client = BackendClient(ctx.obj["api_url"])
+    result = client.resume_indexing()
+    if ctx.obj["output"] == "human":
+        typer.echo("Indexing resumed.")
+    else:
+        print_result(result, ctx.obj["output"])
+
+
+@directory_app.command("status")
+def directory_status(ctx: typer.Context):
+    """Show live indexing throughput, queue depth and ETA per folder."""
+    client = BackendClient(ctx.obj["api_url"])
+    result = client.get_indexing_status()
+    if ctx.obj["output"] != "human":
+        print_result(result, ctx.obj["output"])
+        return
+
+    state = "paused" if result["paused"] else "running"
+    queue = result["queue"]
+    typer.echo(
+        f"Indexing {state}: {result['images_per_sec']:.1f} images/s, "
+        f"{result['images_indexed']} indexed, {result['failures']} failed since start"
+    )
+    typer.echo(
+        f"Queue: {queue['directories']} folder(s), {queue['hot_images']} new image(s) waiting, "
+        f"{queue['workers_running']} worker(s) running"
+    )
+    for name, stage in sorted(result["stages"].items()):
+        rate = stage["images_per_sec"]
+        typer.echo(f"  {name:<24} {stage['images']:>8} images  {rate if rate is not None else '-':>8} images/s")
+    for d in result["directories"]:
+        eta = d["eta_seconds"]
+        eta_text = "-" if eta is None else f"{eta:.0f}s"
+        typer.echo(
+            f"[{d['directory_id']}] {d['path']}: {d['indexed_images']}/{d['total_images']} indexed, "
+            f"{d['failures']} failed, {d['images_per_sec']:.1f} images/s, ETA {eta_text}"
+        )
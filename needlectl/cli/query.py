@@ -1,3 +1,4 @@
+import json
 from typing import Optional
 
 import typer
@@ -36,14 +37,77 @@ def search_run(
         )
         raise typer.Exit(code=1)
 
-    result = client.run_search(
+    job = client.start_search_job(
         prompt=prompt,
         num_images_to_retrieve=n,
         num_images_per_engine=num_images_to_generate,
         image_size=image_size,
         include_base_images=include_base_images,
     )
-    print_result(result, ctx.obj["output"])
+    human = ctx.obj["output"] == "human"
+    try:
+        for event, data in client.iter_search_events(job["job_id"]):
+            if event == "done":
+                print_result(data, ctx.obj["output"])
+            elif event in ("failed", "cancelled"):
+                typer.echo(f"Search {event}: {data.get('detail', '')}".rstrip(": "), err=True)
+                raise typer.Exit(code=1)
+            elif human:
+                # Progress goes to stderr so stdout stays just the result.
+                typer.echo(_describe_event(event, data), err=True)
+    except KeyboardInterrupt:
+        client.cancel_search_job(job["job_id"])
+        typer.echo("Search cancelled.", err=True)
+        raise typer.Exit(code=130)
+
+
+def _describe_event(event: str, data: dict) -> str:
+    if event == "started":
+        return "Searching..."
+    if event == "generation_started":
+        return "Generating query images..."
+    if event == "image_ready":
+        return f"Query image {data['index'] + 1} ready ({data['engine']})"
+    if event == "results_updated":
+        return f"Query image {data['index'] + 1} matched: {len(data['results'])} results so far"
+    if event == "embedder_done":
+        return f"{data['embedder']}: {len(data['results'])} matches"
+    return event
+
+
+@query_app.command("batch")
+def search_batch(
+        ctx: typer.Context,
+        prompts_file: typer.FileText = typer.Argument(..., help="File with one prompt per line ('-' for stdin)."),
+        n: Optional[int] = typer.Option(None, "--n", help="How many results to return per prompt."),
+        num_images_to_generate: Optional[int] = typer.Option(
+            None, help="How many query images to generate per prompt."),
+        image_size: Optional[str] = typer.Option(None, help="SMALL | MEDIUM | LARGE."),
+):
+    """Search for many prompts in one request.
+
+    Prompts are generated and matched together, which is much faster than
+    one 'query run' each. Results print as each prompt finishes: one line per
+    prompt, or one JSON object per line with --output json.
+    """
+    prompts = [line.strip() for line in prompts_file if line.strip()]
+    if not prompts:
+        typer.echo("No prompts given.", err=True)
+        raise typer.Exit(code=1)
+    client = BackendClient(ctx.obj["api_url"])
+    failed = False
+    for result in client.iter_batch_search(prompts, num_images_to_retrieve=n,
+                                           num_images_per_prompt=num_images_to_generate, image_size=image_size):
+        failed = failed or "error" in result
+        if ctx.obj["output"] != "human":
+            typer.echo(json.dumps(result))
+        elif "error" in result:
+            typer.echo(f"{result['prompt']}: failed ({result['error']})", err=True)
+        else:
+            top = result["results"][0] if result["results"] else "no matches"
+            typer.echo(f"{result['prompt']} (qid {result['qid']}): {len(result['results'])} results, top {top}")
+    if failed:
+        raise typer.Exit(code=1)
 
 
 @query_app.command("log")
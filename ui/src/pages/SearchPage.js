@@ -6,7 +6,7 @@ import {
   FolderOpen, Wand2,
 } from 'lucide-react';
 import {
-  createQuery, search, getSearchLogs, getFile,
+  createQuery, startSearch, cancelSearch, searchEvents, getSearchLogs, getFile,
   getDirectories, getGeneratorPreferences,
 } from '../services/api';
 import logoImage from '../assets/images/logo.png';
@@ -28,7 +28,9 @@ const SearchPage = () => {
   const [startTime, setStartTime] = useState(null);
   const [elapsed, setElapsed] = useState(0);
   const [ready, setReady] = useState({ library: true, generator: true, checked: false });
+  const [stage, setStage] = useState(null);
   const urlsRef = useRef({});
+  const jobRef = useRef(null);
 
   const [config, setConfig] = useState({
     num_images_to_retrieve: 24,
@@ -129,8 +131,12 @@ const SearchPage = () => {
     try {
       const st = Date.now();
       setStartTime(st);
+      if (jobRef.current) cancelSearch(jobRef.current).catch(() => {});
+      setStage('Starting…');
       const { data: q1 } = await createQuery(term);
-      const { data } = await search(q1.qid, config);
+      const { data: job } = await startSearch(q1.qid, config);
+      jobRef.current = job.job_id;
+      const data = await followSearch(job.job_id);
       setResults({
         results: data.results || [],
         baseImages: data.base_images || [],
@@ -141,10 +147,29 @@ const SearchPage = () => {
     } catch (err) {
       setError(err.response?.data?.detail || err.message || 'Search failed');
     } finally {
+      jobRef.current = null;
+      setStage(null);
       setIsSearching(false);
     }
   };
 
+  // Resolves with the final search response; progress goes to `stage`.
+  const followSearch = (jobId) => new Promise((resolve, reject) => {
+    const source = searchEvents(jobId, (event, payload) => {
+      if (event === 'generation_started') setStage('Generating query images…');
+      else if (event === 'image_ready') setStage(`Query image ${payload.index + 1} ready`);
+      else if (event === 'results_updated') setStage(`Query image ${payload.index + 1} matched`);
+      else if (event === 'embedder_done') setStage(`Matched with ${payload.embedder}`);
+      else if (event === 'done') { source.close(); resolve(payload); }
+      else if (event === 'failed') { source.close(); reject(new Error(payload.detail)); }
+      else if (event === 'cancelled') { source.close(); reject(new Error('Search cancelled')); }
+    });
+    source.onerror = () => {
+      // EventSource retries on its own; only give up once it has.
+      if (source.readyState === EventSource.CLOSED) reject(new Error('Lost connection to the search'));
+    };
+  });
+
   const onSubmit = (e) => { e.preventDefault(); runSearch(); };
   const fileName = (p) => (typeof p === 'string' ? p : p?.id || '').split('/').pop();
   const totalMs = results?.timings?.frontend_total_time
@@ -322,6 +347,11 @@ const SearchPage = () => {
         )}
 
         {/* Loading skeleton */}
+        {isSearching && stage && (
+          <p className="text-sm text-ink-500 mb-3 flex items-center gap-2">
+            <Loader2 className="h-3.5 w-3.5 animate-spin" /> {stage}
+          </p>
+        )}
         {isSearching && (
           <div className="grid grid-cols-2 sm:grid-cols-3 lg:grid-cols-4 gap-3">
             {Array.from({ length: 8 }).map((_, i) => (
@@ -73,21 +73,35 @@ export const createQuery = (query) => api.post('/query', { q: query });
 export const getSearchLogs = () => api.get('/search/logs');
 
 // Search
-export const search = (queryId, config) => {
-  // Engines are omitted on purpose: the backend applies the saved generator
-  // preferences (order, enabled, fallback), which needlectl shares. Sending
-  // them from here would make the two interfaces able to disagree again.
-  const searchRequest = {
-    qid: queryId,
-    num_images_to_retrieve: config.num_images_to_retrieve || 10,
-    include_base_images_in_preview: config.include_base_images_in_preview || false,
-    verbose: config.verbose || false,
-    generation_config: {
-      num_images: config.num_images_to_generate || 1,
-      image_size: config.generated_image_size || "SMALL",
-    },
-  };
-  return api.post('/search', searchRequest);
+// Engines are omitted on purpose: the backend applies the saved generator
+// preferences (order, enabled, fallback), which needlectl shares. Sending
+// them from here would make the two interfaces able to disagree again.
+const searchRequest = (queryId, config) => ({
+  qid: queryId,
+  num_images_to_retrieve: config.num_images_to_retrieve || 10,
+  include_base_images_in_preview: config.include_base_images_in_preview || false,
+  verbose: config.verbose || false,
+  generation_config: {
+    num_images: config.num_images_to_generate || 1,
+    image_size: config.generated_image_size || "SMALL",
+  },
+});
+
+export const search = (queryId, config) => api.post('/search', searchRequest(queryId, config));
+
+// Background search: returns a job whose progress arrives as server-sent events.
+export const startSearch = (queryId, config) => api.post('/search/jobs', searchRequest(queryId, config));
+export const cancelSearch = (jobId) => api.post(`/search/jobs/${jobId}/cancel`);
+
+const SEARCH_EVENTS = ['started', 'generation_started', 'image_ready', 'results_updated', 'embedder_done', 'done', 'failed', 'cancelled'];
+
+// Calls onEvent(name, data) for each event; close the returned EventSource
+// once a done, failed or cancelled event arrives.
+export const searchEvents = (jobId, onEvent) => {
+  const source = new EventSource(`${API_BASE_URL}/search/jobs/${jobId}/events`);
+  SEARCH_EVENTS.forEach((name) =>
+    source.addEventListener(name, (e) => onEvent(name, JSON.parse(e.data))));
+  return source;
 };
 
 // Generators